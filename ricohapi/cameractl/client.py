@@ -8,10 +8,18 @@ Camera remote control SDK
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 import re
+import threading
 from logging import getLogger, NullHandler, StreamHandler, DEBUG #pylint: disable=unused-import
+try:
+    import queue
+except ImportError:
+    import Queue as queue #python2
 
-import msgpack  #pylint: disable=import-error
+from ricohapi.cameractl.clock import (Scheduler, estimate_clock)
+from ricohapi.cameractl.codec import (MsgpackCodec, decode_payload)
 from ricohapi.cameractl.mqtt_client import (Topic, MQTTClient, MQTTClientError)
+from ricohapi.cameractl.profiling import PROFILE_MODES
+from ricohapi.cameractl.trace import activate
 
 LOG = getLogger(__name__)
 LOG.addHandler(StreamHandler())
@@ -23,6 +31,8 @@ class CamTopic(Topic):
     def __init__(self):
         super(CamTopic, self).__init__()
         self.cam_fmt = str('camera/{dev_id}')
+        self.pong_fmt = str('pong/{dev_id}')
+        self.status_fmt = str('status/{dev_id}')
 
     def remocon(self, dev_id):
         """Get camera control topic."""
@@ -34,6 +44,21 @@ class CamTopic(Topic):
 
         return topic
 
+    def pong(self, dev_id):
+        """Get the topic on which the device answers clock pings."""
+
+        if dev_id is None:
+            raise ValueError('dev_id is necessary.')
+        return str(self.pong_fmt.format(dev_id=dev_id))
+
+    def status(self, dev_id):
+        """Get the topic on which the status of the device is reported.
+           ``'+'`` gets the topic filter of all the devices."""
+
+        if dev_id is None:
+            raise ValueError('dev_id is necessary.')
+        return str(self.status_fmt.format(dev_id=dev_id))
+
     @staticmethod
     def validate_device_id(device_id=None):
         """validate "device id" with camera control topic format.
@@ -56,15 +81,16 @@ class CamTopic(Topic):
             raise Exception
 
     @staticmethod
-    def search_dev_id(topic):
+    def search_dev_id(topic, kind='camera'):
         """
         Get devid from topic.
 
         :param: str topic: topic
+        :param: str kind: (optional) level before the device id, such as ``'status'``.
         :rtype: str(unicode in Python2)
         :returns: device id
         """
-        pattern = r'(.+)/camera/'
+        pattern = r'(.+)/{0}/'.format(kind)
         match = re.search(pattern, CamTopic.unescape_topic(topic))
 
         if match is None:
@@ -84,88 +110,230 @@ class CamTopic(Topic):
 
 class Client(MQTTClient): #pylint: disable=too-many-instance-attributes
     """Ricoh camera remote control client.
+       An instance can be shared by threads, e.g. the request threads of a web service.
 
     :param str client_id: your client id
     :param str client_secret: your client secret
+    :param codec: (optional) :class:`ricohapi.cameractl.codec.Codec` to encode
+                  sending messages. received messages are decoded by their version byte.
+    :param tracer: (optional) :class:`ricohapi.cameractl.trace.Tracer` to record
+                   the spans of the traced shots sent and received.
+    :param profiler: (optional) :class:`ricohapi.cameractl.profiling.Profiler` to time
+                     the callbacks, and to capture a profile on a ``profile`` message.
+    :param recorder: (optional) :class:`ricohapi.cameractl.recording.Recorder` to record
+                     the received messages in, to replay them later.
     """
-    def __init__(self, client_id, client_secret):
+    def __init__(self, client_id, client_secret, #pylint: disable=too-many-arguments
+                 codec=None, tracer=None, profiler=None, recorder=None):
         super(Client, self).__init__(client_id, client_secret)
         self.__listening = False
-        self.__sub_dev_id = None
+        self.__listen_lock = threading.Lock()
+        self.__sub_dev_ids = ()
         self.__func = None
         self.__args = ()
+        self.__scheduler = None
+        self.__scheduler_lock = threading.Lock()
         self.cam_topic = CamTopic()
+        self.codec = codec if codec else MsgpackCodec()
+        self.tracer = tracer
+        self.profiler = profiler
+        self.recorder = recorder
+        self.clock_estimates = {}
+
+    def disconnect(self):
+        """Disconnect from the ricoh vcp server.
+           Scheduled shots which are not fired yet are discarded.
+        """
+        with self.__scheduler_lock:
+            scheduler, self.__scheduler = self.__scheduler, None
+        if scheduler is not None:
+            scheduler.stop()
+        super(Client, self).disconnect()
 
     def listen(self, device_id, func=None, fargs=None):
         """Start listening to the camera control messages
            and callbacks when the message is received.
+           Several devices can be listened over this connection, each with its own subscription.
 
-        :param str device_id: device id to which you want to send message.
+        :param device_id: device id to which you want to send message, or list of device ids.
         :param function func: callback function which called message is received
         :param tuple fargs: func argument
         """
-
-        if self.__listening:
-            raise ClientError('already listened. If you want to change device to listen, '
-                              'you should call unlisten().')
-        if not self.__sub_dev_id is None:
-            raise ClientError('The device id is already specified.')
-        if not CamTopic.validate_device_id(device_id):
-            raise ValueError('The device id is not acceptable.')
-
-        self.__func = func
-        self.__args = fargs if fargs else ()
-        self.__sub_dev_id = device_id
-
-        try:
-            super(Client, self).subscribe(self.sub_cam_topic, func=self.__on_message, fargs=None)
-        except MQTTClientError:
-            raise ClientError
-        except:
-            raise
-        self.__listening = True
+        with self.__listen_lock:
+            if self.__listening:
+                raise ClientError('already listened. If you want to change device to listen, '
+                                  'you should call unlisten().')
+            if self.__sub_dev_ids:
+                raise ClientError('The device id is already specified.')
+            device_ids = tuple(device_id) if isinstance(device_id, (list, tuple)) else (device_id,)
+            if not device_ids:
+                raise ValueError('The device id is not acceptable.')
+            for dev_id in device_ids:
+                if not CamTopic.validate_device_id(dev_id):
+                    raise ValueError('The device id is not acceptable.')
+
+            self.__func = func
+            self.__args = fargs if fargs else ()
+            self.__sub_dev_ids = device_ids
+
+            try:
+                for topic in self.sub_cam_topics:
+                    super(Client, self).subscribe(topic, func=self.__on_message, fargs=None)
+            except MQTTClientError:
+                raise ClientError
+            except:
+                raise
+            self.__listening = True
 
     def unlisten(self):
         """Unlisten to the camera control message that is already listened.
         """
-        if not self.__listening:
-            LOG.warning('No device is listened. Do nothing.')
-            return
-
-        try:
-            super(Client, self).unsubscribe()
-        except MQTTClientError:
-            raise ClientError
-        except:
-            raise
-        self.__sub_dev_id = None
-        self.__listening = False
-
-    def shoot(self, device_id, param=None):
+        with self.__listen_lock:
+            if not self.__listening:
+                LOG.warning('No device is listened. Do nothing.')
+                return
+
+            if not self.__sub_dev_ids:
+                raise ClientError('No device id is specified.')
+            try:
+                for topic in self.sub_cam_topics:
+                    super(Client, self).unsubscribe(topic)
+            except MQTTClientError:
+                raise ClientError
+            except:
+                raise
+            self.__sub_dev_ids = ()
+            self.__listening = False
+
+    def shoot(self, device_id, param=None, fire_at=None, trace_id=None):
         """Send a shooting message to your device specified by the device_id.
 
         :param str device_id: a device id to which you want to send a message.
         :param dict param: user specified camera control parameters.
+        :param float fire_at: (optional) Unix time of the local clock to fire the callback at.
+                              converted to the clock of the device if :meth:`sync_clock`
+                              has estimated it. if ``None``, fired when received.
+        :param str trace_id: (optional) trace id to send with the message.
+                             it is current in the callback of the receiver,
+                             see :func:`ricohapi.cameractl.trace.current_trace_id`.
         """
         if not CamTopic.validate_device_id(device_id):
             raise ValueError('The device id is not acceptable.')
 
-        topic = self.cam_topic.remocon(device_id)
-
         payload = {'c': 'shoot', 't': CamTopic.timestamp()}
         if not param is None:
             if not isinstance(param, dict):
                 raise ValueError('param must be dictionary.')
             payload.update({'p': param})
-        packed_msg = msgpack.packb(payload, encoding='utf-8', use_bin_type=True)
-        packed_msg = bytearray(packed_msg)
+        if not fire_at is None:
+            estimate = self.clock_estimates.get(device_id)
+            payload['f'] = estimate.to_remote(fire_at) if estimate else fire_at
+        if not trace_id is None:
+            payload.update({'tr': trace_id, 's': CamTopic.precise_timestamp()})
+
+        self.__publish(self.cam_topic.remocon(device_id), payload)
+        if not trace_id is None and not self.tracer is None:
+            self.tracer.record('publish', payload['s'], CamTopic.precise_timestamp(), trace_id,
+                               device=device_id)
+
+    def sync_clock(self, device_id, count=5, timeout=1.0):
+        """Estimate the clock offset and the latency of the device with ping exchanges.
+           The device must be listened by a client which answers pings.
+           The estimate is kept in :attr:`clock_estimates` and used by :meth:`shoot`.
+
+        :param str device_id: a device id to which you want to send pings.
+        :param int count: (optional) number of ping exchanges
+        :param float timeout: (optional) seconds to wait for each answer
+        :rtype: :class:`ricohapi.cameractl.clock.ClockEstimate`
+        :raises: ClientError if no ping is answered.
+        """
+        if not CamTopic.validate_device_id(device_id):
+            raise ValueError('The device id is not acceptable.')
+
+        answers = queue.Queue()
+        pong_topic = self.cam_topic.pong(device_id)
+        try:
+            # the pong of a ping sent before the subscription is acknowledged may be lost.
+            super(Client, self).subscribe(pong_topic, func=self.__on_pong, fargs=(answers,),
+                                          timeout=timeout)
+        except MQTTClientError as err:
+            raise ClientError(str(err))
 
+        samples = []
         try:
-            super(Client, self).publish(topic, message=packed_msg)
+            for seq in range(count):
+                sent = CamTopic.precise_timestamp()
+                self.__publish(self.cam_topic.remocon(device_id),
+                               {'c': 'ping', 't': CamTopic.timestamp(), 'i': seq, 's': sent})
+                while True:
+                    try:
+                        answer, received = answers.get(timeout=timeout)
+                    except queue.Empty:
+                        LOG.warning('ping %d to %s timed out.', seq, device_id)
+                        break
+                    if answer.get('i') == seq:
+                        samples.append((sent, answer['r'], answer['x'], received))
+                        break
+        finally:
+            super(Client, self).unsubscribe(pong_topic)
+
+        try:
+            estimate = estimate_clock(samples)
+        except ValueError as err:
+            raise ClientError(str(err))
+        self.clock_estimates[device_id] = estimate
+        LOG.debug('clock of %s: %s', device_id, estimate)
+        return estimate
+
+    def report_status(self, device_id, battery=None, free_storage=None, busy=False):
+        """Publish the status of the device as a retained message.
+           The server keeps the last status of each device,
+           so that a :class:`ricohapi.cameractl.fleet.FleetState` started later
+           gets the status of all the devices at once.
+
+        :param str device_id: a device id of which the status is reported.
+        :param float battery: (optional) battery level from 0.0 to 1.0
+        :param int free_storage: (optional) free storage in bytes
+        :param bool busy: (optional) ``True`` if the camera is shooting.
+        """
+        if not CamTopic.validate_device_id(device_id):
+            raise ValueError('The device id is not acceptable.')
+
+        self.__publish(self.cam_topic.status(device_id),
+                       {'c': 'status', 't': CamTopic.timestamp(),
+                        's': CamTopic.precise_timestamp(), 'b': battery,
+                        'st': free_storage, 'bz': bool(busy)}, retain=True)
+
+    def clear_status(self, device_id):
+        """Clear the retained status of the device, e.g. when the device is retired.
+
+        :param str device_id: a device id of which the status is cleared.
+        """
+        if not CamTopic.validate_device_id(device_id):
+            raise ValueError('The device id is not acceptable.')
+
+        try:
+            super(Client, self).publish(self.cam_topic.status(device_id), message=bytearray(),
+                                        retain=True)
         except MQTTClientError:
             raise ClientError
-        except:
-            raise
+
+    def request_profile(self, device_id, seconds=30.0, mode='sample'):
+        """Ask the client listening to the device to capture a profile,
+           if it is given a :class:`ricohapi.cameractl.profiling.Profiler`.
+           The profile is written to the directory of the profiler on the listener side.
+
+        :param str device_id: a device id of the listener to profile.
+        :param float seconds: (optional) seconds to profile
+        :param str mode: (optional) ``'sample'`` or ``'cprofile'``
+        """
+        if not CamTopic.validate_device_id(device_id):
+            raise ValueError('The device id is not acceptable.')
+        if mode not in PROFILE_MODES:
+            raise ValueError('mode must be one of ' + ', '.join(PROFILE_MODES))
+
+        self.__publish(self.cam_topic.remocon(device_id),
+                       {'c': 'profile', 't': CamTopic.timestamp(), 'd': seconds, 'm': mode})
 
     @property
     def sub_cam_topic(self):
@@ -173,31 +341,122 @@ class Client(MQTTClient): #pylint: disable=too-many-instance-attributes
 
         :rtype: str or None
         :returns: the camera control topic set in this instance.
+                  with several devices, the one of the first device.
         """
-        if self.__sub_dev_id is None:
+        if not self.__sub_dev_ids:
             return None
         else:
-            topic = self.cam_topic.remocon(self.__sub_dev_id)
+            topic = self.cam_topic.remocon(self.__sub_dev_ids[0])
             return topic
 
+    @property
+    def sub_cam_topics(self):
+        """Get camera control topics connected to all the listened device IDs.
+
+        :rtype: list of str
+        """
+        return [self.cam_topic.remocon(dev_id) for dev_id in self.__sub_dev_ids]
+
+    def __publish(self, topic, payload, retain=False):
+        """Encode the payload with the codec and publish it."""
+        packed_msg = bytearray(self.codec.encode(payload))
+
+        try:
+            super(Client, self).publish(topic, message=packed_msg, retain=retain)
+        except MQTTClientError:
+            raise ClientError
+        except:
+            raise
+
     def __on_message(self, msg): #pylint: disable=unused-argument
         """The callback for when a PUBLISH message is received from the server.
+           Pings are answered at once, and messages with a firing time
+           are scheduled on the monotonic clock.
+           The delivery of a traced message is recorded from the time it is sent,
+           which includes the clock offset between the sender and this client.
         """
-        unpacked = msgpack.unpackb(msg.payload, encoding='utf-8')
+        received = CamTopic.precise_timestamp()
+        if not self.recorder is None:
+            self.recorder.record(msg.topic, msg.payload, received)
+        unpacked = decode_payload(msg.payload)
         LOG.debug('receive message. %s %s', msg.topic, unpacked)
         unpacked = dict(unpacked)
+        try:
+            dev_id = CamTopic.search_dev_id(msg.topic)
+        except ValueError:
+            dev_id = 'DEVID_NOT_FOUND'
+
+        cmd = unpacked['c'] if 'c' in unpacked else None
+        if cmd == 'ping':
+            self.__answer_ping(unpacked, received, dev_id)
+            return
+        if cmd == 'profile':
+            self.__start_profile(unpacked)
+            return
 
         if self.__func is None:
             return
 
-        cmd = unpacked['c'] if 'c' in unpacked else None
         par = unpacked['p'] if 'p' in unpacked else None
+
+        trace_id = unpacked.get('tr')
+        if trace_id is None and unpacked.get('f') is None:
+            self.__call(self.__func, (dev_id, cmd, par) + tuple(self.__args))
+            return
+
+        if not trace_id is None and not self.tracer is None and 's' in unpacked:
+            self.tracer.record('deliver', unpacked['s'], received, trace_id, device=dev_id)
+        args = (self.__func, (dev_id, cmd, par) + tuple(self.__args), trace_id, received)
+        if unpacked.get('f') is None:
+            self.__call_traced(*args)
+            return
+
+        with self.__scheduler_lock:
+            if self.__scheduler is None:
+                self.__scheduler = Scheduler()
+            self.__scheduler.schedule(unpacked['f'], self.__call_traced, args)
+
+    def __call_traced(self, func, args, trace_id, received):
+        """Call the callback with the trace id current, recording the time it waited."""
+        with activate(trace_id):
+            if trace_id is None or self.tracer is None:
+                self.__call(func, args)
+                return
+            self.tracer.record('queue', received, CamTopic.precise_timestamp(), trace_id)
+            with self.tracer.span('callback', trace_id, device=args[0]):
+                self.__call(func, args)
+
+    def __call(self, func, args):
+        """Call the callback, timed by the profiler if any."""
+        if self.profiler is None:
+            func(*args)
+            return
+        name = '{0}:{1}'.format(getattr(func, '__name__', 'callback'), args[1])
+        self.profiler.call(name, func, args)
+
+    def __start_profile(self, request):
+        """Capture a profile requested by a message."""
+        if self.profiler is None:
+            LOG.debug('ignored a profile request since no profiler is given.')
+            return
         try:
-            dev_id = CamTopic.search_dev_id(msg.topic)
-        except ValueError:
-            dev_id = 'DEVID_NOT_FOUND'
+            self.profiler.capture(request.get('d', 30.0), request.get('m', 'sample'))
+        except (TypeError, ValueError) as err:
+            LOG.warning('ignored a profile request: %s', err)
 
-        self.__func(dev_id, cmd, par, *self.__args)
+    def __answer_ping(self, ping, received, dev_id):
+        """Answer the ping with the times it is received and answered."""
+        if dev_id not in self.__sub_dev_ids:
+            return
+        self.__publish(self.cam_topic.pong(dev_id),
+                       {'c': 'pong', 't': CamTopic.timestamp(), 'i': ping.get('i'),
+                        'r': received, 'x': CamTopic.precise_timestamp()})
+
+    @staticmethod
+    def __on_pong(msg, answers):
+        """The callback for when an answer to a ping is received."""
+        received = CamTopic.precise_timestamp()
+        answers.put((dict(decode_payload(msg.payload)), received))
 
 
 class ClientError(MQTTClientError):
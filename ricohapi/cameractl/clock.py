@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""
+Camera remote control SDK clock synchronization and scheduled firing
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, NullHandler, StreamHandler, DEBUG #pylint: disable=unused-import
+
+import heapq
+import itertools
+import threading
+import time
+# the other modules import monotonic from here.
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic #python2
+
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+#LOG.setLevel(DEBUG)
+
+SPIN_THRESHOLD = 0.002
+
+
+class ClockEstimate(namedtuple('ClockEstimate', ['offset', 'latency', 'samples'])):
+    """Clock offset of a device estimated from ping exchanges.
+
+    offset: seconds to add to the local clock to get the clock of the device.
+    latency: estimated one-way latency in seconds.
+    samples: number of ping exchanges which are answered.
+    """
+    __slots__ = ()
+
+    def to_remote(self, local_time):
+        """Convert a Unix time of the local clock to the clock of the device."""
+        return local_time + self.offset
+
+
+def estimate_clock(samples):
+    """Estimate the clock offset from ping exchanges, like NTP.
+
+    The exchange with the shortest round trip is used,
+    since it is the least affected by queueing.
+
+    :param samples: tuples of (sent, received by the device, replied by the device, received)
+                    Unix times. the second and the third are of the clock of the device.
+    :rtype: ClockEstimate
+    :raises: ValueError if no sample is given.
+    """
+    best_delay = None
+    best_offset = 0.0
+    count = 0
+    for sent, remote_received, remote_sent, received in samples:
+        count += 1
+        delay = (received - sent) - (remote_sent - remote_received)
+        offset = ((remote_received - sent) + (remote_sent - received)) / 2
+        if best_delay is None or delay < best_delay:
+            best_delay, best_offset = delay, offset
+    if best_delay is None:
+        raise ValueError('no ping exchange is answered.')
+    return ClockEstimate(best_offset, max(best_delay, 0.0) / 2, count)
+
+
+class Scheduler(object):
+    """Thread which calls functions at Unix times, waiting on the monotonic clock.
+
+    The wall clock is read once when a function is scheduled,
+    so that the firing is not affected by adjustments of the wall clock afterwards.
+    The last milliseconds before a deadline are spun to fire precisely.
+    """
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__queue = []
+        self.__counter = itertools.count()
+        self.__stopped = False
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __len__(self):
+        with self.__condition:
+            return len(self.__queue)
+
+    def schedule(self, fire_at, func, args=()):
+        """Call the function at the time. a past time fires it at once.
+
+        :param float fire_at: Unix time to call the function at
+        :param function func: function to call
+        :param tuple args: (optional) func argument
+        :returns: monotonic clock deadline of the call
+        """
+        deadline = monotonic() + (fire_at - time.time())
+        with self.__condition:
+            if self.__stopped:
+                raise ValueError('scheduler is already stopped.')
+            heapq.heappush(self.__queue, (deadline, next(self.__counter), func, args))
+            self.__condition.notify()
+        return deadline
+
+    def stop(self):
+        """Stop the thread. Functions not called yet are discarded."""
+        with self.__condition:
+            self.__stopped = True
+            del self.__queue[:]
+            self.__condition.notify()
+        self.__thread.join()
+
+    def __run(self):
+        """Wait for the earliest deadline and call the function."""
+        while True:
+            with self.__condition:
+                while not self.__stopped:
+                    if self.__queue:
+                        remaining = self.__queue[0][0] - monotonic()
+                        if remaining <= SPIN_THRESHOLD:
+                            break
+                        self.__condition.wait(remaining - SPIN_THRESHOLD)
+                    else:
+                        self.__condition.wait()
+                if self.__stopped:
+                    return
+                deadline, _, func, args = heapq.heappop(self.__queue)
+
+            while monotonic() < deadline:
+                pass
+            late = monotonic() - deadline
+            if late > SPIN_THRESHOLD:
+                LOG.warning('fired %.1f ms late.', late * 1e3)
+            try:
+                func(*args)
+            except Exception as err: #pylint: disable=broad-except
+                LOG.warning(err)
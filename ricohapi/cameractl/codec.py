@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""
+Camera remote control SDK payload codecs
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import struct
+import zlib
+
+import msgpack  #pylint: disable=import-error
+try:
+    import zstandard  #pylint: disable=import-error
+except ImportError:
+    zstandard = None
+
+COMMAND_CODES = {'shoot': 1, 'ping': 2, 'pong': 3, 'status': 4, 'profile': 5}
+COMMAND_NAMES = dict((code, name) for name, code in COMMAND_CODES.items())
+CUSTOM_COMMAND = 0xff
+
+FLAG_ZLIB = 0x01
+FLAG_ZSTD = 0x02
+
+
+def pack(obj):
+    """Serialize the object with msgpack."""
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpack(data):
+    """Deserialize the msgpack data, decoding strings as utf-8."""
+    try:
+        return msgpack.unpackb(bytes(data), raw=False)
+    except TypeError: #msgpack-python older than 0.5.2
+        return msgpack.unpackb(bytes(data), encoding='utf-8')
+
+
+class Codec(object):
+    """Base class of payload codecs.
+
+    A codec with a ``version`` prefixes the encoded payload with it,
+    so that receivers can decode the payload whichever codec they use.
+    """
+    version = None
+
+    def encode(self, payload):
+        """Encode the payload.
+
+        :param dict payload: message with the command ``c``, timestamp ``t``
+                             and optional user parameters ``p``.
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def decode(self, data):
+        """Decode the payload.
+
+        :param bytes data: encoded payload
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+
+class MsgpackCodec(Codec):
+    """Codec which encodes the payload as a msgpack map.
+       The payload is not prefixed, to be understood by any receiver.
+    """
+    def encode(self, payload):
+        return pack(payload)
+
+    def decode(self, data):
+        return unpack(data)
+
+
+class CompactCodec(Codec):
+    """Codec with a fixed schema and an integer command code.
+
+    The payload is encoded as a header of the version, the command code and flags,
+    followed by a msgpack array of the timestamp, the user parameters, the custom command
+    name and the other keys, without trailing nils.
+    The array is compressed if it is larger than the threshold.
+
+    :param str compression: (optional) ``'zlib'``, ``'zstd'`` or ``None``
+    :param int threshold: (optional) minimum size in bytes to compress
+    """
+    version = 0x01
+    HEADER = struct.Struct(str('>BBB'))
+    FIELDS = 4
+
+    def __init__(self, compression=None, threshold=256):
+        if compression not in (None, 'zlib', 'zstd'):
+            raise ValueError('Unsupported compression.')
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError('zstandard is necessary for zstd compression.')
+        self.compression = compression
+        self.threshold = threshold
+
+    def encode(self, payload):
+        payload = dict(payload)
+        command = payload.pop('c')
+        timestamp = payload.pop('t', 0)
+        param = payload.pop('p', None)
+
+        code = COMMAND_CODES.get(command, CUSTOM_COMMAND)
+        name = command if code == CUSTOM_COMMAND else None
+        fields = [timestamp, param, name, payload or None]
+        while fields[-1] is None:
+            fields.pop()
+        body = pack(fields)
+
+        flags = 0
+        if self.compression is not None and len(body) >= self.threshold:
+            if self.compression == 'zstd':
+                body = zstandard.ZstdCompressor().compress(body)
+                flags |= FLAG_ZSTD
+            else:
+                body = zlib.compress(body)
+                flags |= FLAG_ZLIB
+
+        return CompactCodec.HEADER.pack(self.version, code, flags) + body
+
+    def decode(self, data):
+        data = bytes(data)
+        _, code, flags = CompactCodec.HEADER.unpack_from(data)
+        body = data[CompactCodec.HEADER.size:]
+
+        if flags & FLAG_ZSTD:
+            if zstandard is None:
+                raise ValueError('zstandard is necessary to decode the payload.')
+            body = zstandard.ZstdDecompressor().decompress(body)
+        elif flags & FLAG_ZLIB:
+            body = zlib.decompress(body)
+
+        fields = unpack(body)
+        fields += [None] * (CompactCodec.FIELDS - len(fields))
+        timestamp, param, name, others = fields
+        payload = dict(others) if others else {}
+        payload['c'] = name if code == CUSTOM_COMMAND else COMMAND_NAMES.get(code)
+        payload['t'] = timestamp
+        if not param is None:
+            payload['p'] = param
+        return payload
+
+
+CODECS = {CompactCodec.version: CompactCodec}
+
+
+def decode_payload(data):
+    """Decode the payload with the codec indicated by its first byte.
+       Payloads without a version byte are decoded as msgpack.
+
+    :param bytes data: encoded payload
+    :rtype: dict
+    """
+    head = bytearray(data[:1])
+    codec = CODECS.get(head[0]) if head else None
+    if codec is None:
+        return MsgpackCodec().decode(data)
+    return codec().decode(data)
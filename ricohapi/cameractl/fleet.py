@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""
+Camera remote control SDK status of a fleet of devices reported by heartbeats
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, NullHandler, StreamHandler, DEBUG #pylint: disable=unused-import
+
+import threading
+import time
+
+from ricohapi.cameractl.client import CamTopic
+from ricohapi.cameractl.codec import decode_payload
+
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+#LOG.setLevel(DEBUG)
+
+HEARTBEAT_INTERVAL = 30.0
+STALE_AFTER = 3 * HEARTBEAT_INTERVAL
+
+
+class DeviceStatus(namedtuple('DeviceStatus', [
+        'device_id', 'battery', 'free_storage', 'busy', 'reported_at', 'received_at'])):
+    """Status of a device reported by its heartbeat.
+
+    device_id: device id.
+    battery: battery level from 0.0 to 1.0, or ``None`` if not reported.
+    free_storage: free storage in bytes, or ``None`` if not reported.
+    busy: ``True`` if the camera is shooting.
+    reported_at: Unix time of the clock of the reporter when the status is reported.
+    received_at: Unix time when the status is received.
+    """
+    __slots__ = ()
+
+    def is_stale(self, stale_after=STALE_AFTER, now=None):
+        """Check if no heartbeat has been reported for a while.
+
+        The time reported is used, since a retained status is received
+        at once on subscribing however old it is.
+
+        :param float stale_after: (optional) seconds after which the status is stale
+        :param float now: (optional) current Unix time
+        :rtype: bool
+        """
+        now = time.time() if now is None else now
+        return now - self.reported_at > stale_after
+
+
+class Heartbeat(object): #pylint: disable=too-few-public-methods
+    """Thread which reports the status of a device periodically.
+
+    A probe which raises an exception reports nothing,
+    so that the status of the device gets stale.
+
+    :param client: a connected :class:`ricohapi.cameractl.client.Client`
+    :param str device_id: device id of which the status is reported
+    :param function probe: function which returns a dict of the
+                           ``battery``, ``free_storage`` and ``busy`` arguments of
+                           :meth:`ricohapi.cameractl.client.Client.report_status`
+    :param float interval: (optional) seconds between the reports
+    """
+    def __init__(self, client, device_id, probe, interval=HEARTBEAT_INTERVAL):
+        self.client = client
+        self.device_id = device_id
+        self.probe = probe
+        self.interval = interval
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self, clear=False):
+        """Stop reporting.
+
+        :param bool clear: (optional) if ``True``, the retained status is cleared,
+                           for a device which is not listened anymore.
+        """
+        self.__stopped.set()
+        self.__thread.join()
+        if clear:
+            self.client.clear_status(self.device_id)
+
+    def __run(self):
+        """Report the status at once and then at every interval."""
+        while True:
+            try:
+                self.client.report_status(self.device_id, **self.probe())
+            except Exception as err: #pylint: disable=broad-except
+                LOG.warning('could not report the status of %s: %s', self.device_id, err)
+            if self.__stopped.wait(self.interval):
+                return
+
+
+class FleetState(object):
+    """Table of the status of the devices, kept up to date by their heartbeats.
+
+    Subscribing once gets the retained status of all the devices at once,
+    and each heartbeat updates its row in constant time.
+
+    :param client: a connected :class:`ricohapi.cameractl.client.Client`
+    :param float stale_after: (optional) seconds after which a status is stale
+    """
+    def __init__(self, client, stale_after=STALE_AFTER):
+        self.client = client
+        self.stale_after = stale_after
+        self.__topic = CamTopic().status('+')
+        self.__condition = threading.Condition()
+        self.__table = {}
+        self.__started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __len__(self):
+        with self.__condition:
+            return len(self.__table)
+
+    def __contains__(self, device_id):
+        with self.__condition:
+            return device_id in self.__table
+
+    def start(self):
+        """Subscribe to the status of all the devices."""
+        if self.__started:
+            return
+        self.client.subscribe(self.__topic, func=self.__on_status)
+        self.__started = True
+
+    def stop(self):
+        """Unsubscribe. The table is kept as it is."""
+        if not self.__started:
+            return
+        self.client.unsubscribe(self.__topic)
+        self.__started = False
+
+    def wait(self, count, timeout=None):
+        """Wait until the status of the number of devices is known,
+           e.g. for the retained status on startup.
+
+        :param int count: number of devices
+        :param float timeout: (optional) seconds to wait. if ``None``, waits forever.
+        :rtype: bool
+        :returns: ``False`` if timed out.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.__condition:
+            while len(self.__table) < count:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__condition.wait(remaining)
+        return True
+
+    def update(self, status):
+        """Update the row of the device. An older status than the known one is ignored.
+
+        :param DeviceStatus status: status of a device
+        """
+        with self.__condition:
+            known = self.__table.get(status.device_id)
+            if known is not None and known.reported_at > status.reported_at:
+                return
+            self.__table[status.device_id] = status
+            self.__condition.notify_all()
+
+    def remove(self, device_id):
+        """Remove the row of the device.
+
+        :param str device_id: device id
+        """
+        with self.__condition:
+            self.__table.pop(device_id, None)
+
+    def get(self, device_id):
+        """Get the status of the device.
+
+        :param str device_id: device id
+        :rtype: DeviceStatus or None
+        """
+        with self.__condition:
+            return self.__table.get(device_id)
+
+    def devices(self):
+        """Get the status of all the devices.
+
+        :rtype: list of DeviceStatus
+        """
+        with self.__condition:
+            return list(self.__table.values())
+
+    def stale(self, now=None):
+        """Get the devices which have not reported for a while.
+
+        :param float now: (optional) current Unix time
+        :rtype: list of DeviceStatus
+        """
+        return [status for status in self.devices() if status.is_stale(self.stale_after, now)]
+
+    def idle(self, min_battery=None, now=None):
+        """Get the devices which are ready to shoot, the fullest battery first.
+
+        :param float min_battery: (optional) minimum battery level
+        :param float now: (optional) current Unix time
+        :rtype: list of DeviceStatus
+        """
+        ready = [status for status in self.devices()
+                 if not status.busy and not status.is_stale(self.stale_after, now)
+                 and (min_battery is None or (status.battery or 0.0) >= min_battery)]
+        ready.sort(key=lambda status: -(status.battery or 0.0))
+        return ready
+
+    def __on_status(self, msg):
+        """The callback for when a status is received. An empty message clears it."""
+        received = time.time()
+        try:
+            device_id = CamTopic.search_dev_id(msg.topic, 'status')
+        except ValueError as err:
+            LOG.warning('%s: %s', err, msg.topic)
+            return
+
+        if not msg.payload:
+            self.remove(device_id)
+            return
+        payload = dict(decode_payload(msg.payload))
+        self.update(DeviceStatus(device_id, payload.get('b'), payload.get('st'),
+                                 bool(payload.get('bz')), payload.get('s', received), received))
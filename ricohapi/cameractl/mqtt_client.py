@@ -7,10 +7,12 @@ Camera remote control SDK
 
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
-from collections import namedtuple
+from collections import deque, namedtuple
 from logging import getLogger, NullHandler, StreamHandler, DEBUG #pylint: disable=unused-import
 
 import datetime
+import socket
+import threading
 import time
 import uuid
 import paho.mqtt.client as mqtt
@@ -30,6 +32,60 @@ UNESCAPE_TRANSFORMATIONS = {'%2B': '+',
                             '%2F': '/',
                             '%25': '%'}
 
+PublishStats = namedtuple('PublishStats', ['published', 'acknowledged', 'in_flight'])
+
+PENDING_LIMIT = 1000
+CONNACK_TIMEOUT = 10.0
+
+
+class _Outgoing(object): #pylint: disable=too-few-public-methods
+    """A message queued to publish, and the error raised on handing it to Paho.
+       ``done`` is held until the message is handed over. a plain lock is cheaper than an Event.
+    """
+    __slots__ = ('args', 'done', 'error')
+
+    def __init__(self, args):
+        self.args = args
+        self.done = threading.Lock()
+        self.done.acquire()
+        self.error = None
+
+
+class ConnectionProfile(namedtuple('ConnectionProfile', [
+        'keepalive', 'retry_interval', 'max_inflight', 'max_queued', 'publish_qos',
+        'subscribe_qos', 'clean_session', 'send_buffer', 'recv_buffer', 'tls', 'no_delay'])):
+    """Settings of the connection to the server.
+
+    :param int keepalive: (optional) seconds between pings when no other message is sent
+    :param int retry_interval: (optional) seconds to wait before resending a QoS 1 message
+    :param int max_inflight: (optional) maximum number of QoS 1 messages waiting for
+                             acknowledgement. further messages are queued.
+    :param int max_queued: (optional) maximum number of queued messages. 0 means unlimited.
+                           publishing over the limit raises :class:`MQTTClientError`.
+    :param int publish_qos: (optional) QoS of published messages, 0 or 1
+    :param int subscribe_qos: (optional) QoS of subscriptions, 0 or 1
+    :param bool clean_session: (optional) if ``False``, the server keeps the subscriptions
+                               and queued messages while the client is disconnected.
+                               a ``session_id`` must be given to connect.
+    :param int send_buffer: (optional) socket send buffer size in bytes. ``None`` for OS default.
+    :param int recv_buffer: (optional) socket receive buffer size in bytes.
+                            ``None`` for OS default.
+    :param bool tls: (optional) if ``False``, connect without TLS, e.g. to a local test broker.
+    :param bool no_delay: (optional) if ``True``, small messages are sent at once
+                          instead of being delayed by Nagle's algorithm.
+    """
+    __slots__ = ()
+
+    def __new__(cls, keepalive=60, retry_interval=60, #pylint: disable=too-many-arguments
+                max_inflight=20, max_queued=0, publish_qos=1, subscribe_qos=1, clean_session=True,
+                send_buffer=None, recv_buffer=None, tls=True, no_delay=True):
+        for qos in (publish_qos, subscribe_qos):
+            if qos not in (0, 1):
+                raise ValueError('QoS must be 0 or 1.')
+        return super(ConnectionProfile, cls).__new__(
+            cls, keepalive, retry_interval, max_inflight, max_queued, publish_qos,
+            subscribe_qos, clean_session, send_buffer, recv_buffer, tls, no_delay)
+
 class Topic(object):
     """A class to manage topics."""
     def __init__(self):
@@ -84,23 +140,163 @@ class Topic(object):
         now = datetime.datetime.now()
         return int(time.mktime(now.timetuple()))
 
+    @staticmethod
+    def precise_timestamp():
+        """Return timestamp with sub-second resolution.
+
+        :rtype: float
+        :returns: Unix epoch
+        """
+        return time.time()
+
+class TopicTrie(object):
+    """Topic filters stored level by level.
+       Matching a topic costs in proportion to its depth, not to the number of filters.
+    """
+    class _Node(object): #pylint: disable=too-few-public-methods
+        """A level of the topic filters."""
+        __slots__ = ('children', 'value', 'filled')
+
+        def __init__(self):
+            self.children = {}
+            self.value = None
+            self.filled = False
+
+    def __init__(self):
+        self.__root = TopicTrie._Node()
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    @staticmethod
+    def validate_filter(topic_filter):
+        """Validate the topic filter with MQTT wildcards '+' and '#'.
+
+        :param str topic_filter: topic filter
+        :raises: ValueError if the wildcards are misplaced.
+        """
+        levels = topic_filter.split('/')
+        for i, level in enumerate(levels):
+            if ('#' in level) and (level != '#' or i != len(levels) - 1):
+                raise ValueError('"#" must be the last level of the topic filter.')
+            if ('+' in level) and (level != '+'):
+                raise ValueError('"+" must occupy an entire level of the topic filter.')
+
+    def insert(self, topic_filter, value):
+        """Store the value for the topic filter.
+
+        :param str topic_filter: topic filter
+        :param value: value to store
+        """
+        TopicTrie.validate_filter(topic_filter)
+        node = self.__root
+        for level in topic_filter.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                child = TopicTrie._Node()
+                node.children[level] = child
+            node = child
+        if not node.filled:
+            self.__size += 1
+        node.value = value
+        node.filled = True
+
+    def remove(self, topic_filter):
+        """Remove the value for the topic filter.
+
+        :param str topic_filter: topic filter
+        :raises: KeyError if the topic filter is not stored.
+        """
+        path = [self.__root]
+        levels = topic_filter.split('/')
+        for level in levels:
+            node = path[-1].children.get(level)
+            if node is None:
+                raise KeyError(topic_filter)
+            path.append(node)
+
+        node = path[-1]
+        if not node.filled:
+            raise KeyError(topic_filter)
+        node.value = None
+        node.filled = False
+        self.__size -= 1
+
+        for level, parent, child in reversed(list(zip(levels, path, path[1:]))):
+            if child.filled or child.children:
+                break
+            del parent.children[level]
+
+    def match(self, topic):
+        """Get the values of the topic filters which match the topic.
+
+        :param str topic: topic of a message
+        :rtype: list
+        """
+        matched = []
+        nodes = [self.__root]
+        for i, level in enumerate(topic.split('/')):
+            wildcard = not (i == 0 and level.startswith('$'))
+            next_nodes = []
+            for node in nodes:
+                if wildcard:
+                    rest = node.children.get('#')
+                    if rest is not None and rest.filled:
+                        matched.append(rest.value)
+                    child = node.children.get('+')
+                    if child is not None:
+                        next_nodes.append(child)
+                child = node.children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+            nodes = next_nodes
+            if not nodes:
+                return matched
+
+        for node in nodes:
+            if node.filled:
+                matched.append(node.value)
+            rest = node.children.get('#')
+            if rest is not None and rest.filled:
+                matched.append(rest.value)
+        return matched
+
+
 class MQTTClient(object): #pylint: disable=too-many-instance-attributes
     """Ricoh MQTT service client.
        This client program uses Eclipse Paho MQTT Python Client library.
 
+       An instance can be shared by threads.
+       Messages published concurrently are queued without a lock,
+       and the thread which finds no other one publishing hands the queue to Paho,
+       so that the threads do not contend for the locks of Paho.
+
     :param str client_id: your client id
     :param str client_secret: your client secret
     """
     def __init__(self, client_id, client_secret):
-        self.__sub_topic = None
+        self.__subscriptions = TopicTrie()
+        self.__sub_topics = set()
         self.__mqtt = None
         self.__connected = False
         self.__listening = False
         self.__client = {'id': client_id, 'secret': client_secret}
-        self.__func = None
-        self.__args = ()
         self.__topic = Topic()
         self.__uid = None
+        self.__broker_info = None
+        self.__profile = ConnectionProfile()
+        self.__connack = threading.Event()
+        self.__session_present = False
+        self.__pending = deque(maxlen=PENDING_LIMIT)
+        self.__state_lock = threading.Lock()
+        self.__sub_lock = threading.Lock()
+        self.__subacks = {}
+        self.__suback_lock = threading.Lock()
+        self.__outbox = deque()
+        self.__sending = threading.Lock()
+        self.__published = 0
+        self.__acknowledged = 0
 
     def __enter__(self):
         return self
@@ -118,127 +314,348 @@ class MQTTClient(object): #pylint: disable=too-many-instance-attributes
 
         LOG.debug('terminated.')
 
-    def connect(self, user_id, user_pass, ca_certs):
+    def connect(self, user_id, user_pass, ca_certs, #pylint: disable=too-many-arguments
+                broker_info=None, profile=None, session_id=None):
         """connect to the ricoh vcp server for using mqtt service.
 
+           With a ``session_id`` and a profile with ``clean_session=False``,
+           the server keeps the subscriptions and the QoS 1 messages while disconnected,
+           and delivers the queued messages when the same session id connects again.
+
         :param str user_id: your user id
         :param str user_pass: your password
         :param str ca_certs: The path to the ca certificate file.
+        :param broker_info: (optional) :attr:`broker_info` of another connected client.
+                            if specified, the access token is reused without authentication.
+        :param ConnectionProfile profile: (optional) settings of the connection.
+        :param str session_id: (optional) stable MQTT client id of the connection.
+                               if ``None``, a random id is used.
         """
-        if self.__connected:
-            raise MQTTClientError('already connected to the server.')
-
-        mqtts = self.__get_broker_info(user_id, user_pass)
+        profile = profile if profile else ConnectionProfile()
+        if not profile.clean_session and not session_id:
+            raise ValueError('session_id is necessary to keep the session.')
+
+        with self.__state_lock:
+            if self.__connected:
+                raise MQTTClientError('already connected to the server.')
+            self.__connect(user_id, user_pass, ca_certs, broker_info, profile, session_id)
+
+    def __connect(self, user_id, user_pass, ca_certs, #pylint: disable=too-many-arguments
+                  broker_info, profile, session_id):
+        """Connect with the state lock held."""
+        if broker_info is None:
+            mqtts = self.__get_broker_info(user_id, user_pass)
+        else:
+            mqtts = broker_info
 
-        mqtt_cid = str(uuid.uuid4())
+        mqtt_cid = str(session_id) if session_id else str(uuid.uuid4())
+        client = mqtt.Client(mqtt_cid, clean_session=profile.clean_session)
         self.__uid = user_id
-        self.__mqtt = mqtt.Client(mqtt_cid)
-        self.__mqtt.username_pw_set(mqtts.uid, mqtts.token)
-        self.__mqtt.tls_set(ca_certs)
-        self.__mqtt.connect(mqtts.host, mqtts.port, keepalive=60)
-        self.__mqtt.message_retry_set(60)
-        self.__mqtt.loop_start()
+        self.__broker_info = mqtts
+        self.__profile = profile
+        self.__connack.clear()
+        self.__session_present = False
+        # the messages in flight on a previous connection are dropped with its Paho client.
+        self.__published = 0
+        self.__acknowledged = 0
+        with self.__suback_lock:
+            self.__subacks.clear()
+        client.on_connect = self.__on_connect
+        client.on_publish = self.__on_publish
+        client.on_subscribe = self.__on_subscribe
+        client.on_message = self.__on_message
+        client.max_inflight_messages_set(profile.max_inflight)
+        client.max_queued_messages_set(profile.max_queued)
+        client.username_pw_set(mqtts.uid, mqtts.token)
+        if profile.tls:
+            client.tls_set(ca_certs)
+        client.connect(mqtts.host, mqtts.port, keepalive=profile.keepalive)
+        self.__set_socket_buffers(client.socket(), profile)
+        client.message_retry_set(profile.retry_interval)
+        client.loop_start()
+        self.__mqtt = client
         self.__connected = True
 
     def disconnect(self):
         """Disconnect from the ricoh vcp server.
         """
-        if (self.__mqtt is None) or (not self.__connected):
-            LOG.debug(self.__mqtt)
-            LOG.debug(self.__connected)
-            LOG.warning('No client is connected to the server.')
-            return
-
-        if self.__listening:
-            self.unsubscribe()
-
-        if isinstance(self.__mqtt, mqtt.Client):
-            self.__mqtt.loop_stop()
-            self.__mqtt.disconnect()
-            self.__mqtt = None
+        with self.__state_lock:
+            if (self.__mqtt is None) or (not self.__connected):
+                LOG.debug(self.__mqtt)
+                LOG.debug(self.__connected)
+                LOG.warning('No client is connected to the server.')
+                return
+
+            if self.__listening and self.__profile.clean_session:
+                self.unsubscribe()
+            elif self.__listening:
+                # keep the subscriptions on the server for the next session.
+                with self.__sub_lock:
+                    for sub_topic in self.__sub_topics:
+                        self.__subscriptions.remove(sub_topic)
+                    self.__sub_topics.clear()
+                    self.__listening = False
+
+            client = self.__mqtt
+            if not isinstance(client, mqtt.Client):
+                return
             self.__connected = False
+            self.__mqtt = None
+
+        # stop the network thread without the lock, which its callbacks may wait for.
+        client.loop_stop()
+        client.disconnect()
 
-    def subscribe(self, topic, func=None, fargs=None):
+    def subscribe(self, topic, func=None, fargs=None, timeout=None):
         """Subscribe to a topic.
            A Callback function is called when the client receives a message from the server.
+           Several topics can be subscribed to, each with its own callback function.
 
         :param str topic: topic to which you want to send message.
+                          MQTT wildcards '+' and '#' can be used.
         :param function func: callback function which is called when a message is received
         :param tuple fargs: func argument
+        :param float timeout: (optional) seconds to wait for the server to acknowledge
+                              the subscription. if ``None``, the call does not wait.
+        :raises: MQTTClientError if the subscription is not acknowledged in time.
+                 The topic is unsubscribed then.
         """
 
         if (self.__mqtt is None) or (not self.__connected):
             raise MQTTClientError('connect to the server before calling subscribe()')
 
-        if self.__listening:
-            LOG.warning('already listened. Do nothing.')
-            return
-
-        self.__func = func
-        self.__args = fargs if fargs else ()
-        self.__mqtt.on_message = self.__on_message
-        self.__sub_topic = self.__topic.topic(self.__uid, topic)
-        self.__subscribe(self.__sub_topic)
-        self.__listening = True
-
-    def unsubscribe(self):
+        sub_topic = self.__topic.topic(self.__uid, topic)
+        with self.__sub_lock:
+            if sub_topic in self.__sub_topics:
+                LOG.warning('already subscribed to %s. Do nothing.', topic)
+                return
+            self.__subscriptions.insert(sub_topic, (func, fargs if fargs else ()))
+            pending = [msg for msg in self.__pending if self.__subscriptions.match(msg.topic)]
+            for msg in pending:
+                self.__pending.remove(msg)
+            self.__sub_topics.add(sub_topic)
+            self.__listening = True
+
+        # a resumed session may lack the topic, e.g. a device listened for the first time.
+        # subscribing again to a kept topic is harmless.
+        acknowledged = self.__subscribe(sub_topic)
+
+        for msg in pending:
+            self.__on_message(None, None, msg)
+
+        if timeout is not None and not (acknowledged and acknowledged.wait(timeout)):
+            self.unsubscribe(topic)
+            raise MQTTClientError('subscription to {0} is not acknowledged.'.format(topic))
+
+    def unsubscribe(self, topic=None):
         """Unsubscribe a topic which is already subscribed to.
+
+        :param str topic: (optional) topic to unsubscribe. if ``None``, all topics.
         """
-        if self.__mqtt is None:
+        client = self.__mqtt
+        if client is None:
             raise MQTTClientError('mqtt client is not initialized.')
 
-        if not self.__listening:
+        with self.__sub_lock:
+            if topic is None:
+                sub_topics = list(self.__sub_topics)
+            else:
+                sub_topics = [self.__topic.topic(self.__uid, topic)]
+                if not sub_topics[0] in self.__sub_topics:
+                    sub_topics = []
+
+            for sub_topic in sub_topics:
+                self.__subscriptions.remove(sub_topic)
+                self.__sub_topics.discard(sub_topic)
+            self.__listening = bool(self.__sub_topics)
+
+        if not sub_topics:
             LOG.warning('No device is subscribed. Do nothing.')
+            return
 
-        if isinstance(self.__mqtt, mqtt.Client):
-            self.__mqtt.unsubscribe(self.__sub_topic)
-            self.__sub_topic = None
-            self.__listening = False
+        if isinstance(client, mqtt.Client):
+            for sub_topic in sub_topics:
+                client.unsubscribe(sub_topic)
 
-    def publish(self, topic, message=None):
+    def publish(self, topic, message=None, retain=False):
         """Send a message from the client to the server.
 
         topic: the topic to be published on.
         message: the message to send.
+        retain: (optional) if ``True``, the server keeps the message as the last one
+                of the topic, and delivers it to clients which subscribe later.
+                an empty retained message clears it.
         """
 
-        if not self.__connected:
+        client = self.__mqtt
+        if client is None or not self.__connected:
             raise MQTTClientError('You should connect to the server before calling publish()')
 
         topic = self.__topic.topic(self.__uid, topic)
 
-        self.__send_message(topic, message)
+        self.__send_message(client, topic, message, retain=retain)
+
+    @property
+    def broker_info(self):
+        """Get the broker access information used to connect.
+
+        :rtype: namedtuple or None
+        :returns: Ricoh MQTT server access info.
+        """
+        return self.__broker_info
+
+    @property
+    def session_present(self):
+        """Check if the server resumed the session of the ``session_id`` on connect.
+           If so, the subscriptions and the queued messages of the previous session are kept.
+
+        :rtype: bool
+        """
+        if self.__profile.clean_session or not self.__connected:
+            return False
+        if not self.__connack.wait(CONNACK_TIMEOUT):
+            LOG.warning('no CONNACK from the server in %s sec.', CONNACK_TIMEOUT)
+        return self.__session_present
+
+    @property
+    def stats(self):
+        """Get the number of messages published and acknowledged by the server since connected.
+           Only messages which Paho accepted are counted as published,
+           so that ``in_flight`` counts the messages waiting for the server.
+
+        :rtype: PublishStats
+        """
+        # each counter has one writer at a time. a message is counted as published
+        # before it is handed to Paho. read the acknowledged first,
+        # so that it is not more than the published.
+        acknowledged = self.__acknowledged
+        published = self.__published
+        return PublishStats(published, acknowledged, published - acknowledged)
+
+    def __on_publish(self, _client, _userdata, _mid): #pylint: disable=unused-argument
+        """The callback for when a message is sent to the server,
+           or acknowledged with QoS 1. Called only in the network thread.
+        """
+        self.__acknowledged += 1
+
+    def __on_subscribe(self, _client, _userdata, mid, _qos): #pylint: disable=unused-argument
+        """The callback for when the server acknowledges a subscription."""
+        with self.__suback_lock:
+            acknowledged = self.__subacks.pop(mid, None)
+        if acknowledged is not None:
+            acknowledged.set()
+
+    def __on_connect(self, _client, _userdata, flags, _rc): #pylint: disable=unused-argument
+        """The callback for when the server responds to the connection request."""
+        self.__session_present = bool(flags.get('session present'))
+        self.__connack.set()
 
     def __on_message(self, _client, _userdata, msg): #pylint: disable=unused-argument
         """The callback for when a PUBLISH message is received from the server.
+           Messages of a resumed session may arrive before :meth:`subscribe` is called,
+           so they are held until a matching topic is subscribed to.
         """
         LOG.debug('receive message. %s', msg.topic)
 
-        if self.__func is None:
-            return
+        with self.__sub_lock:
+            matched = self.__subscriptions.match(msg.topic)
+            if not matched and not self.__profile.clean_session:
+                if len(self.__pending) == self.__pending.maxlen:
+                    LOG.warning('too many messages before subscribing. dropped the oldest.')
+                self.__pending.append(msg)
+                return
 
-        self.__func(msg, *self.__args)
+        for func, args in matched:
+            if func is None:
+                continue
+            func(msg, *args)
 
-    def __subscribe(self, topic, qos=1):
+    @staticmethod
+    def __set_socket_buffers(sock, profile):
+        """Set the socket buffer sizes and options specified by the profile."""
+        if sock is None:
+            return
+        if profile.send_buffer:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, profile.send_buffer)
+        if profile.recv_buffer:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, profile.recv_buffer)
+        if profile.no_delay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def __subscribe(self, topic, qos=None):
         """Subscribe to a topic specified by the argument.
            Note QOS 2 is not suppourted.
+
+        :returns: event set when the server acknowledges the subscription,
+                  or ``None`` if Paho did not send it.
         """
 
-        if self.__mqtt is None:
+        client = self.__mqtt
+        if client is None:
             raise MQTTClientError('mqtt client is not initialized.')
 
-        if isinstance(topic, list):
-            self.__mqtt.subscribe(topic)
-        else:
-            self.__mqtt.subscribe((topic, qos))
-        LOG.debug('subscribe: %s', topic)
+        if qos is None:
+            qos = self.__profile.subscribe_qos
 
-    def __send_message(self, topic, msg, qos=1):
-        """send message."""
-        if self.__mqtt is None:
-            raise MQTTClientError('mqtt client is not initialized.')
-
-        self.__mqtt.publish(topic, msg, qos, False)
+        # register the request before the acknowledgement can arrive in the network thread.
+        with self.__suback_lock:
+            if isinstance(topic, list):
+                result, mid = client.subscribe(topic)
+            else:
+                result, mid = client.subscribe((topic, qos))
+            if result != mqtt.MQTT_ERR_SUCCESS:
+                return None
+            acknowledged = self.__subacks[mid] = threading.Event()
+        LOG.debug('subscribe: %s', topic)
+        return acknowledged
+
+    def __send_message(self, client, topic, msg, #pylint: disable=too-many-arguments
+                       qos=None, retain=False):
+        """send message.
+           The message is queued, and the queue is handed to Paho
+           unless another thread is doing so, which hands this message as well.
+           An error on a message is raised in the thread which queued it,
+           and the rest of the queue is still handed to Paho.
+        """
+        if qos is None:
+            qos = self.__profile.publish_qos
+
+        outgoing = _Outgoing((topic, msg, qos, retain))
+        self.__outbox.append(outgoing)
+        # check the queue again after releasing, in case a message is queued
+        # while the previous thread finishes.
+        while self.__outbox and self.__sending.acquire(False):
+            try:
+                while self.__outbox:
+                    self.__hand_over(client, self.__outbox.popleft())
+            finally:
+                self.__sending.release()
+
+        outgoing.done.acquire()
+        if outgoing.error is not None:
+            raise outgoing.error
+
+    def __hand_over(self, client, outgoing):
+        """Hand a queued message to Paho, keeping the error for the thread which queued it.
+           A message which Paho does not accept, e.g. over ``max_queued`` or with QoS 0
+           while disconnected, is dropped by Paho. It is an error, and is not counted.
+        """
+        # counted first, since the network thread may acknowledge it before publish() returns.
+        self.__published += 1
+        try:
+            # (rc, mid), or MQTTMessageInfo which can be indexed alike.
+            result = client.publish(*outgoing.args)[0]
+            # Paho keeps a QoS 1 message while disconnected, and sends it on reconnect.
+            if result == mqtt.MQTT_ERR_NO_CONN and outgoing.args[2] > 0:
+                result = mqtt.MQTT_ERR_SUCCESS
+            if result != mqtt.MQTT_ERR_SUCCESS:
+                raise MQTTClientError('could not publish to {0}: {1}'.format(
+                    outgoing.args[0], mqtt.error_string(result)))
+        except Exception as err: #pylint: disable=broad-except
+            self.__published -= 1
+            outgoing.error = err
+        finally:
+            outgoing.done.release()
 
     def __get_broker_info(self, user_id, user_pass):
         """Get some broker access information.
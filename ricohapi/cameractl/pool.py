@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""
+Camera remote control SDK connection pool
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, NullHandler, StreamHandler, DEBUG #pylint: disable=unused-import
+
+import time
+import zlib
+from ricohapi.cameractl.client import Client, ClientError
+
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+#LOG.setLevel(DEBUG)
+
+PoolStats = namedtuple('PoolStats', ['published', 'acknowledged', 'in_flight',
+                                     'publish_rate', 'ack_rate'])
+
+
+class ClientPool(object):
+    """Pool of camera control clients, each with its own connection to the server.
+
+    Shooting messages are routed to a connection by the device id,
+    so that the messages to a device are kept in order.
+
+    :param str client_id: your client id
+    :param str client_secret: your client secret
+    :param int size: (optional) number of connections
+    :param codec: (optional) :class:`ricohapi.cameractl.codec.Codec` to encode messages
+    :param tracer: (optional) :class:`ricohapi.cameractl.trace.Tracer` to record
+                   the spans of the traced shots sent.
+    """
+    def __init__(self, client_id, client_secret, #pylint: disable=too-many-arguments
+                 size=4, codec=None, tracer=None):
+        if size < 1:
+            raise ValueError('size must be 1 or more.')
+
+        self.clients = [Client(client_id, client_secret, codec=codec, tracer=tracer)
+                        for _ in range(size)]
+        self.__connected_at = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for client in self.clients:
+            client.__exit__(exc_type, exc_value, traceback)
+
+    def connect(self, user_id, user_pass, ca_certs, #pylint: disable=too-many-arguments
+                profile=None, session_id=None):
+        """connect all clients to the ricoh vcp server.
+           Only the first client is authenticated and the others share its access token.
+
+        :param str user_id: your user id
+        :param str user_pass: your password
+        :param str ca_certs: The path to the ca certificate file.
+        :param profile: (optional) :class:`ricohapi.cameractl.mqtt_client.ConnectionProfile`
+        :param str session_id: (optional) prefix of the stable session ids.
+                               the clients use ``session_id-0``, ``session_id-1`` and so on.
+        """
+        session_ids = [None] * len(self.clients)
+        if session_id:
+            session_ids = ['{0}-{1}'.format(session_id, i) for i in range(len(self.clients))]
+
+        first = self.clients[0]
+        first.connect(user_id, user_pass, ca_certs, profile=profile, session_id=session_ids[0])
+        for client, client_session in zip(self.clients[1:], session_ids[1:]):
+            client.connect(user_id, user_pass, ca_certs, broker_info=first.broker_info,
+                           profile=profile, session_id=client_session)
+        self.__connected_at = time.time()
+
+    def disconnect(self):
+        """Disconnect all clients from the ricoh vcp server.
+        """
+        for client in self.clients:
+            client.disconnect()
+        self.__connected_at = None
+
+    def client(self, device_id):
+        """Get the client to which messages to the device are routed.
+
+        :param str device_id: device id
+        :rtype: :class:`ricohapi.cameractl.client.Client`
+        """
+        if device_id is None:
+            raise ValueError('dev_id is necessary.')
+        key = zlib.crc32(device_id.encode('utf-8')) & 0xffffffff
+        return self.clients[key % len(self.clients)]
+
+    def shoot(self, device_id, param=None, fire_at=None, trace_id=None):
+        """Send a shooting message to your device specified by the device_id.
+
+        :param str device_id: a device id to which you want to send a message.
+        :param dict param: user specified camera control parameters.
+        :param float fire_at: (optional) Unix time to fire at,
+                              see :meth:`ricohapi.cameractl.client.Client.shoot`
+        :param str trace_id: (optional) trace id to send with the message,
+                             see :meth:`ricohapi.cameractl.client.Client.shoot`
+        """
+        if self.__connected_at is None:
+            raise ClientError('You should connect to the server before calling shoot()')
+        self.client(device_id).shoot(device_id, param=param, fire_at=fire_at, trace_id=trace_id)
+
+    def sync_clock(self, device_id, count=5, timeout=1.0):
+        """Estimate the clock offset of the device on the client it is routed to.
+
+        :param str device_id: a device id to which you want to send pings.
+        :param int count: (optional) number of ping exchanges
+        :param float timeout: (optional) seconds to wait for each answer
+        :rtype: :class:`ricohapi.cameractl.clock.ClockEstimate`
+        """
+        if self.__connected_at is None:
+            raise ClientError('You should connect to the server before calling sync_clock()')
+        return self.client(device_id).sync_clock(device_id, count=count, timeout=timeout)
+
+    @property
+    def stats(self):
+        """Get the aggregate number of messages and the rates per second since connected.
+
+        :rtype: PoolStats
+        """
+        published, acknowledged, in_flight = 0, 0, 0
+        for client in self.clients:
+            stats = client.stats
+            published += stats.published
+            acknowledged += stats.acknowledged
+            in_flight += stats.in_flight
+
+        elapsed = time.time() - self.__connected_at if self.__connected_at else 0
+        if elapsed > 0:
+            rates = (published / elapsed, acknowledged / elapsed)
+        else:
+            rates = (0.0, 0.0)
+        return PoolStats(published, acknowledged, in_flight, *rates)
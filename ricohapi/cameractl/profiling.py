@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""
+Camera remote control SDK profiling of a running listener
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, NullHandler, StreamHandler, DEBUG #pylint: disable=unused-import
+
+import json
+import os
+import signal
+import sys
+import threading
+import time
+try:
+    from time import thread_time as cpu_time
+except ImportError:
+    try:
+        from time import process_time as cpu_time
+    except ImportError:
+        from time import clock as cpu_time #python2, CPU time of the process
+
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+#LOG.setLevel(DEBUG)
+
+PROFILE_MODES = ('sample', 'cprofile')
+SAMPLE_INTERVAL = 0.005
+MAX_SECONDS = 600.0
+
+
+class CallbackStats(namedtuple('CallbackStats', ['name', 'calls', 'wall', 'cpu', 'max_wall'])):
+    """Timing of a callback.
+
+    name: name of the callback and the command, such as ``on_receive:shoot``.
+    calls: number of calls.
+    wall, cpu: total seconds of wall clock time and CPU time of the calling thread.
+    max_wall: longest wall clock time of a call.
+    """
+    __slots__ = ()
+
+    @property
+    def mean_wall(self):
+        """Mean seconds of wall clock time of a call."""
+        return self.wall / self.calls if self.calls else 0.0
+
+    def to_dict(self):
+        """Convert the timing to a dict in milliseconds."""
+        return {'name': self.name, 'calls': self.calls,
+                'wall_ms': round(self.wall * 1e3, 3), 'cpu_ms': round(self.cpu * 1e3, 3),
+                'max_wall_ms': round(self.max_wall * 1e3, 3),
+                'mean_wall_ms': round(self.mean_wall * 1e3, 3)}
+
+
+class Sampler(object):
+    """Samples the stacks of all the threads at an interval, with ``sys._current_frames``.
+       Unlike cProfile, it sees the threads which are already running
+       and does not slow the profiled code down.
+
+    :param float interval: (optional) seconds between samples
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = {}
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        """Start sampling on a background thread."""
+        self.__thread = threading.Thread(target=self.__run, name='profiling-sampler')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def collapsed(self):
+        """Format the stacks in the collapsed format of flamegraph.pl and speedscope,
+           a line of ``thread;outer;...;inner count`` per stack.
+
+        :rtype: list of str
+        """
+        return ['{0} {1}'.format(stack, count)
+                for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])]
+
+    def __run(self):
+        """Sample until stopped."""
+        own = threading.current_thread().ident
+        while not self.__stopped.wait(self.interval):
+            names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+            for ident, frame in sys._current_frames().items(): #pylint: disable=protected-access
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{0} ({1}:{2})'.format(code.co_name,
+                                                        os.path.basename(code.co_filename),
+                                                        code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+
+class Profiler(object):
+    """Opt-in profiling of a listener, to find hot spots under load without restarting it.
+
+    - :meth:`call` times each callback in wall clock and CPU time.
+      :class:`ricohapi.cameractl.client.Client` calls it when given the profiler.
+    - :meth:`capture` profiles for some seconds on demand, triggered by a signal
+      (see :meth:`install_signal`) or by a ``profile`` message
+      (see :meth:`ricohapi.cameractl.client.Client.request_profile`).
+      ``sample`` mode samples the stacks of all the threads.
+      ``cprofile`` mode runs the callbacks under cProfile, one at a time.
+
+    Each capture writes ``profile-<time>-<pid>-<n>.txt`` of collapsed stacks,
+    or ``.prof`` readable by ``pstats``, with ``.callbacks.json`` of the callback timings.
+
+    :param str directory: (optional) directory to write the captures in
+    :param float interval: (optional) seconds between samples in ``sample`` mode
+    """
+    def __init__(self, directory='.', interval=SAMPLE_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.__lock = threading.Lock()
+        self.__timings = {}
+        self.__captures = 0
+        self.__capture = None
+        self.__profiling = threading.Lock()
+
+    @property
+    def capturing(self):
+        """``True`` while a capture is running."""
+        return self.__capture is not None
+
+    def call(self, name, func, args=()):
+        """Call the function, recording its timing under the name.
+           The function is run under cProfile while a ``cprofile`` capture is running.
+
+        :param str name: name of the callback
+        :param function func: function to call
+        :param tuple args: (optional) func argument
+        """
+        capture = self.__capture
+        start, cpu_start = time.time(), cpu_time()
+        try:
+            if capture is None or capture['mode'] != 'cprofile':
+                return func(*args)
+            return self.__profile(capture['profile'], func, args)
+        finally:
+            self.record(name, time.time() - start, cpu_time() - cpu_start)
+
+    def record(self, name, wall, cpu):
+        """Record the timing of a call.
+
+        :param str name: name of the callback
+        :param float wall: seconds of wall clock time
+        :param float cpu: seconds of CPU time
+        """
+        with self.__lock:
+            calls, total_wall, total_cpu, max_wall = self.__timings.get(name, (0, 0.0, 0.0, 0.0))
+            self.__timings[name] = (calls + 1, total_wall + wall, total_cpu + cpu,
+                                    max(max_wall, wall))
+
+    def stats(self):
+        """Get the timings of the callbacks, the longest total first.
+
+        :rtype: list of CallbackStats
+        """
+        with self.__lock:
+            timings = [CallbackStats(name, *timing) for name, timing in self.__timings.items()]
+        return sorted(timings, key=lambda stats: -stats.wall)
+
+    def reset(self):
+        """Clear the timings."""
+        with self.__lock:
+            self.__timings.clear()
+
+    def capture(self, seconds=30.0, mode='sample'):
+        """Start profiling for the seconds. Returns at once.
+           A capture is ignored while another one is running.
+
+        :param float seconds: (optional) seconds to profile, up to ``MAX_SECONDS``
+        :param str mode: (optional) ``'sample'`` or ``'cprofile'``
+        :rtype: str or None
+        :returns: path of the profile to be written, or ``None`` if ignored.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError('mode must be one of ' + ', '.join(PROFILE_MODES))
+        seconds = min(max(float(seconds), 0.0), MAX_SECONDS)
+
+        with self.__lock:
+            if self.__capture is not None:
+                LOG.warning('a profile is being captured. ignored another one.')
+                return None
+            self.__captures += 1
+            path = os.path.join(self.directory, 'profile-{0}-{1}-{2}.{3}'.format(
+                time.strftime('%Y%m%d-%H%M%S'), os.getpid(), self.__captures,
+                'txt' if mode == 'sample' else 'prof'))
+            capture = {'mode': mode, 'path': path, 'start': time.time(),
+                       'sampler': None, 'profile': None}
+            if mode == 'sample':
+                capture['sampler'] = Sampler(self.interval)
+                capture['sampler'].start()
+            else:
+                import cProfile # imported on demand, since every client imports this module.
+                capture['profile'] = cProfile.Profile()
+            capture['timer'] = threading.Timer(seconds, self.__finish, (capture,))
+            capture['timer'].daemon = True
+            self.__capture = capture
+        capture['timer'].start()
+        LOG.info('profiling %s for %.1f sec to %s', mode, seconds, path)
+        return path
+
+    def stop(self):
+        """Finish the running capture now.
+
+        :rtype: str or None
+        :returns: path of the written profile, or ``None`` if no capture is running.
+        """
+        capture = self.__capture
+        if capture is None:
+            return None
+        capture['timer'].cancel()
+        self.__finish(capture)
+        return capture['path']
+
+    def install_signal(self, signum=None, seconds=30.0, mode='sample'):
+        """Capture a profile when the process receives the signal,
+           e.g. ``kill -USR1 <pid>``. Call it from the main thread.
+
+        :param int signum: (optional) signal number. default to ``SIGUSR1``.
+        :param float seconds: (optional) seconds to profile
+        :param str mode: (optional) ``'sample'`` or ``'cprofile'``
+        """
+        if signum is None:
+            signum = getattr(signal, 'SIGUSR1', None)
+            if signum is None:
+                raise ValueError('SIGUSR1 is not supported on this platform.')
+        if mode not in PROFILE_MODES:
+            raise ValueError('mode must be one of ' + ', '.join(PROFILE_MODES))
+
+        def on_signal(signum, frame): #pylint: disable=unused-argument
+            # the capture takes the lock, which the interrupted main thread may hold.
+            thread = threading.Thread(target=self.capture, args=(seconds, mode))
+            thread.daemon = True
+            thread.start()
+        signal.signal(signum, on_signal)
+
+    def __profile(self, profile, func, args):
+        """Run the function under cProfile, unless another callback is being profiled."""
+        if not self.__profiling.acquire(False):
+            return func(*args)
+        try:
+            try:
+                profile.enable()
+            except ValueError as err: #another profiler is active in python 3.12 or later
+                LOG.debug('could not profile a callback: %s', err)
+                return func(*args)
+            try:
+                return func(*args)
+            finally:
+                profile.disable()
+        finally:
+            self.__profiling.release()
+
+    def __finish(self, capture):
+        """Write the capture."""
+        with self.__lock:
+            if self.__capture is not capture:
+                return
+            self.__capture = None
+        path = capture['path']
+        try:
+            if capture['sampler'] is not None:
+                capture['sampler'].stop()
+                with open(path, 'w') as fptr:
+                    for line in capture['sampler'].collapsed():
+                        fptr.write(line + '\n')
+            else:
+                with self.__profiling:
+                    capture['profile'].dump_stats(path)
+            with open(os.path.splitext(path)[0] + '.callbacks.json', 'w') as fptr:
+                json.dump({'start': capture['start'], 'end': time.time(), 'mode': capture['mode'],
+                           'callbacks': [stats.to_dict() for stats in self.stats()]},
+                          fptr, indent=2, sort_keys=True)
+        except (IOError, OSError) as err:
+            LOG.warning('could not write the profile: %s', err)
+            return
+        LOG.info('wrote the profile to %s', path)
+
+
+def open_profiler(directory, seconds=30.0, mode='sample'):
+    """Make a profiler writing to the directory, made if missing,
+       which captures a profile on ``SIGUSR1`` where the platform and the thread allow it.
+
+    :param str directory: directory to write the captures in
+    :param float seconds: (optional) seconds to profile on the signal
+    :param str mode: (optional) ``'sample'`` or ``'cprofile'`` on the signal
+    :rtype: Profiler
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    profiler = Profiler(directory)
+    try:
+        profiler.install_signal(seconds=seconds, mode=mode)
+    except ValueError as err: #no SIGUSR1, or not the main thread
+        LOG.warning('profiles are captured only on request: %s', err)
+    else:
+        LOG.info('kill -USR1 %d to capture a profile in %s', os.getpid(), directory)
+    return profiler
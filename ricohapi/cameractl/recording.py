@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""
+Camera remote control SDK recording and replay of received messages
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, NullHandler, StreamHandler, DEBUG #pylint: disable=unused-import
+
+import heapq
+import os
+import struct
+import threading
+import time
+from ricohapi.cameractl.clock import monotonic
+
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+#LOG.setLevel(DEBUG)
+
+MAGIC = b'RCMR\x01'
+RECORD_HEADER = struct.Struct(str('>dHI'))
+FLUSH_INTERVAL = 1.0
+
+
+class Record(namedtuple('Record', ['received', 'topic', 'payload'])):
+    """A received message.
+
+    received: Unix time when the message is received.
+    topic: full topic of the message, starting with the user id.
+    payload: encoded payload as it is received.
+    """
+    __slots__ = ()
+
+
+class ReplayStats(namedtuple('ReplayStats', ['messages', 'elapsed', 'mean_lag', 'max_lag'])):
+    """Result of a replay.
+
+    messages: number of the messages published.
+    elapsed: seconds of the replay.
+    mean_lag, max_lag: seconds each message is published after it is due.
+                       large lags mean that the publisher could not keep up with the speed.
+    """
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        """Messages published per second."""
+        return self.messages / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class Recorder(object): #pylint: disable=too-many-instance-attributes
+    """Records received messages to a binary log, to replay the traffic later.
+       Pass it to :class:`ricohapi.cameractl.client.Client` as ``recorder``.
+
+    The log starts with ``MAGIC``, followed by a record per message of
+    the arrival time as a double, the topic length as uint16, the payload length as uint32,
+    all big endian, the utf-8 topic and the payload.
+    Records are appended to an existing log, after cutting off a record left incomplete
+    by a recorder which is killed. Each costs 14 bytes and the message.
+
+    :param str path: path to the log
+    :param int max_bytes: (optional) size of the log to stop recording at. if ``None``, no limit.
+    """
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.records = 0
+        self.dropped = 0
+        self.__lock = threading.Lock()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            end = _complete_end(path)
+            self.__file = open(path, 'r+b')
+            if os.path.getsize(path) > end:
+                LOG.warning('cut off the last record of %s, which is incomplete.', path)
+                self.__file.truncate(end)
+            self.__file.seek(end)
+        else:
+            self.__file = open(path, 'wb')
+            self.__file.write(MAGIC)
+        self.__size = self.__file.tell()
+        self.__flushed = monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record(self, topic, payload, received=None):
+        """Append a message to the log.
+
+        :param str topic: full topic of the message
+        :param bytes payload: payload as it is received
+        :param float received: (optional) Unix time when the message is received. default to now.
+        """
+        if received is None:
+            received = time.time()
+        topic = topic.encode('utf-8') if not isinstance(topic, bytes) else topic
+        payload = bytes(payload)
+        data = RECORD_HEADER.pack(received, len(topic), len(payload)) + topic + payload
+        with self.__lock:
+            if self.__file is None or (self.max_bytes is not None and
+                                       self.__size + len(data) > self.max_bytes):
+                self.dropped += 1
+                return
+            self.__file.write(data)
+            self.__size += len(data)
+            self.records += 1
+            if monotonic() - self.__flushed >= FLUSH_INTERVAL:
+                self.__file.flush()
+                self.__flushed = monotonic()
+
+    def close(self):
+        """Flush and close the log."""
+        with self.__lock:
+            if self.__file is None:
+                return
+            self.__file.close()
+            self.__file = None
+        LOG.debug('recorded %d messages to %s, dropped %d', self.records, self.path, self.dropped)
+
+
+def _check_magic(path):
+    """Check that the file is a log of :class:`Recorder`."""
+    with open(path, 'rb') as fptr:
+        if fptr.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{0} is not a message log.'.format(path))
+
+
+def _complete_end(path):
+    """Get the offset after the last complete record of the log."""
+    _check_magic(path)
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fptr:
+        end = len(MAGIC)
+        fptr.seek(end)
+        while True:
+            header = fptr.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return end
+            _, topic_len, payload_len = RECORD_HEADER.unpack(header)
+            next_end = end + RECORD_HEADER.size + topic_len + payload_len
+            if next_end > size:
+                return end
+            fptr.seek(next_end)
+            end = next_end
+
+
+def read_records(path):
+    """Read the messages of a log written by :class:`Recorder`.
+       A record cut off at the end, by a recorder which is killed, is ignored.
+
+    :param str path: path to the log
+    :rtype: iterator of Record
+    """
+    _check_magic(path)
+    with open(path, 'rb') as fptr:
+        fptr.seek(len(MAGIC))
+        while True:
+            header = fptr.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) < RECORD_HEADER.size:
+                break
+            received, topic_len, payload_len = RECORD_HEADER.unpack(header)
+            body = fptr.read(topic_len + payload_len)
+            if len(body) < topic_len + payload_len:
+                break
+            yield Record(received, body[:topic_len].decode('utf-8'), body[topic_len:])
+    LOG.warning('ignored the last record of %s, which is cut off.', path)
+
+
+def merge_records(paths):
+    """Read the messages of the logs, e.g. of the worker processes, in the order received.
+
+    :param paths: paths to the logs
+    :rtype: iterator of Record
+    """
+    return heapq.merge(*[read_records(path) for path in paths])
+
+
+def replay(client, records, speed=1.0, device_id=None, stop_event=None):
+    """Publish the recorded messages again, keeping the intervals between them.
+
+    Each message is due at its arrival time from the first one, divided by the speed,
+    on the monotonic clock, so that slow publishes do not accumulate.
+    The payload is published as recorded, under the user id of the client,
+    so that a local broker and listener receive the recorded traffic shape.
+
+    :param client: a connected :class:`ricohapi.cameractl.client.Client`
+    :param records: iterable of Record
+    :param float speed: (optional) times faster than recorded.
+                        if ``None`` or 0, as fast as possible.
+    :param str device_id: (optional) device id to send all the messages to,
+                          instead of the recorded ones.
+    :param stop_event: (optional) :class:`threading.Event` to stop the replay early
+    :rtype: ReplayStats
+    """
+    if speed is not None and speed < 0:
+        raise ValueError('speed must be 0 or more.')
+    count = 0
+    lags = 0.0
+    max_lag = 0.0
+    first = None
+    start = monotonic()
+    for record in records:
+        if stop_event is not None and stop_event.is_set():
+            break
+        levels = record.topic.split('/')[1:]
+        if device_id is not None:
+            levels[-1] = device_id
+        if first is None:
+            first = record.received
+        if speed:
+            due = start + (record.received - first) / speed
+            _sleep_until(due, stop_event)
+            lag = max(monotonic() - due, 0.0)
+            lags += lag
+            max_lag = max(max_lag, lag)
+        client.publish('/'.join(levels), message=bytearray(record.payload))
+        count += 1
+
+    stats = ReplayStats(count, monotonic() - start, lags / count if count else 0.0, max_lag)
+    LOG.info('replayed %d messages in %.2f sec (%.0f msg/s), lag max %.1f ms', stats.messages,
+             stats.elapsed, stats.rate, stats.max_lag * 1e3)
+    return stats
+
+
+def _sleep_until(due, stop_event=None):
+    """Sleep until the monotonic clock time, or until the event is set."""
+    wait = due - monotonic()
+    if wait <= 0:
+        return
+    if stop_event is not None:
+        stop_event.wait(wait)
+    else:
+        time.sleep(wait)
+
+
+def record_path(path, pid=None):
+    """Get the path of the log of a process, for listeners in several processes.
+
+    :param str path: base path of the logs
+    :param int pid: (optional) process id. default to the current process.
+    :rtype: str
+    """
+    return '{0}.{1}'.format(path, os.getpid() if pid is None else pid)
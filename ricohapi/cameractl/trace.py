@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""
+Camera remote control SDK tracing of a shot from the sender to the saved file
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from logging import getLogger, NullHandler, StreamHandler, DEBUG #pylint: disable=unused-import
+
+import json
+import threading
+import time
+import uuid
+
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+#LOG.setLevel(DEBUG)
+
+MEMORY_SPANS = 10000
+
+_LOCAL = threading.local()
+
+
+class Span(namedtuple('Span', ['trace_id', 'name', 'start', 'end', 'attrs'])):
+    """A timed step of a trace.
+
+    trace_id: id of the trace.
+    name: name of the step, such as ``publish`` or ``camera.takePicture``.
+    start, end: Unix times of the step.
+    attrs: dict of additional attributes.
+    """
+    __slots__ = ()
+
+    @property
+    def duration(self):
+        """Seconds spent on the step."""
+        return self.end - self.start
+
+    def to_json(self):
+        """Encode the span as a line of JSON."""
+        record = {'trace': self.trace_id, 'span': self.name, 'start': self.start,
+                  'end': self.end, 'ms': round(self.duration * 1e3, 3)}
+        record.update(self.attrs)
+        return json.dumps(record, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, line):
+        """Decode a line of JSON written by :meth:`to_json`."""
+        record = json.loads(line)
+        trace_id, name = record.pop('trace'), record.pop('span')
+        start, end = record.pop('start'), record.pop('end')
+        record.pop('ms', None)
+        return cls(trace_id, name, start, end, record)
+
+
+def new_trace_id():
+    """Make a new trace id.
+
+    :rtype: str
+    """
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id():
+    """Get the trace id activated in this thread, e.g. in a ``listen`` callback.
+
+    :rtype: str or None
+    """
+    return getattr(_LOCAL, 'trace_id', None)
+
+
+@contextmanager
+def activate(trace_id):
+    """Make the trace id current in this thread while the ``with`` block is executed.
+
+    :param str trace_id: trace id, or ``None`` to trace nothing
+    """
+    previous = current_trace_id()
+    _LOCAL.trace_id = trace_id
+    try:
+        yield trace_id
+    finally:
+        _LOCAL.trace_id = previous
+
+
+class Tracer(object):
+    """Records the spans of traces.
+
+    Spans are written to the sink as JSON lines, or kept in memory without a sink.
+    Spans without a trace id are not recorded, so that untraced shots cost nothing.
+
+    :param sink: (optional) file-like object to write JSON lines to
+    """
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.__lock = threading.Lock()
+        self.__spans = deque(maxlen=MEMORY_SPANS)
+
+    def record(self, name, start, end, trace_id=None, **attrs):
+        """Record a span.
+
+        :param str name: name of the step
+        :param float start: Unix time when the step started
+        :param float end: Unix time when the step ended
+        :param str trace_id: (optional) trace id. default to the current one.
+        """
+        trace_id = trace_id or current_trace_id()
+        if trace_id is None:
+            return
+        span = Span(trace_id, name, start, end, attrs)
+        with self.__lock:
+            if self.sink is None:
+                self.__spans.append(span)
+                return
+            try:
+                self.sink.write(span.to_json() + '\n')
+                self.sink.flush()
+            except (IOError, ValueError) as err:
+                LOG.warning('could not write a span: %s', err)
+
+    @contextmanager
+    def span(self, name, trace_id=None, **attrs):
+        """Record the ``with`` block as a span.
+           Attributes can be added to the yielded dict while the block is executed.
+
+        :param str name: name of the step
+        :param str trace_id: (optional) trace id. default to the current one.
+        """
+        start = time.time()
+        try:
+            yield attrs
+        except Exception as err:
+            attrs['error'] = str(err) or err.__class__.__name__
+            raise
+        finally:
+            self.record(name, start, time.time(), trace_id, **attrs)
+
+    def spans(self, trace_id=None):
+        """Get the spans kept in memory.
+
+        :param str trace_id: (optional) trace id. if ``None``, all traces.
+        :rtype: list of Span
+        """
+        with self.__lock:
+            return [span for span in self.__spans if trace_id in (None, span.trace_id)]
+
+
+def load_spans(path, trace_id=None):
+    """Read spans written as JSON lines.
+
+    :param str path: path to the JSON lines file
+    :param str trace_id: (optional) trace id. if ``None``, all traces.
+    :rtype: list of Span
+    """
+    spans = []
+    with open(path) as fptr:
+        for line in fptr:
+            if line.strip():
+                span = Span.from_json(line)
+                if trace_id in (None, span.trace_id):
+                    spans.append(span)
+    return spans
+
+
+def timeline(spans):
+    """Format the spans of a trace as a timeline, in milliseconds from the first start.
+
+    :param spans: spans of a trace
+    :rtype: list of str
+    """
+    spans = sorted(spans, key=lambda span: (span.start, -span.end))
+    if not spans:
+        return []
+    origin = spans[0].start
+    return ['{0:>10.1f} {1:>10.1f} ms  {2}'.format((span.start - origin) * 1e3,
+                                                    span.duration * 1e3, span.name)
+            for span in spans]
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""Admission control of the commands to a RICOH THETA which can shoot one at a time"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import deque, namedtuple
+from logging import getLogger, StreamHandler
+import threading
+import time
+from ricohapi.cameractl.clock import monotonic
+from ricohapi.cameractl.trace import activate, current_trace_id
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+
+POLICIES = ('queue', 'latest', 'reject')
+QUEUE_LIMIT = 4
+
+
+class Admission(namedtuple('Admission', ['accepted', 'reason', 'depth'])):
+    """Result of submitting a command.
+
+    accepted: ``True`` if the command is going to run.
+    reason: why the command is rejected, or ``None``.
+    depth: number of commands waiting after the submission.
+    """
+    __slots__ = ()
+
+
+class ExecutorStats(namedtuple('ExecutorStats', [
+        'accepted', 'rejected', 'collapsed', 'expired', 'completed', 'failed'])):
+    """Numbers of the commands submitted to an executor.
+
+    accepted, rejected: commands admitted and refused on submission.
+    collapsed: commands replaced by a newer one with the ``latest`` policy.
+    expired: commands dropped because they waited too long or the camera stayed busy.
+    completed, failed: commands which ran and returned or raised an exception.
+    """
+    __slots__ = ()
+
+
+def theta_busy(theta):
+    """Check if the camera is capturing, from ``_captureStatus`` of ``get_state``.
+
+    :param theta: a :class:`thetav2.ThetaV2` instance
+    :rtype: bool
+    """
+    return theta.get_state()['state'].get('_captureStatus', 'idle') != 'idle'
+
+
+class CameraExecutor(object): #pylint: disable=too-many-instance-attributes
+    """Runs the commands to a camera one at a time on a worker thread.
+
+    A burst of commands is admitted by the policy, instead of piling up in front of the camera:
+
+    - ``queue``: the commands wait in order, up to ``max_queue``. more are rejected.
+    - ``latest``: only the newest command waits. an older waiting one is collapsed into it.
+    - ``reject``: a command is rejected while another one is running or waiting.
+
+    Before running a command, the worker waits until ``is_busy`` returns ``False``,
+    so that the command does not fail because the camera is still capturing.
+    The trace id current on submission is made current while the command runs.
+
+    :param str policy: (optional) ``'queue'``, ``'latest'`` or ``'reject'``
+    :param int max_queue: (optional) maximum number of waiting commands with ``queue``
+    :param function is_busy: (optional) function which returns ``True`` if the camera is busy
+    :param float max_age: (optional) seconds a command may wait before it runs.
+                          older commands are dropped. if ``None``, waits forever.
+    :param float busy_timeout: (optional) seconds to wait for a busy camera
+                               before dropping the command
+    :param float poll_interval: (optional) seconds between checks of a busy camera
+    """
+    def __init__(self, policy='queue', max_queue=QUEUE_LIMIT, #pylint: disable=too-many-arguments
+                 is_busy=None, max_age=None, busy_timeout=30.0, poll_interval=0.2):
+        if policy not in POLICIES:
+            raise ValueError('policy must be one of ' + ', '.join(POLICIES))
+        if max_queue < 1:
+            raise ValueError('max_queue must be 1 or more.')
+
+        self.policy = policy
+        self.max_queue = max_queue if policy == 'queue' else 1
+        self.is_busy = is_busy
+        self.max_age = max_age
+        self.busy_timeout = busy_timeout
+        self.poll_interval = poll_interval
+        self.__condition = threading.Condition()
+        self.__waiting = deque()
+        self.__running = False
+        self.__stopped = False
+        self.__counts = dict((name, 0) for name in ExecutorStats._fields)
+        self.__worker = threading.Thread(target=self.__work)
+        self.__worker.daemon = True
+        self.__worker.start()
+
+    def __len__(self):
+        with self.__condition:
+            return len(self.__waiting)
+
+    @property
+    def busy(self):
+        """``True`` while a command is running or waiting."""
+        with self.__condition:
+            return self.__running or bool(self.__waiting)
+
+    @property
+    def stats(self):
+        """Get the numbers of the commands.
+
+        :rtype: ExecutorStats
+        """
+        with self.__condition:
+            return ExecutorStats(**self.__counts)
+
+    def submit(self, func, *args):
+        """Submit a command. Returns at once without waiting for it to run.
+
+        :param function func: command to run
+        :param args: func argument
+        :rtype: Admission
+        """
+        with self.__condition:
+            if self.__stopped:
+                return self.__reject('executor is stopped')
+            if self.policy == 'reject' and (self.__running or self.__waiting):
+                return self.__reject('camera is busy')
+            if self.policy == 'latest' and self.__waiting:
+                self.__waiting.clear()
+                self.__counts['collapsed'] += 1
+            if len(self.__waiting) >= self.max_queue:
+                return self.__reject('queue is full')
+
+            self.__waiting.append((monotonic(), current_trace_id(), func, args))
+            self.__counts['accepted'] += 1
+            self.__condition.notify()
+            return Admission(True, None, len(self.__waiting))
+
+    def join(self, timeout=None):
+        """Wait until no command is running or waiting.
+
+        :param float timeout: (optional) seconds to wait. if ``None``, waits forever.
+        :rtype: bool
+        :returns: ``False`` if timed out.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self.__condition:
+            while self.__running or self.__waiting:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__condition.wait(remaining)
+        return True
+
+    def stop(self):
+        """Stop the worker after the running command. Waiting commands are discarded."""
+        with self.__condition:
+            self.__stopped = True
+            self.__waiting.clear()
+            self.__condition.notify_all()
+        self.__worker.join()
+
+    def __reject(self, reason):
+        """Count a rejected command. Called with the lock held."""
+        self.__counts['rejected'] += 1
+        return Admission(False, reason, len(self.__waiting))
+
+    def __count(self, name):
+        """Count a command which is done, and wake up :meth:`join`."""
+        with self.__condition:
+            self.__counts[name] += 1
+            self.__running = False
+            self.__condition.notify_all()
+
+    def __wait_idle(self):
+        """Wait until the camera is not busy.
+
+        :rtype: bool
+        :returns: ``False`` if the camera stays busy for ``busy_timeout``.
+        """
+        if self.is_busy is None:
+            return True
+        deadline = monotonic() + self.busy_timeout
+        while True:
+            try:
+                if not self.is_busy():
+                    return True
+            except Exception as err: #pylint: disable=broad-except
+                LOG.debug('could not get the camera state: %s', err)
+                return True
+            if monotonic() >= deadline or self.__stopped:
+                return False
+            time.sleep(self.poll_interval)
+
+    def __work(self):
+        """Run the waiting commands one at a time until stopped."""
+        while True:
+            with self.__condition:
+                while not self.__waiting and not self.__stopped:
+                    self.__condition.wait()
+                if self.__stopped:
+                    return
+                queued, trace_id, func, args = self.__waiting.popleft()
+                self.__running = True
+
+            waited = monotonic() - queued
+            if self.max_age is not None and waited > self.max_age:
+                LOG.warning('dropped a command which waited %.1f sec.', waited)
+                self.__count('expired')
+                continue
+            if not self.__wait_idle():
+                LOG.warning('dropped a command since the camera stays busy.')
+                self.__count('expired')
+                continue
+
+            try:
+                with activate(trace_id):
+                    func(*args)
+            except Exception as err: #pylint: disable=broad-except
+                LOG.warning(err)
+                self.__count('failed')
+            else:
+                self.__count('completed')
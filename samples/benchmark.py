@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+"""
+Micro benchmarks for the samples.
+
+USAGE
+  benchmark.py [name ...]
+
+BENCHMARKS
+  codec               encode and decode shooting messages
+  exposure            validate iso values and shutter speeds
+  preview             parse live preview MJPEG streams
+  publish             publish through a local broker with connection profiles.
+                      set MQTT_HOST and MQTT_PORT to change the broker from localhost:1883
+  replay              replay bursty recorded traffic to a listener at 1x, 10x and max speed.
+                      the broker is the same as publish
+  startup             import remocon.py and remocond.py, and start a process up to
+                      the first shot acknowledged. the broker is the same as publish
+  threads             shoot from many threads sharing a client, with and without a global lock.
+                      the broker is the same as publish
+  topic               match received topics to subscriptions
+
+EXAMPLE
+  python benchmark.py
+  python benchmark.py exposure
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import OrderedDict, namedtuple
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    """Register a benchmark function by its name."""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def measure(label, func, number=10000, repeat=3):
+    """Measure and print the best time per call.
+
+    :param str label: label to print
+    :param function func: function to measure, called without arguments
+    :param int number: number of calls in a repetition
+    :param int repeat: number of repetitions
+    :rtype: float
+    :returns: seconds per call
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print('{0:<40} {1:>12.3f} usec/call'.format(label, best * 1e6))
+    return best
+
+
+@benchmark
+def codec():
+    """Encode and decode shooting messages."""
+    from ricohapi.cameractl.codec import CompactCodec, MsgpackCodec, decode_payload
+
+    payloads = [('no param', {'c': 'shoot', 't': 1478000000}),
+                ('exposure', {'c': 'shoot', 't': 1478000000,
+                              'p': {'_iso': 200, '_shutterSpeed': 0.01}}),
+                ('large param', {'c': 'shoot', 't': 1478000000,
+                                 'p': {'_note': 'camera control ' * 100}})]
+    codecs = [('msgpack', MsgpackCodec()), ('compact', CompactCodec()),
+              ('compact+zlib', CompactCodec(compression='zlib'))]
+
+    for label, payload in payloads:
+        for name, payload_codec in codecs:
+            encoded = payload_codec.encode(payload)
+            print('codec: {0}, {1}: {2} bytes'.format(label, name, len(encoded)))
+            measure('codec: {0}, {1} encode'.format(label, name),
+                    lambda: payload_codec.encode(payload)) #pylint: disable=cell-var-from-loop
+            measure('codec: {0}, {1} decode'.format(label, name),
+                    lambda: decode_payload(encoded)) #pylint: disable=cell-var-from-loop
+
+
+@benchmark
+def exposure():
+    """Validate iso values and shutter speeds."""
+    from exposure import DEFAULT_TABLE, ISO_VALUES, SHUTTER_SPEEDS
+
+    def linear_scan(iso, s_speed):
+        """The lookup before the tables are precomputed."""
+        authorized_iso = list(ISO_VALUES)
+        authorized_ss_frac = [frac for frac, _ in SHUTTER_SPEEDS]
+        authorized_ss = [speed for _, speed in SHUTTER_SPEEDS]
+        if not iso in authorized_iso:
+            raise ValueError
+        for (frac, speed) in zip(authorized_ss_frac, authorized_ss):
+            if s_speed in (frac, speed):
+                return (iso, speed)
+        raise ValueError
+
+    measure('exposure: linear scan, fraction', lambda: linear_scan(1600, '60/1'))
+    measure('exposure: table, fraction', lambda: DEFAULT_TABLE.validate(1600, '60/1'))
+    measure('exposure: linear scan, float', lambda: linear_scan(1600, 30))
+    measure('exposure: table, float', lambda: DEFAULT_TABLE.validate(1600, 30))
+
+
+@benchmark
+def preview(frames=30, frame_size=40000, chunk_size=64 * 1024):
+    """Parse a live preview MJPEG stream."""
+    from preview import FrameParser, JPEG_EOI, JPEG_SOI
+
+    frame = JPEG_SOI + b'x' * frame_size + JPEG_EOI
+    part = (b'--boundary\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n') * frames
+    chunks = [part[pos:pos + chunk_size] for pos in range(0, len(part), chunk_size)]
+
+    def concatenate():
+        """Parse by concatenating and slicing bytes."""
+        buf = b''
+        count = 0
+        for chunk in chunks:
+            buf += chunk
+            while True:
+                start = buf.find(JPEG_SOI)
+                end = buf.find(JPEG_EOI, start + 2) if start >= 0 else -1
+                if end < 0:
+                    break
+                _ = buf[start:end + 2]
+                buf = buf[end + 2:]
+                count += 1
+        return count
+
+    parser = FrameParser()
+
+    def preallocated():
+        """Parse with the preallocated buffer."""
+        count = 0
+        for chunk in chunks:
+            parser.feed(chunk)
+            count += len(parser.frames())
+        return count
+
+    for label, func in [('preview: concatenate bytes', concatenate),
+                        ('preview: FrameParser', preallocated)]:
+        if func() != frames:
+            raise AssertionError('{0} found wrong number of frames.'.format(label))
+        best = measure(label, func, number=100) / frames
+        print('{0:<40} {1:>12.0f} frames/sec'.format('', 1 / best))
+
+
+@benchmark
+def publish(count=2000, size=64): #pylint: disable=too-many-locals
+    """Publish through a local broker with several connection profiles."""
+    from ricohapi.cameractl.mqtt_client import ConnectionProfile, MQTTClient
+
+    broker_info = namedtuple('inf', ['uid', 'cid', 'token', 'host', 'port'])(
+        'bench', None, None, os.environ.get('MQTT_HOST', 'localhost'),
+        int(os.environ.get('MQTT_PORT', '1883')))
+    profiles = [
+        ('qos0', ConnectionProfile(publish_qos=0, subscribe_qos=0, tls=False)),
+        ('qos1, max_inflight 1', ConnectionProfile(max_inflight=1, tls=False)),
+        ('qos1, max_inflight 20', ConnectionProfile(max_inflight=20, tls=False)),
+        ('qos1, max_inflight 100', ConnectionProfile(max_inflight=100, tls=False)),
+        ('qos1, max_inflight 100, 256KB buffers',
+         ConnectionProfile(max_inflight=100, send_buffer=262144, recv_buffer=262144, tls=False))]
+    padding = b'\0' * max(size - 8, 0)
+
+    def on_receive(msg, latencies, done):
+        """Record the latency from the time packed in the message."""
+        latencies.append(time.time() - struct.unpack(str('>d'), bytes(msg.payload[:8]))[0])
+        if len(latencies) == count:
+            done.set()
+
+    for label, profile in profiles:
+        latencies = []
+        done = threading.Event()
+
+        with MQTTClient(None, None) as client:
+            try:
+                client.connect(broker_info.uid, None, None,
+                               broker_info=broker_info, profile=profile)
+            except socket.error as err:
+                print('publish: could not connect to {0}:{1}. {2}'.format(
+                    broker_info.host, broker_info.port, err))
+                return
+            client.subscribe('bench/publish', func=on_receive, fargs=(latencies, done))
+            time.sleep(0.5)
+
+            start = time.time()
+            for _ in range(count):
+                client.publish('bench/publish', struct.pack(str('>d'), time.time()) + padding)
+            done.wait(60)
+            elapsed = time.time() - start
+            client.disconnect()
+
+        latencies.sort()
+        if not latencies:
+            print('publish: {0}: no message received'.format(label))
+            continue
+        print('publish: {0:<40} {1:>8.0f} msg/s, latency median {2:.1f} ms, '
+              'p99 {3:.1f} ms, received {4}/{5}'.format(
+                  label, len(latencies) / elapsed, latencies[len(latencies) // 2] * 1e3,
+                  latencies[int(len(latencies) * 0.99)] * 1e3, len(latencies), count))
+
+
+@benchmark
+def threads(count=8000, think=0.001): #pylint: disable=too-many-locals
+    """Shoot from many threads sharing a client, like the request threads of a web service."""
+    from ricohapi.cameractl.client import Client
+    from ricohapi.cameractl.mqtt_client import ConnectionProfile
+
+    broker_info = namedtuple('inf', ['uid', 'cid', 'token', 'host', 'port'])(
+        'bench', None, None, os.environ.get('MQTT_HOST', 'localhost'),
+        int(os.environ.get('MQTT_PORT', '1883')))
+
+    with Client(None, None) as client:
+        try:
+            client.connect(broker_info.uid, None, None, broker_info=broker_info,
+                           profile=ConnectionProfile(max_inflight=100, tls=False))
+        except socket.error as err:
+            print('threads: could not connect to {0}:{1}. {2}'.format(
+                broker_info.host, broker_info.port, err))
+            return
+        time.sleep(0.5)
+
+        for workers in (1, 8, 32):
+            for label, lock in (('shared', None), ('global lock', threading.Lock())):
+                durations = []
+
+                def shoot(number):
+                    """Shoot with a pause between the calls, and record the call durations."""
+                    mine = []
+                    for _ in range(number):
+                        start = time.time()
+                        if lock is None: #pylint: disable=cell-var-from-loop
+                            client.shoot('DEV01')
+                        else:
+                            with lock: #pylint: disable=cell-var-from-loop
+                                client.shoot('DEV01')
+                        mine.append(time.time() - start)
+                        time.sleep(think)
+                    durations.extend(mine) #pylint: disable=cell-var-from-loop
+
+                shooters = [threading.Thread(target=shoot, args=(count // workers,))
+                            for _ in range(workers)]
+                start = time.time()
+                for shooter in shooters:
+                    shooter.start()
+                for shooter in shooters:
+                    shooter.join()
+                elapsed = time.time() - start
+
+                durations.sort()
+                print('threads: {0:>2} threads, {1:<12} {2:>8.0f} shoot/s, call median {3:.3f} ms, '
+                      'p99 {4:.2f} ms'.format(
+                          workers, label, len(durations) / elapsed,
+                          durations[len(durations) // 2] * 1e3,
+                          durations[int(len(durations) * 0.99)] * 1e3))
+        client.disconnect()
+
+
+@benchmark
+def replay(bursts=20, burst_size=100, gap=0.1): #pylint: disable=too-many-locals
+    """Replay recorded traffic of bursts of shots to a listener, and count what it receives."""
+    from ricohapi.cameractl import recording
+    from ricohapi.cameractl.client import Client
+    from ricohapi.cameractl.codec import CompactCodec
+    from ricohapi.cameractl.mqtt_client import ConnectionProfile
+
+    broker_info = namedtuple('inf', ['uid', 'cid', 'token', 'host', 'port'])(
+        'bench', None, None, os.environ.get('MQTT_HOST', 'localhost'),
+        int(os.environ.get('MQTT_PORT', '1883')))
+    log_dir = tempfile.mkdtemp()
+    traffic = os.path.join(log_dir, 'traffic.log')
+    payload = CompactCodec().encode({'c': 'shoot', 't': 0, 'p': {'_iso': 100}})
+    with recording.Recorder(traffic) as recorder:
+        for burst in range(bursts):
+            for count in range(burst_size):
+                recorder.record('user01/camera/DEV{0:02d}'.format(count % 8), payload,
+                                1000.0 + burst * gap + count * 1e-4)
+
+    received = []
+    done = threading.Event()
+
+    def on_receive(*args): #pylint: disable=unused-argument
+        """Count the shots."""
+        received.append(time.time())
+        if len(received) == bursts * burst_size:
+            done.set()
+
+    profile = ConnectionProfile(max_inflight=100, tls=False)
+    try:
+        with Client(None, None) as listener, Client(None, None) as sender:
+            try:
+                listener.connect(broker_info.uid, None, None, broker_info=broker_info,
+                                 profile=profile)
+                sender.connect(broker_info.uid, None, None, broker_info=broker_info,
+                               profile=profile)
+            except socket.error as err:
+                print('replay: could not connect to {0}:{1}. {2}'.format(
+                    broker_info.host, broker_info.port, err))
+                return
+            listener.listen('DEV01', func=on_receive)
+            time.sleep(0.5)
+
+            for speed in (1.0, 10.0, 0):
+                del received[:]
+                done.clear()
+                stats = recording.replay(sender, recording.read_records(traffic), speed=speed,
+                                         device_id='DEV01')
+                done.wait(30)
+                elapsed = (received[-1] - received[0]) if len(received) > 1 else 0.0
+                print('replay: {0:<6} {1:>8.0f} msg/s published in {2:.2f} sec, '
+                      'lag max {3:.1f} ms, received {4}/{5} in {6:.2f} sec'.format(
+                          '{0:g}x'.format(speed) if speed else 'max', stats.rate, stats.elapsed,
+                          stats.max_lag * 1e3, len(received), stats.messages, elapsed))
+            listener.disconnect()
+            sender.disconnect()
+    finally:
+        shutil.rmtree(log_dir)
+
+
+@benchmark
+def startup():
+    """Start a new process up to importing remocon.py, and up to its first shot."""
+    samples_dir = os.path.dirname(os.path.abspath(__file__))
+    loaded = ('import sys, remocon; '
+              'print(" ".join(name for name in ("requests", "thetav2", "gateway") '
+              'if name in sys.modules))')
+    # the shoot command of remocon.main, connected to the local broker instead of the cloud.
+    # prints the time when the broker acknowledges the shot, before disconnecting.
+    shoot = '\n'.join([
+        'import getopt, os, sys, time',
+        'from collections import namedtuple',
+        'import remocon',
+        'from ricohapi.cameractl.mqtt_client import ConnectionProfile',
+        'opts, args = getopt.getopt(sys.argv[1:], "d:p:", ["dev=", "param="])',
+        'options = dict(opts)',
+        'broker_info = namedtuple("inf", ["uid", "cid", "token", "host", "port"])(',
+        '    "bench", None, None, os.environ.get("MQTT_HOST", "localhost"),',
+        '    int(os.environ.get("MQTT_PORT", "1883")))',
+        'with remocon.Client(None, None) as camera:',
+        '    camera.connect("bench", None, None, broker_info=broker_info,',
+        '                   profile=ConnectionProfile(tls=False))',
+        '    camera.shoot(options["-d"], param=remocon.validate_usr_param(options["-p"]))',
+        '    while camera.stats.in_flight:',
+        '        time.sleep(0.001)',
+        '    print(time.time())'])
+
+    def run(code, *args):
+        """Run python code in a new process."""
+        return subprocess.check_output([sys.executable, '-c', code] + list(args),
+                                       cwd=samples_dir)
+
+    def run_shoot():
+        """Run the shoot command, and get the seconds to the acknowledgement and to the exit."""
+        started = time.time()
+        acknowledged = float(run(shoot, '-dDEV01', '-p{"_iso": 100}', 'shoot'))
+        return acknowledged - started, time.time() - started
+
+    measure('startup: python', lambda: run('pass'), number=5)
+    measure('startup: import remocon', lambda: run('import remocon'), number=5)
+    measure('startup: import remocond', lambda: run('import remocond'), number=5)
+    shots = [run_shoot() for _ in range(5)]
+    for label, seconds in [('startup: shoot until acknowledged', min(shot[0] for shot in shots)),
+                           ('startup: shoot until exit', min(shot[1] for shot in shots))]:
+        print('{0:<40} {1:>12.3f} usec/call'.format(label, seconds * 1e6))
+    print('startup: modules loaded for shoot:', run(loaded).decode('utf-8').strip() or 'none')
+
+
+@benchmark
+def topic():
+    """Match received topics to subscriptions."""
+    for count in (10, 100, 1000):
+        _measure_topics(count)
+
+
+def _measure_topics(count):
+    """Match a received topic to the subscriptions to count devices."""
+    import paho.mqtt.client as mqtt  #pylint: disable=import-error
+    from ricohapi.cameractl.mqtt_client import TopicTrie
+
+    filters = ['user01/camera/DEV{0:04d}'.format(i) for i in range(count)]
+    filters.append('user01/status/+')
+    trie = TopicTrie()
+    for topic_filter in filters:
+        trie.insert(topic_filter, topic_filter)
+    received = 'user01/camera/DEV{0:04d}'.format(count - 1)
+
+    def linear_scan():
+        """Match with each subscription in order."""
+        return [f for f in filters if mqtt.topic_matches_sub(f, received)]
+
+    measure('topic: {0} subscriptions, linear scan'.format(count), linear_scan, number=100)
+    measure('topic: {0} subscriptions, trie'.format(count),
+            lambda: trie.match(received), number=100)
+
+
+def main():
+    """ main """
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if not name in BENCHMARKS:
+            print(__doc__)
+            sys.exit(-1)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""Local index of the captured pictures, keyed by device and time"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, StreamHandler
+import sqlite3
+import threading
+import time
+from exposure import TOLERANCE
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+
+DEFAULT_INDEX = './captures.db'
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS captures ('
+    ' device_id TEXT NOT NULL, file_uri TEXT NOT NULL, taken_at REAL NOT NULL,'
+    ' iso INTEGER, s_speed REAL, path TEXT, size INTEGER,'
+    ' PRIMARY KEY (device_id, file_uri))',
+    'CREATE INDEX IF NOT EXISTS captures_device_time ON captures (device_id, taken_at)',
+    'CREATE INDEX IF NOT EXISTS captures_time ON captures (taken_at)',
+    'CREATE INDEX IF NOT EXISTS captures_settings ON captures (iso, s_speed)',
+]
+
+
+class CaptureRecord(namedtuple('CaptureRecord', ['device_id', 'file_uri', 'taken_at', 'iso',
+                                                 's_speed', 'path', 'size'])):
+    """A picture in the capture index.
+
+    device_id: device id which requested the picture, or ``None`` if unknown.
+    file_uri: ID of the file in the camera.
+    taken_at: Unix time when the picture is taken.
+    iso: ISO value, or ``None`` for auto.
+    s_speed: shutter speed in seconds, or ``None`` for auto.
+    path: local path of the downloaded file, or ``None`` if not downloaded.
+    size: size of the downloaded file in bytes, or ``None`` if not downloaded.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        """Make a record from a row of the captures table."""
+        return cls(row[0] or None, *row[1:])
+
+
+COLUMNS = ', '.join(CaptureRecord._fields)
+
+
+class CaptureIndex(object):
+    """SQLite index of the captured pictures.
+
+    Pictures are found by device, time range and exposure settings
+    without scanning the directories they are downloaded in.
+    The index can be shared by threads, e.g. the download workers.
+
+    :param str path: (optional) path to the index file. ``':memory:'`` for a temporary index.
+    """
+    def __init__(self, path=DEFAULT_INDEX):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        with self.__conn:
+            for statement in SCHEMA:
+                self.__conn.execute(statement)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        with self.__lock:
+            return self.__conn.execute('SELECT COUNT(*) FROM captures').fetchone()[0]
+
+    def close(self):
+        """Close the index file."""
+        with self.__lock:
+            self.__conn.close()
+
+    def record(self, file_uri, device_id=None, taken_at=None, #pylint: disable=too-many-arguments
+               iso=None, s_speed=None, path=None, size=None):
+        """Record a picture. The record of the same device and file is replaced.
+
+        :param str file_uri: ID of the file in the camera
+        :param str device_id: (optional) device id which requested the picture
+        :param float taken_at: (optional) Unix time when the picture is taken. default to now.
+        :param int iso: (optional) ISO value
+        :param float s_speed: (optional) shutter speed in seconds
+        :param str path: (optional) local path of the downloaded file
+        :param int size: (optional) size of the downloaded file in bytes
+        """
+        taken_at = time.time() if taken_at is None else taken_at
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                'INSERT OR REPLACE INTO captures ({0}) VALUES (?, ?, ?, ?, ?, ?, ?)'.format(
+                    COLUMNS), (device_id or '', file_uri, taken_at, iso, s_speed, path, size))
+
+    def record_file(self, file_uri, path, size, device_id=None):
+        """Record the local file of a downloaded picture.
+           A picture which is not recorded yet is recorded as taken now.
+
+        :param str file_uri: ID of the file in the camera
+        :param str path: local path of the downloaded file
+        :param int size: size of the downloaded file in bytes
+        :param str device_id: (optional) device id which requested the picture.
+                              file uris repeat on every camera, so the pictures of
+                              the other devices are left as they are.
+        """
+        with self.__lock, self.__conn:
+            updated = self.__conn.execute(
+                'UPDATE captures SET path = ?, size = ? WHERE device_id = ? AND file_uri = ?',
+                (path, size, device_id or '', file_uri)).rowcount
+            if not updated:
+                self.__conn.execute(
+                    'INSERT INTO captures ({0}) VALUES (?, ?, ?, ?, ?, ?, ?)'.format(COLUMNS),
+                    (device_id or '', file_uri, time.time(), None, None, path, size))
+
+    def query(self, device_id=None, since=None, until=None, #pylint: disable=too-many-arguments
+              iso=None, s_speed=None, limit=None):
+        """Find pictures, oldest first.
+
+        :param str device_id: (optional) device id
+        :param float since: (optional) Unix time from which pictures are taken, inclusive
+        :param float until: (optional) Unix time until which pictures are taken, exclusive
+        :param int iso: (optional) ISO value
+        :param float s_speed: (optional) shutter speed in seconds
+        :param int limit: (optional) maximum number of records
+        :rtype: list of CaptureRecord
+        """
+        conditions = []
+        params = []
+        if device_id is not None:
+            conditions.append('device_id = ?')
+            params.append(device_id)
+        if since is not None:
+            conditions.append('taken_at >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('taken_at < ?')
+            params.append(until)
+        if iso is not None:
+            conditions.append('iso = ?')
+            params.append(iso)
+        if s_speed is not None:
+            conditions.append('s_speed BETWEEN ? AND ?')
+            params.extend([s_speed - TOLERANCE * s_speed, s_speed + TOLERANCE * s_speed])
+
+        sql = 'SELECT {0} FROM captures'.format(COLUMNS)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY taken_at'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self.__lock:
+            rows = self.__conn.execute(sql, params).fetchall()
+        return [CaptureRecord.from_row(row) for row in rows]
+
+    def latest(self, device_id=None):
+        """Get the latest picture.
+
+        :param str device_id: (optional) device id
+        :rtype: CaptureRecord or None
+        """
+        sql = 'SELECT {0} FROM captures'.format(COLUMNS)
+        params = []
+        if device_id is not None:
+            sql += ' WHERE device_id = ?'
+            params.append(device_id)
+        sql += ' ORDER BY taken_at DESC LIMIT 1'
+
+        with self.__lock:
+            row = self.__conn.execute(sql, params).fetchone()
+        return CaptureRecord.from_row(row) if row else None
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+"""
+Sample to discover RICOH THETA cameras on the network and probe their health.
+
+USAGE
+  discovery.py [options] hosts...
+
+ARGUMENTS
+  hosts               host names, base urls or CIDR ranges like 192.168.1.0/24
+
+OPTIONS
+  -h, --help          show this help message and exit.
+  -t, --timeout=SEC   seconds to wait for each camera. default to 1.0
+  -w, --workers=N     number of hosts probed in parallel. default to 32
+
+EXAMPLE
+  python discovery.py 192.168.1.1
+  python discovery.py -t0.5 192.168.0.0/24 192.168.1.0/24
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, StreamHandler, INFO
+import getopt
+import socket
+import struct
+import sys
+import threading
+import time
+from ricohapi.cameractl.clock import monotonic
+from thetav2 import ThetaV2
+try:
+    import queue
+except ImportError:
+    import Queue as queue #python2
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+LOG.setLevel(INFO)
+
+
+class CameraStatus(namedtuple('CameraStatus', [
+        'base_url', 'model', 'firmware', 'serial', 'battery', 'free_storage',
+        'remaining_pictures', 'probed_at'])):
+    """Status of a camera found on the network.
+
+    base_url: base url of the camera.
+    model, firmware, serial: model name, firmware version and serial number.
+    battery: battery level from 0.0 to 1.0.
+    free_storage: free storage in bytes, or ``None`` if not acquired.
+    remaining_pictures: number of pictures which can be taken, or ``None`` if not acquired.
+    probed_at: Unix time when the camera is probed.
+    """
+    __slots__ = ()
+
+
+def usage(message=None):
+    """Show usage."""
+    if not message is None:
+        LOG.info(message)
+    print(__doc__)
+    raise sys.exit(0)
+
+
+def expand_hosts(hosts):
+    """Expand host names and IPv4 CIDR ranges to base urls.
+
+    The network and broadcast addresses of a range are skipped.
+    A host given twice, or in overlapping ranges, is listed once, where it appears first.
+
+    :param hosts: host names, base urls like ``http://192.168.1.1`` or CIDR ranges
+    :rtype: list of str
+    :raises: ValueError if a range is not valid.
+    """
+    urls = []
+    for host in hosts:
+        if host.startswith(('http://', 'https://')):
+            urls.append(host.rstrip('/'))
+        elif '/' in host:
+            network, prefix = host.split('/', 1)
+            try:
+                prefix = int(prefix)
+                start = struct.unpack(str('!I'), socket.inet_aton(network))[0]
+            except (ValueError, socket.error):
+                raise ValueError('Invalid range: ' + host)
+            if not 0 <= prefix <= 32:
+                raise ValueError('Invalid range: ' + host)
+            mask = (0xffffffff << (32 - prefix)) & 0xffffffff
+            first, last = start & mask, (start & mask) | (~mask & 0xffffffff)
+            if prefix < 31:
+                first, last = first + 1, last - 1
+            for address in range(first, last + 1):
+                urls.append('http://' + socket.inet_ntoa(struct.pack(str('!I'), address)))
+        else:
+            urls.append('http://' + host)
+    seen = set()
+    return [url for url in urls if not (url in seen or seen.add(url))]
+
+
+def probe(base_url, timeout=1.0, storage=True):
+    """Probe a camera with ``get_info`` and ``get_state``.
+
+    :param str base_url: base url of the camera
+    :param float timeout: (optional) seconds to wait for each request
+    :param bool storage: (optional) if ``True``, free storage is also acquired,
+                         which costs a camera session.
+    :rtype: CameraStatus
+    :raises: :class:`requests.exceptions.RequestException` if the camera does not respond.
+    """
+    theta = ThetaV2(base_url, timeout=timeout)
+    info = theta.get_info()
+    state = theta.get_state().get('state', {})
+
+    free_storage, remaining_pictures = None, None
+    if storage:
+        try:
+            options = theta.get_options('remainingSpace', 'remainingPictures')
+            options = options['results']['options']
+            free_storage = options.get('remainingSpace')
+            remaining_pictures = options.get('remainingPictures')
+        except Exception as err: #pylint: disable=broad-except
+            LOG.debug('could not acquire storage of %s: %s', base_url, err)
+
+    return CameraStatus(base_url, info.get('model'), info.get('firmwareVersion'),
+                        info.get('serialNumber'), state.get('batteryLevel'),
+                        free_storage, remaining_pictures, time.time())
+
+
+class Discovery(object):
+    """Probes hosts in parallel and caches the results for a while.
+
+    Hosts which did not respond are cached as well, so that rescans skip them until the TTL.
+
+    :param float timeout: (optional) seconds to wait for each request to a host
+    :param float ttl: (optional) seconds to keep the result of a host
+    :param int max_workers: (optional) maximum number of hosts probed in parallel
+    :param bool storage: (optional) if ``True``, free storage is also acquired
+    """
+    def __init__(self, timeout=1.0, ttl=60.0, max_workers=32, storage=True):
+        if max_workers < 1:
+            raise ValueError('max_workers must be 1 or more.')
+
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.storage = storage
+        self.__lock = threading.Lock()
+        self.__cache = {}
+
+    def scan(self, hosts):
+        """Find the cameras among the hosts.
+
+        :param hosts: host names, base urls or CIDR ranges. see :func:`expand_hosts`
+        :rtype: list of CameraStatus
+        :returns: status of the cameras which responded, in the order of the hosts.
+        """
+        urls = expand_hosts(hosts)
+        stale = [url for url in urls if not self.__cached(url)]
+        if stale:
+            self.__probe_all(stale)
+
+        found = []
+        with self.__lock:
+            for url in urls:
+                # the result may be invalidated while the others are probed.
+                entry = self.__cache.get(url)
+                if entry is not None and entry[0] is not None:
+                    found.append(entry[0])
+        return found
+
+    def status(self, base_url):
+        """Get the status of a camera, probing it if not cached.
+
+        :param str base_url: base url of the camera
+        :rtype: CameraStatus or None
+        :returns: ``None`` if the camera did not respond.
+        """
+        return dict((status.base_url, status) for status in self.scan([base_url])).get(
+            base_url.rstrip('/'))
+
+    def invalidate(self, base_url=None):
+        """Forget the cached result.
+
+        :param str base_url: (optional) base url of the camera. if ``None``, all hosts.
+        """
+        with self.__lock:
+            if base_url is None:
+                self.__cache.clear()
+            else:
+                self.__cache.pop(base_url.rstrip('/'), None)
+
+    def __cached(self, url):
+        """Check if the result of the url is cached and not expired."""
+        with self.__lock:
+            entry = self.__cache.get(url)
+        return entry is not None and entry[1] > monotonic()
+
+    def __probe_all(self, urls):
+        """Probe the urls with a bounded number of threads."""
+        pending = queue.Queue()
+        for url in urls:
+            pending.put(url)
+
+        workers = [threading.Thread(target=self.__work, args=(pending,))
+                   for _ in range(min(self.max_workers, len(urls)))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def __work(self, pending):
+        """Probe the queued urls until the queue is empty."""
+        while True:
+            try:
+                url = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                status = probe(url, self.timeout, self.storage)
+            except Exception as err: #pylint: disable=broad-except
+                LOG.debug('no camera on %s: %s', url, err)
+                status = None
+            with self.__lock:
+                self.__cache[url] = (status, monotonic() + self.ttl)
+
+
+def main():
+    """ main """
+    timeout = 1.0
+    workers = 32
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'ht:w:', ['help', 'timeout=', 'workers='])
+    except getopt.GetoptError as err:
+        usage(err)
+
+    for option, arg in opts:
+        if option in ('-h', '--help'):
+            usage()
+        elif option in ('-t', '--timeout'):
+            timeout = float(arg)
+        elif option in ('-w', '--workers'):
+            workers = int(arg)
+        else:
+            usage('Unhandled option.')
+
+    if not args:
+        usage('Specify hosts.')
+
+    start = monotonic()
+    found = Discovery(timeout=timeout, max_workers=workers).scan(args)
+    for status in found:
+        LOG.info('%s  %s  firmware %s  battery %s  free %s bytes (%s pictures)',
+                 status.base_url, status.model, status.firmware, status.battery,
+                 status.free_storage, status.remaining_pictures)
+    LOG.info('%d cameras found in %.2f sec', len(found), monotonic() - start)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except ValueError as err:
+        LOG.warning(err)
+        sys.exit(-1)
+    except SystemExit as err:
+        sys.exit(err.args[0])
+    except:
+        raise
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""ISO values and shutter speeds supported by RICOH THETA
+
+See the THETA developers site:
+https://developers.theta360.com/en/docs/v2/api_reference/
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from bisect import bisect_left
+from numbers import Number
+
+try:
+    STRING_TYPES = (str, unicode) #pylint: disable=undefined-variable
+except NameError:
+    STRING_TYPES = (str,) #python3
+
+ISO_VALUES = (
+    100, 125, 160, 200, 250, 320, 400, 500, 640, 800, 1000, 1250, 1600)
+
+SHUTTER_SPEEDS = (
+    ('1/6400', 0.00015625), ('1/5000', 0.0002), ('1/4000', 0.00025),
+    ('1/3200', 0.0003125), ('1/2500', 0.0004), ('1/2000', 0.0005),
+    ('1/1600', 0.000625), ('1/1250', 0.0008), ('1/1000', 0.001),
+    ('1/800', 0.00125), ('1/640', 0.0015625), ('1/500', 0.002),
+    ('1/400', 0.0025), ('1/320', 0.003125), ('1/250', 0.004),
+    ('1/200', 0.005), ('1/160', 0.00625), ('1/125', 0.008),
+    ('1/100', 0.01), ('1/80', 0.0125), ('1/60', 0.01666666),
+    ('1/50', 0.02), ('1/40', 0.025), ('1/30', 0.03333333),
+    ('1/25', 0.04), ('1/20', 0.05), ('1/15', 0.06666666),
+    ('1/13', 0.07692307), ('1/10', 0.1), ('1/8', 0.125),
+    ('1/6', 0.16666666), ('1/5', 0.2), ('1/4', 0.25),
+    ('1/3', 0.33333333), ('1/2.5', 0.4), ('1/2', 0.5),
+    ('1/1.6', 0.625), ('1/1.3', 0.76923076), ('1/1', 1),
+    ('1.3/1', 1.3), ('1.6/1', 1.6), ('2/1', 2), ('2.5/1', 2.5),
+    ('3.2/1', 3.2), ('4/1', 4), ('5/1', 5), ('6/1', 6), ('8/1', 8),
+    ('10/1', 10), ('13/1', 13), ('15/1', 15), ('20/1', 20),
+    ('25/1', 25), ('30/1', 30), ('60/1', 60))
+
+# Shutter speeds longer than this need the iso value as well.
+LONGEST_AUTO_ISO_SPEED = 0.125
+
+# exposureProgram option values
+EXPOSURE_PROGRAMS = {'manual': 1, 'normal': 2, 'ss': 4, 'iso': 9}
+
+# Relative tolerance to regard a float as one of the shutter speeds.
+# Adjacent shutter speeds differ by more than 10 percent.
+TOLERANCE = 1e-3
+
+
+class ExposureTable(object):
+    """Lookup tables of the ISO values and shutter speeds a camera supports.
+
+    :param iso_values: supported ISO values
+    :param shutter_speeds: supported shutter speeds as pairs of
+                           a fraction string and seconds
+    """
+    __slots__ = ('iso_values', 'fractions', 'speeds')
+
+    def __init__(self, iso_values, shutter_speeds):
+        pairs = sorted(shutter_speeds, key=lambda pair: pair[1])
+        self.iso_values = frozenset(iso_values)
+        self.fractions = dict(pairs)
+        self.speeds = tuple(speed for _, speed in pairs)
+
+    @classmethod
+    def from_options(cls, options):
+        """Build the table from the ``camera.getOptions`` response.
+
+        :param dict options: response of
+                             ``ThetaV2.get_options('isoSupport', 'shutterSpeedSupport')``
+        :rtype: ExposureTable
+        """
+        supported = options['results']['options']
+        return cls(supported['isoSupport'],
+                   [(to_fraction(speed), speed) for speed in supported['shutterSpeedSupport']])
+
+    @classmethod
+    def from_camera(cls, theta):
+        """Build the table from the support lists of the camera.
+
+        :param theta: a :class:`thetav2.ThetaV2` instance
+        :rtype: ExposureTable
+        """
+        return cls.from_options(theta.get_options('isoSupport', 'shutterSpeedSupport'))
+
+    def nearest_speed(self, seconds):
+        """Get the supported shutter speed nearest to the seconds.
+
+        :param float seconds: shutter speed in seconds
+        :rtype: int or float
+        """
+        pos = bisect_left(self.speeds, seconds)
+        if pos == 0:
+            return self.speeds[0]
+        if pos == len(self.speeds):
+            return self.speeds[-1]
+        lower, upper = self.speeds[pos - 1], self.speeds[pos]
+        return lower if seconds - lower <= upper - seconds else upper
+
+    def shutter_speed(self, s_speed):
+        """Get the shutter speed which can be set to the camera.
+
+        :param int or float or str s_speed: seconds or a fraction string like '1/100'
+        :rtype: int or float
+        :raises: ValueError if the camera does not support it.
+        """
+        if isinstance(s_speed, STRING_TYPES):
+            try:
+                return self.fractions[s_speed]
+            except KeyError:
+                raise ValueError('Unsupported shutter speed.')
+
+        if not isinstance(s_speed, Number) or s_speed <= 0:
+            raise ValueError('Unsupported shutter speed.')
+
+        speed = self.nearest_speed(s_speed)
+        if abs(speed - s_speed) > speed * TOLERANCE:
+            raise ValueError('Unsupported shutter speed.')
+        return speed
+
+    def validate(self, iso=None, s_speed=None):
+        """Validate iso value and shutter speed.
+
+        :rtype: tuple, (int, int or float)
+        :returns: iso and shutter speed which can be set to the camera.
+        :raises: ValueError if the camera does not support them.
+        """
+        if not iso is None:
+            try:
+                supported = iso in self.iso_values
+            except TypeError:
+                supported = False
+            if not supported:
+                raise ValueError('Unsupported iso value.')
+
+        if not s_speed is None:
+            s_speed = self.shutter_speed(s_speed)
+
+            if (s_speed > LONGEST_AUTO_ISO_SPEED) and (iso is None):
+                raise ValueError('Both iso value and shutter speed should be specified '
+                                 'when the shutter speed is longer than 1/6 sec.')
+
+        return (iso, s_speed)
+
+
+def exposure_options(iso=None, s_speed=None):
+    """Get the options to set for the iso value and shutter speed.
+        The exposure program is chosen by which of them is specified.
+
+    :param int or None iso: the ISO value to be set.
+    :param int or float or None s_speed: the shutter speed to be set.
+    :rtype: dict
+    """
+    if (iso is None) and (s_speed is None):
+        exp_mode = 'normal'
+    elif (not iso is None) and (not s_speed is None):
+        exp_mode = 'manual'
+    elif iso is None:
+        exp_mode = 'ss'
+    else:
+        exp_mode = 'iso'
+
+    options = {'exposureProgram': EXPOSURE_PROGRAMS[exp_mode]}
+    if not iso is None:
+        options['iso'] = iso
+    if not s_speed is None:
+        options['shutterSpeed'] = s_speed
+    return options
+
+
+def to_fraction(seconds):
+    """Get the fraction string of the shutter speed.
+
+    :param int or float seconds: shutter speed in seconds
+    :rtype: str
+    """
+    speed = DEFAULT_TABLE.nearest_speed(seconds)
+    if abs(speed - seconds) <= speed * TOLERANCE:
+        return _FRACTION_OF_SPEED[speed]
+    if seconds < 1:
+        return '1/{0:g}'.format(1 / seconds)
+    return '{0:g}/1'.format(seconds)
+
+
+def camera_table(theta, model=None):
+    """Get the table for the camera model.
+        The support lists are acquired from the camera only once per model.
+
+    :param theta: a :class:`thetav2.ThetaV2` instance
+    :param str model: (optional) camera model name. acquired with ``get_info`` if omitted.
+    :rtype: ExposureTable
+    """
+    if model is None:
+        model = theta.get_info()['model']
+
+    table = _MODEL_TABLES.get(model)
+    if table is None:
+        table = ExposureTable.from_camera(theta)
+        _MODEL_TABLES[model] = table
+    return table
+
+
+DEFAULT_TABLE = ExposureTable(ISO_VALUES, SHUTTER_SPEEDS)
+_FRACTION_OF_SPEED = dict((speed, frac) for frac, speed in SHUTTER_SPEEDS)
+_MODEL_TABLES = {}
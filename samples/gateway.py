@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""Multi-process receiver gateway for camera control messages"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from bisect import bisect
+from logging import getLogger, StreamHandler
+import functools
+import hashlib
+import multiprocessing
+import time
+from ricohapi.cameractl.client import Client, CamTopic
+from ricohapi.cameractl.fleet import Heartbeat
+from ricohapi.cameractl.mqtt_client import ConnectionProfile
+from ricohapi.cameractl.profiling import open_profiler
+from ricohapi.cameractl.recording import Recorder, record_path
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+
+
+class HashRing(object):
+    """Consistent hash ring which maps keys to nodes.
+
+    Adding or removing a node moves only the keys of that node.
+
+    :param nodes: node names
+    :param int replicas: (optional) number of virtual nodes per node
+    """
+    def __init__(self, nodes, replicas=100):
+        ring = []
+        for node in nodes:
+            for replica in range(replicas):
+                ring.append((HashRing.hash('{0}-{1}'.format(node, replica)), node))
+        ring.sort()
+        self.__hashes = [point for point, _ in ring]
+        self.__nodes = [node for _, node in ring]
+
+    @staticmethod
+    def hash(key):
+        """Hash the key to an integer on the ring."""
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+    def node(self, key):
+        """Get the node to which the key is mapped.
+
+        :param str key: key such as a device id
+        """
+        if not self.__nodes:
+            raise ValueError('no node in the ring.')
+        pos = bisect(self.__hashes, HashRing.hash(key)) % len(self.__hashes)
+        return self.__nodes[pos]
+
+
+def shard_devices(device_ids, workers):
+    """Assign device ids to workers with consistent hashing.
+
+    :param device_ids: device ids to listen to
+    :param int workers: number of workers
+    :rtype: list of list of str
+    :returns: device ids assigned to each worker
+    """
+    ring = HashRing(range(workers))
+    shards = [[] for _ in range(workers)]
+    for device_id in device_ids:
+        shards[ring.node(device_id)].append(device_id)
+    return shards
+
+
+def session_id_of(session, device_ids):
+    """Get the persistent session id of a worker from the devices it listens to.
+
+    The id changes with the devices, so that a worker never resumes a session
+    which subscribes to devices moved to another worker.
+
+    :param str session: session name
+    :param device_ids: device ids listened by the worker
+    :rtype: str
+    """
+    return '{0}-{1:016x}'.format(session, HashRing.hash(','.join(sorted(device_ids))))
+
+
+def listen_devices(config, device_ids, func, fargs, #pylint: disable=too-many-arguments
+                   stop_event, session=None, profile_dir=None, record=None,
+                   heartbeat=None, probe=None):
+    """Worker process to listen to the camera control messages of the devices.
+
+    The devices are listened over one connection, with a subscription per device.
+    With a session name, the connection keeps a persistent session, see :func:`session_id_of`,
+    so that messages sent while the worker restarts are delivered when it connects again.
+
+    :param dict config: credentials, see the "./config_template.json"
+    :param device_ids: device ids to listen to
+    :param function func: callback function which called message is received
+    :param tuple fargs: func argument
+    :param stop_event: :class:`multiprocessing.Event` to stop the worker
+    :param str session: (optional) session name to resume persistent sessions
+    :param str profile_dir: (optional) directory to write profiles of the worker in,
+                            captured on ``SIGUSR1`` or a ``profile`` message.
+    :param str record: (optional) base path of the logs to record the received messages in.
+                       the worker appends its process id to it.
+    :param float heartbeat: (optional) seconds between the status reports of each device.
+                            if ``None``, not reported.
+    :param function probe: (optional) function of a device id which returns the status
+                           of its camera to report, see :class:`ricohapi.cameractl.fleet.Heartbeat`
+    """
+    beats = []
+    client = Client(config['CLIENT_ID'], config['CLIENT_SECRET'],
+                    profiler=open_profiler(profile_dir) if profile_dir else None,
+                    recorder=Recorder(record_path(record)) if record else None)
+    try:
+        if session:
+            client.connect(config['USER'], config['PASS'], config['CA_CERTS'],
+                           profile=ConnectionProfile(clean_session=False),
+                           session_id=session_id_of(session, device_ids))
+        else:
+            client.connect(config['USER'], config['PASS'], config['CA_CERTS'])
+        client.listen(device_ids, func=func, fargs=fargs)
+        if heartbeat:
+            beats = [Heartbeat(client, device_id, functools.partial(probe, device_id), heartbeat)
+                     for device_id in device_ids]
+        LOG.info('worker %d listening to %s', multiprocessing.current_process().pid,
+                 ', '.join(device_ids))
+        stop_event.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for beat in beats:
+            beat.stop()
+        client.disconnect()
+        if client.recorder is not None:
+            client.recorder.close()
+
+
+class Gateway(object): #pylint: disable=too-many-instance-attributes
+    """Receiver gateway which shards devices across worker processes
+       and restarts workers which exit unexpectedly.
+
+    :param dict config: credentials, see the "./config_template.json"
+    :param device_ids: device ids to listen to
+    :param int workers: (optional) number of worker processes. default to the number of CPUs.
+    :param function func: (optional) callback function which called message is received
+    :param tuple fargs: (optional) func argument
+    :param str session: (optional) session name to resume persistent sessions,
+                        see :func:`listen_devices`
+    :param str profile_dir: (optional) directory to write profiles of the workers in,
+                            see :func:`listen_devices`
+    :param str record: (optional) base path of the logs of the received messages,
+                       see :func:`listen_devices`
+    :param float heartbeat: (optional) seconds between the status reports of each device,
+                            see :func:`listen_devices`
+    :param function probe: (optional) function of a device id which returns the status to report.
+                           necessary with ``heartbeat``.
+    """
+    def __init__(self, config, device_ids, workers=None, #pylint: disable=too-many-arguments
+                 func=None, fargs=None, session=None, profile_dir=None, record=None,
+                 heartbeat=None, probe=None):
+        device_ids = list(device_ids)
+        for device_id in device_ids:
+            if not CamTopic.validate_device_id(device_id):
+                raise ValueError('The device id is not acceptable.')
+        if heartbeat and probe is None:
+            raise ValueError('Specify the probe to report the status with.')
+
+        workers = workers or multiprocessing.cpu_count()
+        self.config = config
+        self.func = func
+        self.fargs = fargs if fargs else ()
+        self.session = session
+        self.profile_dir = profile_dir
+        self.record = record
+        self.heartbeat = heartbeat
+        self.probe = probe
+        self.shards = [shard for shard in shard_devices(device_ids, workers) if shard]
+        self.restarts = 0
+        self.__stop_event = multiprocessing.Event()
+        self.__processes = [None] * len(self.shards)
+
+    def start(self):
+        """Start all worker processes."""
+        self.__stop_event.clear()
+        for index in range(len(self.shards)):
+            self.__start_worker(index)
+
+    def supervise(self, interval=1.0, backoff=5.0):
+        """Restart workers which exit until :meth:`stop` is called or Ctr+C is input.
+
+        :param float interval: (optional) seconds between checks
+        :param float backoff: (optional) minimum seconds between restarts of a worker
+        """
+        started = [time.time()] * len(self.shards)
+        try:
+            while not self.__stop_event.is_set():
+                for index, process in enumerate(self.__processes):
+                    if process.is_alive() or time.time() - started[index] < backoff:
+                        continue
+                    LOG.warning('worker for %s exited with %s. restarting.',
+                                ', '.join(self.shards[index]), process.exitcode)
+                    self.__start_worker(index)
+                    started[index] = time.time()
+                    self.restarts += 1
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    def stop(self, timeout=10.0):
+        """Stop all worker processes.
+
+        :param float timeout: (optional) seconds to wait for each worker
+        """
+        self.__stop_event.set()
+        for process in self.__processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def __start_worker(self, index):
+        """Start the worker process for the shard."""
+        process = multiprocessing.Process(
+            target=listen_devices,
+            args=(self.config, self.shards[index], self.func, self.fargs, self.__stop_event,
+                  self.session, self.profile_dir, self.record, self.heartbeat, self.probe))
+        process.daemon = True
+        process.start()
+        self.__processes[index] = process
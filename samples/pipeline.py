@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""Streaming post-capture processing of the pictures on RICOH THETA"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from io import BytesIO
+from logging import getLogger, StreamHandler
+import hashlib
+import os
+import threading
+from thetav2 import CHUNK_SIZE, prepare_save_path
+try:
+    import queue
+except ImportError:
+    import Queue as queue #python2
+try:
+    from PIL import Image  #pylint: disable=import-error
+except ImportError:
+    Image = None
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+
+
+class PipelineResult(namedtuple('PipelineResult', ['file_uri', 'results', 'size', 'error'])):
+    """Result of processing a file.
+
+    file_uri: ID of the file in the camera.
+    results: dict of the processor names and their results. a processor whose name is taken
+             by an earlier stage is keyed by its name and position, like ``hash:2``.
+    size: number of bytes streamed.
+    error: exception which stopped the processing, or ``None``.
+    """
+    __slots__ = ()
+
+
+class Processor(object):
+    """Base class of the stages which consume a file chunk by chunk as it is downloaded.
+
+    A processor is made for each file by its stage, see :class:`Pipeline`.
+    """
+    name = None
+
+    def update(self, chunk):
+        """Consume the next chunk of the file.
+
+        :param bytes chunk: chunk of the file
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """Called after the last chunk.
+
+        :returns: result of the processor
+        """
+        return None
+
+    def abort(self):
+        """Called instead of :meth:`finish` if the processing failed."""
+        pass
+
+
+class HashProcessor(Processor):
+    """Hashes the file.
+
+    :param str algorithm: (optional) name of the :mod:`hashlib` algorithm
+    """
+    name = 'hash'
+
+    def __init__(self, algorithm='sha256'):
+        self.__hash = hashlib.new(algorithm)
+
+    def update(self, chunk):
+        self.__hash.update(chunk)
+
+    def finish(self):
+        return self.__hash.hexdigest()
+
+
+class FileWriter(Processor):
+    """Writes the file. A partially written file is removed if the processing fails.
+
+    :param str save_path: save file path.
+    :param bool override_file: (optional) if ``True``, the same name file will be overridden
+    """
+    name = 'path'
+
+    def __init__(self, save_path, override_file=False):
+        prepare_save_path(save_path, override_file)
+        self.save_path = save_path
+        self.__fptr = open(save_path, 'wb')
+
+    def update(self, chunk):
+        self.__fptr.write(chunk)
+
+    def finish(self):
+        self.__fptr.close()
+        return self.save_path
+
+    def abort(self):
+        self.__fptr.close()
+        os.remove(self.save_path)
+
+
+class TeeProcessor(Processor):
+    """Passes the chunks to a writer such as an uploader.
+
+    :param writer: object with ``write(chunk)`` and optional ``close()``,
+                   whose result is the result of this processor.
+    """
+    name = 'tee'
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def update(self, chunk):
+        self.writer.write(chunk)
+
+    def finish(self):
+        close = getattr(self.writer, 'close', None)
+        return close() if close is not None else None
+
+
+class ThumbnailProcessor(Processor):
+    """Makes a JPEG thumbnail of the picture in memory. Pillow is necessary.
+
+    :param tuple size: (optional) maximum width and height of the thumbnail
+    :param int quality: (optional) JPEG quality of the thumbnail
+    """
+    name = 'thumbnail'
+
+    def __init__(self, size=(320, 160), quality=75):
+        if Image is None:
+            raise ValueError('Pillow is necessary to make thumbnails.')
+        self.size = size
+        self.quality = quality
+        self.__buffer = BytesIO()
+
+    def update(self, chunk):
+        self.__buffer.write(chunk)
+
+    def finish(self):
+        self.__buffer.seek(0)
+        image = Image.open(self.__buffer)
+        image.draft('RGB', self.size)
+        image.thumbnail(self.size)
+        thumbnail = BytesIO()
+        image.save(thumbnail, 'JPEG', quality=self.quality)
+        return thumbnail.getvalue()
+
+
+def save_stage(dest_dir='.', override_file=False):
+    """Stage which writes the files in the directory.
+
+    :param str dest_dir: (optional) directory to save files in
+    :param bool override_file: (optional) if ``True``, the same name file will be overridden
+    """
+    return lambda file_uri: FileWriter(os.path.join(dest_dir, file_uri), override_file)
+
+
+class Pipeline(object):
+    """Streams files from the camera through processors on a bounded number of worker threads.
+
+    Each file is downloaded once by a worker, which passes each chunk to the processors
+    of the file in order as it arrives, so that no processor re-reads it from disk.
+    The processors run on the worker, so a slow processor slows the download of its file.
+    Up to ``max_workers`` files are downloaded and processed at a time.
+
+    ex.) ``Pipeline(theta, [HashProcessor, save_stage('./images')])``
+
+    :param theta: a :class:`thetav2.ThetaV2` instance
+    :param stages: callables which make a :class:`Processor` for each file.
+                   a processor class without arguments or a function of the file uri.
+    :param int max_workers: (optional) maximum number of files processed concurrently
+    :param int chunk_size: (optional) size of each chunk in bytes
+    """
+    def __init__(self, theta, stages, max_workers=4, chunk_size=CHUNK_SIZE):
+        if max_workers < 1:
+            raise ValueError('max_workers must be 1 or more.')
+
+        self.theta = theta
+        self.stages = list(stages)
+        self.chunk_size = chunk_size
+        self.__queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__results = []
+        self.__workers = [threading.Thread(target=self.__work) for _ in range(max_workers)]
+        for worker in self.__workers:
+            worker.daemon = True
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.join()
+
+    def submit(self, file_uri):
+        """Queue a file to process.
+
+        :param str file_uri: ID of the file to be acquired
+        """
+        if not self.__workers:
+            raise ValueError('pipeline is already joined.')
+        self.__queue.put(file_uri)
+
+    def join(self):
+        """Wait for all queued files and stop the workers.
+
+        :rtype: list of PipelineResult
+        """
+        for _ in self.__workers:
+            self.__queue.put(None)
+        for worker in self.__workers:
+            worker.join()
+        self.__workers = []
+        return list(self.__results)
+
+    def process(self, file_uri):
+        """Stream a file through the processors in the calling thread.
+
+        :param str file_uri: ID of the file to be acquired
+        :rtype: PipelineResult
+        """
+        processors = []
+        size = 0
+        try:
+            for stage in self.stages:
+                processors.append(self.__make_processor(stage, file_uri))
+            for chunk in self.theta.iter_image(file_uri, self.chunk_size):
+                for processor in processors:
+                    processor.update(chunk)
+                size += len(chunk)
+            results = {}
+            for position, processor in enumerate(processors):
+                key = processor.name
+                if key in results:
+                    key = '{0}:{1}'.format(key, position)
+                results[key] = processor.finish()
+        except Exception as err: #pylint: disable=broad-except
+            LOG.warning('failed to process %s: %s', file_uri, err)
+            for processor in processors:
+                try:
+                    processor.abort()
+                except Exception: #pylint: disable=broad-except
+                    pass
+            return PipelineResult(file_uri, {}, size, err)
+        return PipelineResult(file_uri, results, size, None)
+
+    @staticmethod
+    def __make_processor(stage, file_uri):
+        """Make the processor of the stage for the file."""
+        if isinstance(stage, type):
+            return stage()
+        return stage(file_uri)
+
+    def __work(self):
+        """Process queued files until a stop marker is received."""
+        while True:
+            file_uri = self.__queue.get()
+            if file_uri is None:
+                return
+            result = self.process(file_uri)
+            with self.__lock:
+                self.__results.append(result)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""Live preview of RICOH THETA as a stream of JPEG frames"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from logging import getLogger, StreamHandler
+from ricohapi.cameractl.clock import monotonic
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_EOI = b'\xff\xd9'
+BUFFER_SIZE = 1024 * 1024
+READ_SIZE = 256 * 1024
+
+
+class FrameParser(object):
+    """Finds JPEG frames in a multipart MJPEG stream by their SOI and EOI markers.
+
+    Data is written into one preallocated buffer and frames are returned as
+    :class:`memoryview` slices of it, so that no frame is copied.
+    A frame is valid until the next data is written.
+
+    :param int capacity: (optional) buffer size in bytes.
+                         must be larger than a frame and the data written at once.
+    """
+    def __init__(self, capacity=BUFFER_SIZE):
+        self.__buffer = bytearray(capacity)
+        self.__view = memoryview(self.__buffer)
+        self.__start = 0
+        self.__end = 0
+        self.__frame_start = -1
+        self.__scan = 0
+
+    def writable(self, size):
+        """Get the free part of the buffer to write the next data in.
+
+        The parsed data is moved to the front when the free part is smaller than the size.
+        A frame larger than the buffer is dropped.
+
+        :param int size: number of bytes to write
+        :rtype: memoryview
+        """
+        capacity = len(self.__buffer)
+        if size > capacity:
+            raise ValueError('size must not be larger than the buffer.')
+        if capacity - self.__end < size:
+            self.__compact()
+        if capacity - self.__end < size:
+            LOG.warning('frame larger than %d bytes is dropped.', capacity)
+            self.__start, self.__end = 0, 0
+            self.__frame_start = -1
+        return self.__view[self.__end:self.__end + size]
+
+    def commit(self, count):
+        """Mark the bytes written in :meth:`writable` as data.
+
+        :param int count: number of bytes written
+        """
+        self.__end += count
+
+    def feed(self, data):
+        """Write the data into the buffer.
+
+        :param bytes data: data received, not larger than the buffer
+        """
+        self.writable(len(data))[:len(data)] = data
+        self.commit(len(data))
+
+    def frames(self):
+        """Get the frames completed by the data written since the last call.
+
+        :rtype: list of memoryview
+        """
+        buf = self.__buffer
+        frames = []
+        while True:
+            if self.__frame_start < 0:
+                pos = buf.find(JPEG_SOI, self.__start, self.__end)
+                if pos < 0:
+                    # keep the last byte, which may be the first half of a marker.
+                    self.__start = max(self.__start, self.__end - 1)
+                    return frames
+                self.__frame_start = pos
+                self.__scan = pos + len(JPEG_SOI)
+
+            pos = buf.find(JPEG_EOI, self.__scan, self.__end)
+            if pos < 0:
+                self.__scan = max(self.__scan, self.__end - 1)
+                return frames
+            end = pos + len(JPEG_EOI)
+            frames.append(self.__view[self.__frame_start:end])
+            self.__start = end
+            self.__frame_start = -1
+
+    def __compact(self):
+        """Move the unparsed data to the front of the buffer."""
+        start = self.__start if self.__frame_start < 0 else self.__frame_start
+        length = self.__end - start
+        if start == 0:
+            return
+        self.__buffer[:length] = self.__buffer[start:self.__end]
+        self.__start -= start
+        self.__end = length
+        if self.__frame_start >= 0:
+            self.__frame_start -= start
+            self.__scan -= start
+
+
+def stream_reader(raw):
+    """Get the function which reads the data available on the stream into a buffer.
+
+    ``readinto1`` of the stream is used if it has one, which reads into the buffer without a copy.
+    ``readinto`` of urllib3 waits until the whole buffer is filled, which delays the frames,
+    so ``read1`` is preferred to it, and its data is copied into the buffer.
+
+    :param raw: raw stream of the response, such as :attr:`requests.Response.raw`
+    :rtype: function which takes a writable :class:`memoryview` and returns the bytes read
+    """
+    readinto1 = getattr(raw, 'readinto1', None)
+    if readinto1 is not None:
+        return readinto1
+    read1 = getattr(raw, 'read1', None)
+    if read1 is None:
+        return raw.readinto
+
+    def readinto(view):
+        """Read once, and copy the data into the view."""
+        chunk = read1(len(view))
+        view[:len(chunk)] = chunk
+        return len(chunk)
+    return readinto
+
+
+class LivePreview(object): #pylint: disable=too-many-instance-attributes
+    """Iterates the frames of a live preview stream.
+
+    ex.) ``for frame in theta.live_preview(max_fps=10): show(bytes(frame))``
+
+    Frames are :class:`memoryview` slices of a reused buffer.
+    Copy a frame with ``bytes(frame)`` to keep it after the next frame is requested.
+
+    :param open_stream: function which returns a context manager of a streaming
+                        :class:`requests.Response`,
+                        such as :meth:`thetav2.ThetaV2.open_live_preview`
+    :param float max_fps: (optional) maximum frames per second to yield. if ``None``, all frames.
+    :param bool skip_frames: (optional) if ``True``, only the newest of the frames
+                             received together is yielded, so that a slow consumer
+                             gets the latest frame instead of falling behind.
+    :param int buffer_size: (optional) buffer size in bytes
+    :param int read_size: (optional) maximum number of bytes read at once
+    """
+    def __init__(self, open_stream, max_fps=None, #pylint: disable=too-many-arguments
+                 skip_frames=True, buffer_size=BUFFER_SIZE, read_size=READ_SIZE):
+        self.open_stream = open_stream
+        self.max_fps = max_fps
+        self.skip_frames = skip_frames
+        self.buffer_size = buffer_size
+        self.read_size = read_size
+        self.received = 0
+        self.frames = 0
+        self.dropped = 0
+        self.__started = None
+        self.__stopped = None
+
+    def __iter__(self):
+        parser = FrameParser(self.buffer_size)
+        interval = 1.0 / self.max_fps if self.max_fps else 0.0
+        last = None
+        self.__started = monotonic()
+        self.__stopped = None
+        try:
+            with self.open_stream() as req:
+                readinto = stream_reader(req.raw)
+                while True:
+                    count = readinto(parser.writable(self.read_size))
+                    if not count:
+                        return
+                    parser.commit(count)
+                    frames = parser.frames()
+                    self.received += len(frames)
+                    if self.skip_frames and len(frames) > 1:
+                        self.dropped += len(frames) - 1
+                        frames = frames[-1:]
+
+                    for frame in frames:
+                        now = monotonic()
+                        if last is not None and now - last < interval:
+                            self.dropped += 1
+                            continue
+                        last = now
+                        self.frames += 1
+                        yield frame
+        finally:
+            self.__stopped = monotonic()
+            if self.frames:
+                LOG.debug('%d frames, %d dropped, %.1f fps', self.frames, self.dropped, self.fps)
+
+    @property
+    def elapsed(self):
+        """Seconds since the stream is opened."""
+        if self.__started is None:
+            return 0.0
+        return (self.__stopped or monotonic()) - self.__started
+
+    @property
+    def fps(self):
+        """Achieved frames per second yielded."""
+        elapsed = self.elapsed
+        return self.frames / elapsed if elapsed > 0 else 0.0
@@ -9,15 +9,50 @@ USAGE
 COMMANDS
   shoot               send shooting message to your camera
   start               connect to ricoh vcp server
+  status              show the status reported by the heartbeats of the devices
+  profile             ask the listeners of the devices to capture a profile.
+                      -p'{"seconds": 30, "mode": "sample"}' sets how. mode is sample or cprofile.
 
 OPTIONS
   -h, --help          show this help message and exit.
-  -d, --dev=DEVID     specify the device id
+  -d, --dev=DEVID     specify the device id.
+                      comma separated device ids can be specified for start.
   -p, --param="str"   json string parameter to send with shooting, if need.
+  -w, --workers=N     number of worker processes to listen with on start.
+                      devices are sharded across the workers.
+  -s, --session=NAME  keep a persistent session on start, so that messages sent
+                      while restarting are delivered on the next start with the same NAME.
+  -i, --index=PATH    record the pictures taken on start in the capture index at PATH.
+  -a, --at=SEC        fire the shot SEC seconds later on all the comma separated devices
+                      at once, after estimating the clock offset of each device.
+  -t, --trace=PATH    trace the shot from the sender to the camera, appending
+                      the timings of each step to PATH as JSON lines.
+  -b, --heartbeat=SEC report the status of the camera every SEC seconds on start.
+                      with workers, each worker reports the status of its devices.
+  -q, --policy=NAME[:N]
+                      how shots received while the camera is busy are admitted on start.
+                      queue up to N shots, keep only the latest, or reject them.
+                      NAME is queue, latest or reject. default to queue:4
+  -P, --profile=DIR   time the callbacks on start, and capture a profile to DIR
+                      on SIGUSR1 or the profile command.
+  -r, --record=PATH   record the messages received on start to the log at PATH,
+                      to replay them with replay.py. workers append their process id to PATH.
 
 EXAMPLE
   python remocon.py -dDEV01 start
+  python remocon.py -dDEV01,DEV02,DEV03 -w2 start
+  python remocon.py -dDEV01 -slistener01 start
+  python remocon.py -dDEV01 -i./captures.db start
   python remocon.py -dDEV01 shoot
+  python remocon.py -dDEV01,DEV02,DEV03 -a0.5 shoot
+  python remocon.py -dDEV01 -t./trace.jsonl start
+  python remocon.py -dDEV01 -t./trace.jsonl shoot
+  python remocon.py -dDEV01 -b30 start
+  python remocon.py -dDEV01 -qlatest start
+  python remocon.py -dDEV01 -P./profiles start
+  python remocon.py -dDEV01 -r./traffic.log start
+  python remocon.py -dDEV01 -p'{"seconds": 10, "mode": "cprofile"}' profile
+  python remocon.py status
   python remocon.py -dDEV01 -p'{"_shutterSpeed": 0.01, "_iso": 200}' shoot
 
 NOTE
@@ -27,18 +62,31 @@ NOTE
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 import sys
+import atexit
+import functools
 import json
+import threading
 import time
 import getopt
 from logging import getLogger, NullHandler, StreamHandler #pylint: disable=unused-import
 from logging import DEBUG, INFO #pylint: disable=unused-import
 from ricohapi.cameractl.client import Client, ClientError
+from ricohapi.cameractl.mqtt_client import ConnectionProfile
 
-from thetav2 import ThetaV2
+from exposure import DEFAULT_TABLE, exposure_options
+# thetav2 (requests), gateway (multiprocessing) and the modules of the options
+# are imported where they are used, so that the shoot command does not pay for importing them.
 LOG = getLogger(__name__)
 LOG.addHandler(StreamHandler())
 LOG.setLevel(INFO)
 
+DEFAULT_CAMERA = 'http://192.168.1.1'
+
+_TRACERS = {}
+_EXECUTORS = {}
+_EXECUTORS_LOCK = threading.Lock()
+_CAMERA_LOCKS = {}
+
 def usage(message=None):
     """Show usage."""
     if not message is None:
@@ -47,93 +95,197 @@ def usage(message=None):
     raise sys.exit(0)
 
 
-def validate_iso_and_shutter(iso=None, s_speed=None):
+def validate_iso_and_shutter(iso=None, s_speed=None, table=DEFAULT_TABLE):
     """Validate iso value and shutter speed.
 
     Both iso value and shutter speed must be a pre-defined value.
     See the THETA developers site:
     https://developers.theta360.com/en/docs/v2/api_reference/
 
+    :param exposure.ExposureTable table: (optional) values supported by the camera model.
     :rtype: tuple, (int, int or float)
     :returns: iso and shutter speed which can be set to the RICOH THETA API v2.
     :raises: ValueError if parameters does not match the Theta v2 SDK format.
     """
 
-    authorized_iso = [
-        100, 125, 160, 200, 250, 320, 400, 500, 640, 800, 1000, 1250, 1600]
-
-    authorized_ss = [
-        0.00015625, 0.0002, 0.00025, 0.0003125, 0.0004, 0.0005,
-        0.000625, 0.0008, 0.001, 0.00125, 0.0015625, 0.002,
-        0.0025, 0.003125, 0.004, 0.005, 0.00625, 0.008,
-        0.01, 0.0125, 0.01666666, 0.02, 0.025, 0.03333333,
-        0.04, 0.05, 0.06666666, 0.07692307, 0.1, 0.125, 0.16666666, 0.2,
-        0.25, 0.33333333, 0.4, 0.5, 0.625, 0.76923076, 1,
-        1.3, 1.6, 2, 2.5, 3.2, 4, 5, 6, 8, 10, 13, 15, 20, 25, 30, 60]
-
-    authorized_ss_frac = [
-        '1/6400', '1/5000', '1/4000', '1/3200', '1/2500', '1/2000',
-        '1/1600', '1/1250', '1/1000', '1/800', '1/640', '1/500',
-        '1/400', '1/320', '1/250', '1/200', '1/160', '1/125',
-        '1/100', '1/80', '1/60', '1/50', '1/40', '1/30',
-        '1/25', '1/20', '1/15', '1/13', '1/10', '1/8', '1/6', '1/5',
-        '1/4', '1/3', '1/2.5', '1/2', '1/1.6', '1/1.3', '1/1',
-        '1.3/1', '1.6/1', '2/1', '2.5/1', '3.2/1', '4/1', '5/1',
-        '6/1', '8/1', '10/1', '13/1', '15/1', '20/1', '25/1', '30/1', '60/1']
-
-    if not iso is None:
-        if not iso in authorized_iso:
-            raise ValueError('Unsupported iso value.')
-
-    if not s_speed is None:
-        for (frac, speed) in zip(authorized_ss_frac, authorized_ss):
-            if frac == s_speed:
-                s_speed = speed
-                break
-            elif speed == s_speed:
-                break
-        else:
-            raise ValueError('Unsupported shutter speed.')
+    return table.validate(iso, s_speed)
+
+def open_tracer(path):
+    """Get the tracer which appends spans to the file, opening it once per process.
+       The files are closed by :func:`close_tracers`, at the latest when the process exits.
+
+    :param str path: path to the JSON lines file
+    :rtype: :class:`ricohapi.cameractl.trace.Tracer`
+    """
+    from ricohapi.cameractl.trace import Tracer
+
+    with _EXECUTORS_LOCK:
+        if path not in _TRACERS:
+            if not _TRACERS:
+                atexit.register(close_tracers)
+            _TRACERS[path] = Tracer(open(path, 'a'))
+        return _TRACERS[path]
+
+def close_tracers():
+    """Close the files of the tracers opened by :func:`open_tracer`."""
+    with _EXECUTORS_LOCK:
+        tracers = list(_TRACERS.values())
+        _TRACERS.clear()
+    for tracer in tracers:
+        tracer.sink.close()
+
+def parse_policy(spec):
+    """Parse an admission policy like ``queue:8``.
+
+    :param str spec: policy name, followed by the queue length for ``queue``
+    :rtype: tuple, (str, int)
+    :raises: ValueError if the policy is not valid.
+    """
+    from admission import POLICIES, QUEUE_LIMIT
+
+    name, _, length = spec.partition(':')
+    if name not in POLICIES:
+        raise ValueError('Policy must be one of ' + ', '.join(POLICIES))
+    try:
+        return name, int(length) if length else QUEUE_LIMIT
+    except ValueError:
+        raise ValueError('Invalid queue length: ' + length)
 
-        if (s_speed > 0.125) and (iso is None):
-            raise ValueError('Both iso value and shutter speed should be specified '
-                             'when the shutter speed is longer than 1/6 sec.')
+def camera_url(devid, cameras=None):
+    """Get the base url of the camera of the device.
+
+    :param str devid: device id
+    :param dict cameras: (optional) base urls of the cameras by device id, ``CAMERAS`` of
+                         the config file. the cameras of the other devices are at DEFAULT_CAMERA.
+    :rtype: str
+    """
+    return (cameras or {}).get(devid, DEFAULT_CAMERA)
 
-    return (iso, s_speed)
+def camera_lock(devid):
+    """Get the lock held while a session is open on the camera of the device.
+       The camera keeps one session at a time.
 
-def still_picture(iso=None, s_speed=None):
+    :param str devid: device id
+    :rtype: :class:`threading.Lock`
+    """
+    with _EXECUTORS_LOCK:
+        if devid not in _CAMERA_LOCKS:
+            _CAMERA_LOCKS[devid] = threading.Lock()
+        return _CAMERA_LOCKS[devid]
+
+def camera_executor(devid, policy, cameras=None):
+    """Get the executor of the shots to the device, making it on the first shot.
+
+    :param str devid: device id
+    :param str policy: admission policy, see :func:`parse_policy`
+    :param dict cameras: (optional) base urls of the cameras by device id, see :func:`camera_url`
+    :rtype: :class:`admission.CameraExecutor`
+    """
+    from admission import CameraExecutor, theta_busy
+    from thetav2 import ThetaV2
+
+    with _EXECUTORS_LOCK:
+        executor = _EXECUTORS.get(devid)
+        if executor is None:
+            name, max_queue = parse_policy(policy)
+            theta = ThetaV2(camera_url(devid, cameras), timeout=5.0)
+            executor = CameraExecutor(name, max_queue, is_busy=lambda: theta_busy(theta))
+            _EXECUTORS[devid] = executor
+        return executor
+
+def stop_executors():
+    """Stop the executors after their running shots."""
+    with _EXECUTORS_LOCK:
+        executors = list(_EXECUTORS.values())
+        _EXECUTORS.clear()
+    for executor in executors:
+        executor.stop()
+
+def still_picture(iso=None, s_speed=None, #pylint: disable=too-many-arguments
+                  index=None, device_id=None, tracer=None, base_url=DEFAULT_CAMERA):
     """Take picture with user parameter.
 
     :param int or None iso: the ISO value to be set.
     :param int or str or None s_speed: the shutter speed to be set.
+    :param index: (optional) :class:`capture_index.CaptureIndex` to record the picture in.
+                  if specified, waits until the picture is taken.
+    :param str device_id: (optional) device id to record the picture with.
+                          the session is opened under its :func:`camera_lock`.
+    :param tracer: (optional) :class:`ricohapi.cameractl.trace.Tracer` to record
+                   the camera commands in. if specified, waits until the picture is taken.
+    :param str base_url: (optional) base url of the camera
     """
-    exp_program = {'manual': 1, 'normal': 2, 'ss': 4, 'iso': 9}
-
-    if (iso is None) and (s_speed is None):
-        exp_mode = 'normal'
-    elif (not iso is None) and (not s_speed is None):
-        exp_mode = 'manual'
-    elif iso is None:
-        exp_mode = 'ss'
-    else:
-        exp_mode = 'iso'
+    from thetav2 import ThetaV2
 
     iso, s_speed = validate_iso_and_shutter(iso, s_speed)
 
-    theta = ThetaV2()
+    theta = ThetaV2(base_url, tracer=tracer)
+
+    with camera_lock(device_id), theta.session():
+        options = {'captureMode': 'image'}
+        theta.set_options(**options)
+
+        options = exposure_options(iso, s_speed)
+        theta.set_options(**options)
+        taken_at = time.time()
+        command_id = theta.take_picture()['id']
+        file_uri = None
+        if index is not None or tracer is not None:
+            file_uri = theta.wait_for_picture(command_id)
+        if index is not None:
+            index.record(file_uri, device_id, taken_at, iso, s_speed)
+
+def theta_status(device_id, cameras=None):
+    """Get the status of the camera of the device to report with the heartbeat.
+       The state is read from ``/osc/state``, which needs no session.
+       The free storage needs one, so it is read only while no shot to the device holds
+       its :func:`camera_lock`, and is ``None`` otherwise.
+
+    :param str device_id: device id
+    :param dict cameras: (optional) base urls of the cameras by device id, see :func:`camera_url`
+    :rtype: dict
+    :returns: ``battery``, ``free_storage`` and ``busy``
+    """
+    from thetav2 import ThetaV2
+
+    theta = ThetaV2(camera_url(device_id, cameras), timeout=5.0)
+    state = theta.get_state()['state']
+    busy = state.get('_captureStatus', 'idle') != 'idle'
+
+    free_storage = None
+    lock = camera_lock(device_id)
+    if not busy and lock.acquire(False):
+        try:
+            options = theta.get_options('remainingSpace')['results']['options']
+            free_storage = options.get('remainingSpace')
+        except Exception as err: #pylint: disable=broad-except
+            LOG.debug('could not acquire storage: %s', err)
+        finally:
+            lock.release()
+    return {'battery': state.get('batteryLevel'), 'free_storage': free_storage, 'busy': busy}
 
-    options = {'captureMode': 'image'}
-    theta.set_options(**options)
+def show_status(camera, wait=1.0):
+    """Show the status of the devices, which the server keeps as retained messages.
 
-    options = {'exposureProgram': exp_program.get(exp_mode, 2)}
+    :param camera: a connected :class:`ricohapi.cameractl.client.Client`
+    :param float wait: (optional) seconds to wait for the retained messages
+    """
+    from ricohapi.cameractl.fleet import FleetState
 
-    if not iso is None:
-        options.update({'iso': iso})
-    if not s_speed is None:
-        options.update({'shutterSpeed': s_speed})
+    with FleetState(camera) as fleet:
+        time.sleep(wait)
+        devices = sorted(fleet.devices())
+        stale = set(status.device_id for status in fleet.stale())
+        idle = set(status.device_id for status in fleet.idle())
 
-    theta.set_options(**options)
-    theta.take_picture()
+    for status in devices:
+        if status.device_id in stale:
+            state = 'stale'
+        else:
+            state = 'idle' if status.device_id in idle else 'busy'
+        LOG.info('%-32s %-5s battery %s  free %s bytes  %.0f sec ago', status.device_id, state,
+                 status.battery, status.free_storage, time.time() - status.reported_at)
+    LOG.info('%d devices, %d idle, %d stale', len(devices), len(idle), len(stale))
 
 def validate_usr_param(msg):
     """Validate the user message.
@@ -178,13 +330,50 @@ def wait_keyborad_interrupt():
         except KeyboardInterrupt:
             break
 
-def on_receive(devid, cmd, rcv_param, fun_param):
+def take_still_picture(devid, iso, s_speed, #pylint: disable=too-many-arguments
+                       index_path=None, tracer=None, cameras=None):
+    """Take picture and log the result instead of raising an error.
+
+    :param str devid: device id to record the picture with.
+    :param int or None iso: the ISO value to be set.
+    :param int or str or None s_speed: the shutter speed to be set.
+    :param str or None index_path: (optional) path to the capture index to record the picture in.
+    :param tracer: (optional) :class:`ricohapi.cameractl.trace.Tracer` to record the commands in.
+    :param dict cameras: (optional) base urls of the cameras by device id, see :func:`camera_url`
+    """
+    result = 'failed'
+    base_url = camera_url(devid, cameras)
+    try:
+        if index_path:
+            from capture_index import CaptureIndex
+            with CaptureIndex(index_path) as index:
+                still_picture(iso, s_speed, index, devid, tracer, base_url)
+        else:
+            still_picture(iso, s_speed, None, devid, tracer, base_url)
+    except ValueError as err:
+        LOG.warning(err)
+    except Exception as err: #pylint: disable=broad-except
+        LOG.warning(err)
+    else:
+        result = 'success'
+    finally:
+        LOG.debug('still picture %s.', result)
+
+def on_receive(devid, cmd, rcv_param, fun_param, #pylint: disable=too-many-arguments
+               index_path=None, trace_path=None, policy=None, cameras=None):
     """Called back when a camera control message is received.
+       The options of the start command are bound by :func:`receiver`.
 
     :param str or unicode(in Python2) devid: device id which is identified by received message.
     :param str or unicode(in Python2) cmd: now we supports only "shoot" command.
     :param dict or rcv_param: user specified callback function.
     :param fun_param: callback function arguments.
+    :param str or None index_path: (optional) path to the capture index to record the picture in.
+    :param str or None trace_path: (optional) path to append the spans of traced shots to.
+    :param str or None policy: (optional) admission policy of the shots to the camera,
+                               see :func:`parse_policy`. if ``None``, the picture is
+                               taken before returning.
+    :param dict cameras: (optional) base urls of the cameras by device id, see :func:`camera_url`
     """
 
     LOG.info('device   : %s', devid)
@@ -203,29 +392,70 @@ def on_receive(devid, cmd, rcv_param, fun_param):
             iso = iq_param.get('_iso', None)
             s_speed = iq_param.get('_shutterSpeed', None)
 
-        result = 'failed'
-        try:
-            still_picture(iso, s_speed)
-        except ValueError as err:
-            LOG.warning(err)
-        except Exception as err: #pylint: disable=broad-except
-            LOG.warning(err)
-        else:
-            result = 'success'
-        finally:
-            LOG.debug('still picture %s.', result)
+        tracer = open_tracer(trace_path) if trace_path else None
+        if policy is None:
+            take_still_picture(devid, iso, s_speed, index_path, tracer, cameras)
+            return
+
+        admission = camera_executor(devid, policy, cameras).submit(
+            take_still_picture, devid, iso, s_speed, index_path, tracer, cameras)
+        if not admission.accepted:
+            LOG.warning('rejected a shot to %s: %s', devid, admission.reason)
+
+def receiver(index_path=None, trace_path=None, policy=None, cameras=None):
+    """Get :func:`on_receive` bound to the options of the start command.
+       It keeps the name of on_receive for the profiler, and can be passed to worker processes.
+
+    :param str or None index_path: (optional) path to the capture index to record the pictures in.
+    :param str or None trace_path: (optional) path to append the spans of traced shots to.
+    :param str or None policy: (optional) admission policy of the shots to the camera.
+    :param dict cameras: (optional) base urls of the cameras by device id, see :func:`camera_url`
+    :rtype: function
+    """
+    callback = functools.partial(on_receive, index_path=index_path, trace_path=trace_path,
+                                 policy=policy, cameras=cameras)
+    return functools.update_wrapper(callback, on_receive)
+
+def load_config(config_file='./config.json'):
+    """Read credentials from the config file.
+
+    :param str config_file: (optional) path to the config file.
+    :rtype: dict
+    """
+    try:
+        with open(config_file, 'r') as settings:
+            config = json.load(settings)
+    except IOError:
+        raise ValueError('Could not read your config file. See the "./config_template.json"')
+
+    for key in ('USER', 'PASS', 'CLIENT_ID', 'CLIENT_SECRET', 'CA_CERTS'):
+        if not key in config:
+            raise ValueError('"{0}" is not found in your config file.'.format(key))
+    return config
 
-def main(): #pylint: disable=too-many-branches,too-many-locals
+def main(): #pylint: disable=too-many-branches,too-many-locals,too-many-statements
     """ main """
     dev_id = None
     send_param = None
+    workers = None
+    session = None
+    index_path = None
+    fire_in = None
+    trace_path = None
+    heartbeat = None
+    policy = 'queue'
+    profile_dir = None
+    record = None
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hd:p:', ['help', 'dev=', 'param='])
+        opts, args = getopt.getopt(sys.argv[1:], 'hd:p:w:s:i:a:t:b:q:P:r:',
+                                   ['help', 'dev=', 'param=', 'workers=', 'session=',
+                                    'index=', 'at=', 'trace=', 'heartbeat=', 'policy=',
+                                    'profile=', 'record='])
     except getopt.GetoptError as err:
         usage(err)
 
-    if opts == []:
+    if opts == [] and args != ['status']:
         usage('Specify options.')
 
     if len(args) != 1:
@@ -239,34 +469,128 @@ def main(): #pylint: disable=too-many-branches,too-many-locals
             dev_id = arg
         elif option in ('-p', '--param'):
             send_param = arg
+        elif option in ('-w', '--workers'):
+            try:
+                workers = int(arg)
+            except ValueError:
+                usage('Specify the number of workers.')
+        elif option in ('-s', '--session'):
+            session = arg
+        elif option in ('-i', '--index'):
+            index_path = arg
+        elif option in ('-a', '--at'):
+            try:
+                fire_in = float(arg)
+            except ValueError:
+                usage('Specify the seconds to fire the shot in.')
+        elif option in ('-t', '--trace'):
+            trace_path = arg
+        elif option in ('-b', '--heartbeat'):
+            try:
+                heartbeat = float(arg)
+            except ValueError:
+                usage('Specify the seconds between heartbeats.')
+        elif option in ('-q', '--policy'):
+            parse_policy(arg)
+            policy = arg
+        elif option in ('-P', '--profile'):
+            profile_dir = arg
+        elif option in ('-r', '--record'):
+            record = arg
         else:
             usage('Unhandled option.')
 
-    try:
-        config_file = './config.json'
-        with open(config_file, 'r') as settings:
-            config = json.load(settings)
-            user_id = config['USER']
-            user_pass = config['PASS']
-            client_id = config['CLIENT_ID']
-            client_secret = config['CLIENT_SECRET']
-            ca_certs = config['CA_CERTS']
-    except IOError:
-        raise ValueError('Could not read your config file. See the "./config_template.json"')
+    config = load_config()
+    user_id = config['USER']
+    user_pass = config['PASS']
+    client_id = config['CLIENT_ID']
+    client_secret = config['CLIENT_SECRET']
+    ca_certs = config['CA_CERTS']
+    cameras = config.get('CAMERAS')
+
+    if 'status' in args:
+        with Client(client_id, client_secret) as camera:
+            camera.connect(user_id, user_pass, ca_certs)
+            show_status(camera)
+        return
 
     if dev_id is None:
         usage('Specify device id.')
 
-    if 'shoot' in args:
-        with Client(client_id, client_secret) as camera:
+    tracer, trace_id = None, None
+    if trace_path:
+        from ricohapi.cameractl.trace import new_trace_id
+        tracer = open_tracer(trace_path)
+        trace_id = new_trace_id()
+        LOG.info('trace id: %s', trace_id)
+
+    if 'shoot' in args and fire_in is not None:
+        with Client(client_id, client_secret, tracer=tracer) as camera:
             camera.connect(user_id, user_pass, ca_certs)
-            camera.shoot(dev_id, param=validate_usr_param(send_param))
-    elif 'start' in args:
+            for device_id in dev_id.split(','):
+                estimate = camera.sync_clock(device_id)
+                LOG.info('%s: clock offset %.1f ms, latency %.1f ms', device_id,
+                         estimate.offset * 1e3, estimate.latency * 1e3)
+            fire_at = time.time() + fire_in
+            for device_id in dev_id.split(','):
+                camera.shoot(device_id, param=validate_usr_param(send_param), fire_at=fire_at,
+                             trace_id=trace_id)
+    elif 'shoot' in args:
+        with Client(client_id, client_secret, tracer=tracer) as camera:
+            camera.connect(user_id, user_pass, ca_certs)
+            camera.shoot(dev_id, param=validate_usr_param(send_param), trace_id=trace_id)
+    elif 'profile' in args:
+        try:
+            request = json.loads(send_param) if send_param else {}
+        except ValueError:
+            usage('Specify the profile request as JSON.')
         with Client(client_id, client_secret) as camera:
             camera.connect(user_id, user_pass, ca_certs)
-            camera.listen(dev_id, func=on_receive, fargs=('callback_args',))
+            for device_id in dev_id.split(','):
+                camera.request_profile(device_id, seconds=request.get('seconds', 30.0),
+                                       mode=request.get('mode', 'sample'))
+    elif 'start' in args and (workers is not None or ',' in dev_id):
+        from gateway import Gateway
+        gateway = Gateway(config, dev_id.split(','), workers=workers,
+                          func=receiver(index_path, trace_path, policy, cameras),
+                          fargs=('callback_args',), session=session, profile_dir=profile_dir,
+                          record=record, heartbeat=heartbeat,
+                          probe=functools.partial(theta_status, cameras=cameras))
+        gateway.start()
+        LOG.info('hit Ctr+C to quit.')
+        gateway.supervise()
+        gateway.stop()
+        close_tracers()
+    elif 'start' in args:
+        profiler, recorder, beat = None, None, None
+        if profile_dir:
+            from ricohapi.cameractl.profiling import open_profiler
+            profiler = open_profiler(profile_dir)
+        if record:
+            from ricohapi.cameractl.recording import Recorder
+            recorder = Recorder(record)
+        with Client(client_id, client_secret, tracer=tracer, profiler=profiler,
+                    recorder=recorder) as camera:
+            if session:
+                camera.connect(user_id, user_pass, ca_certs,
+                               profile=ConnectionProfile(clean_session=False),
+                               session_id='{0}-{1}'.format(session, dev_id))
+            else:
+                camera.connect(user_id, user_pass, ca_certs)
+            camera.listen(dev_id, func=receiver(index_path, trace_path, policy, cameras),
+                          fargs=('callback_args',))
+            if heartbeat:
+                from ricohapi.cameractl.fleet import Heartbeat
+                beat = Heartbeat(camera, dev_id, functools.partial(theta_status, dev_id, cameras),
+                                 heartbeat)
             LOG.info('connecting...')
             wait_key()
+            if beat is not None:
+                beat.stop()
+            stop_executors()
+        if recorder is not None:
+            recorder.close()
+        close_tracers()
     else:
         usage('specify correct command')
 
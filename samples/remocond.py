@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+"""
+Sample local daemon which keeps one connection to the ricoh vcp server
+and sends shooting messages requested over a Unix domain socket.
+
+USAGE
+  remocond.py [options] command
+
+COMMANDS
+  start               connect to ricoh vcp server and accept shoot requests
+  shoot               ask the running daemon to send shooting message
+
+OPTIONS
+  -h, --help          show this help message and exit.
+  -d, --dev=DEVID     specify the device id
+  -p, --param="str"   json string parameter to send with shooting, if need.
+  -s, --socket=PATH   path to the Unix domain socket. default to ./remocon.sock
+
+EXAMPLE
+  python remocond.py start
+  python remocond.py -dDEV01 shoot
+  python remocond.py -dDEV01 -p'{"_shutterSpeed": 0.01, "_iso": 200}' shoot
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import sys
+import json
+import os
+import socket
+import getopt
+from logging import getLogger, StreamHandler, INFO
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver #python2
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+LOG.setLevel(INFO)
+
+DEFAULT_SOCKET = './remocon.sock'
+
+
+def usage(message=None):
+    """Show usage."""
+    if not message is None:
+        LOG.info(message)
+    print(__doc__)
+    raise sys.exit(0)
+
+
+class ShootHandler(socketserver.StreamRequestHandler):
+    """Handles shoot requests of a connection, one JSON object per line.
+
+    request:  {"dev": "DEVID", "param": "json string parameter or null"}
+    response: {"result": "ok"} or {"result": "error", "reason": "..."}
+    """
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.execute(line)
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+class ShootServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix domain socket server which sends shooting messages
+       through an already connected client.
+       Only the user running the server can connect to the socket.
+
+    :param camera: a connected :class:`ricohapi.cameractl.client.Client`
+    :param str socket_path: (optional) path to the Unix domain socket
+    """
+    daemon_threads = True
+
+    def __init__(self, camera, socket_path=DEFAULT_SOCKET):
+        if os.path.exists(socket_path):
+            if is_running(socket_path):
+                raise DaemonError('daemon is already running on ' + socket_path)
+            os.remove(socket_path)
+
+        socketserver.UnixStreamServer.__init__(self, socket_path, ShootHandler)
+        self.camera = camera
+        self.socket_path = socket_path
+
+    def server_bind(self):
+        # create the socket without permissions for the others,
+        # so that there is no moment when another user can connect to it.
+        umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def execute(self, line):
+        """Send a shooting message requested by the line.
+
+        :param bytes line: JSON encoded request
+        :rtype: dict
+        :returns: response to the request
+        """
+        from remocon import validate_usr_param
+
+        try:
+            request = json.loads(line.decode('utf-8'))
+            self.camera.shoot(request['dev'], param=validate_usr_param(request.get('param')))
+        except Exception as err: #pylint: disable=broad-except
+            LOG.warning(err)
+            return {'result': 'error', 'reason': str(err) or err.__class__.__name__}
+        return {'result': 'ok'}
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def is_running(socket_path=DEFAULT_SOCKET):
+    """Check if a daemon is accepting requests on the socket.
+
+    :param str socket_path: (optional) path to the Unix domain socket
+    :rtype: bool
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+def send_shoot(dev_id, param=None, socket_path=DEFAULT_SOCKET, timeout=10.0):
+    """Ask the daemon to send a shooting message.
+
+    :param str dev_id: a device id to which you want to send a message.
+    :param str param: (optional) json string parameter to send with shooting.
+    :param str socket_path: (optional) path to the Unix domain socket
+    :param float timeout: (optional) seconds to wait for the response
+    :raises: DaemonError if the daemon could not send the message.
+    """
+    request = json.dumps({'dev': dev_id, 'param': param}) + '\n'
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error as err:
+            raise DaemonError('Could not connect to the daemon on {0}. {1}'.format(
+                socket_path, err))
+        sock.sendall(request.encode('utf-8'))
+        response = sock.makefile('rb').readline()
+    finally:
+        sock.close()
+
+    if not response:
+        raise DaemonError('The daemon closed the connection.')
+    response = json.loads(response.decode('utf-8'))
+    if response.get('result') != 'ok':
+        raise DaemonError(response.get('reason', 'unknown error'))
+
+
+def serve(socket_path=DEFAULT_SOCKET):
+    """Connect to the server and accept shoot requests until Ctr+C is input.
+
+    :param str socket_path: (optional) path to the Unix domain socket
+    """
+    from remocon import load_config
+    from ricohapi.cameractl.client import Client
+
+    config = load_config()
+    with Client(config['CLIENT_ID'], config['CLIENT_SECRET']) as camera:
+        camera.connect(config['USER'], config['PASS'], config['CA_CERTS'])
+        server = ShootServer(camera, socket_path)
+        LOG.info('accepting shoot requests on %s', socket_path)
+        LOG.info('hit Ctr+C to quit.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+def main():
+    """ main """
+    dev_id = None
+    send_param = None
+    socket_path = DEFAULT_SOCKET
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hd:p:s:',
+                                   ['help', 'dev=', 'param=', 'socket='])
+    except getopt.GetoptError as err:
+        usage(err)
+
+    for option, arg in opts:
+        if option in ('-h', '--help'):
+            usage()
+        elif option in ('-d', '--dev'):
+            dev_id = arg
+        elif option in ('-p', '--param'):
+            send_param = arg
+        elif option in ('-s', '--socket'):
+            socket_path = arg
+        else:
+            usage('Unhandled option.')
+
+    if 'start' in args:
+        serve(socket_path)
+    elif 'shoot' in args:
+        if dev_id is None:
+            usage('Specify device id.')
+        send_shoot(dev_id, send_param, socket_path)
+    else:
+        usage('specify correct command')
+
+
+class DaemonError(Exception):
+    """Daemon error"""
+    pass
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except ValueError as err:
+        LOG.warning(err)
+        sys.exit(-1)
+    except DaemonError as err:
+        LOG.warning(err)
+        sys.exit(-1)
+    except SystemExit as err:
+        sys.exit(err.args[0])
+    except:
+        raise
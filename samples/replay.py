@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+"""
+Replay the camera control messages recorded by remocon.py --record to a local broker.
+
+USAGE
+  replay.py [options] PATH ...
+
+OPTIONS
+  -h, --help          show this help message and exit.
+  -x, --speed=N       replay N times as fast as recorded. 0 replays as fast as possible.
+                      default to 1
+  -d, --dev=DEVID     send all the messages to DEVID instead of the recorded devices.
+  -u, --uid=UID       user id to publish under. default to the one of the first message.
+
+  Logs of several processes are merged in the order received.
+  Set MQTT_HOST and MQTT_PORT to change the broker from localhost:1883.
+
+EXAMPLE
+  python replay.py ./traffic.log
+  python replay.py -x10 ./traffic.log.*
+  python replay.py -x0 -dDEV01 ./traffic.log
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from itertools import chain
+from logging import getLogger, StreamHandler, INFO
+import getopt
+import os
+import socket
+import sys
+from ricohapi.cameractl.client import Client, CamTopic
+from ricohapi.cameractl.mqtt_client import ConnectionProfile
+from ricohapi.cameractl.recording import merge_records, replay
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+LOG.setLevel(INFO)
+getLogger('ricohapi.cameractl.recording').setLevel(INFO)
+
+BrokerInfo = namedtuple('BrokerInfo', ['uid', 'cid', 'token', 'host', 'port'])
+
+
+def usage(message=None):
+    """Show usage."""
+    if not message is None:
+        LOG.warning(message)
+    print(__doc__)
+    sys.exit(-1)
+
+
+def local_broker(uid):
+    """Get the access information of the local broker.
+
+    :param str uid: user id to publish under
+    :rtype: BrokerInfo
+    """
+    return BrokerInfo(uid, None, None, os.environ.get('MQTT_HOST', 'localhost'),
+                      int(os.environ.get('MQTT_PORT', '1883')))
+
+
+def replay_logs(paths, speed=1.0, device_id=None, uid=None):
+    """Replay the logs to the local broker.
+
+    :param paths: paths to the logs
+    :param float speed: (optional) times faster than recorded. 0 replays as fast as possible.
+    :param str device_id: (optional) device id to send all the messages to
+    :param str uid: (optional) user id to publish under. default to the one of the first message.
+    :rtype: :class:`ricohapi.cameractl.recording.ReplayStats`
+    """
+    records = merge_records(paths)
+    try:
+        first = next(records)
+    except StopIteration:
+        raise ValueError('No message is recorded.')
+    uid = uid or first.topic.split('/', 1)[0]
+
+    with Client(None, None) as client:
+        client.connect(uid, None, None, broker_info=local_broker(uid),
+                       profile=ConnectionProfile(max_inflight=100, tls=False))
+        return replay(client, chain([first], records), speed=speed, device_id=device_id)
+
+
+def main():
+    """ main """
+    speed = 1.0
+    device_id = None
+    uid = None
+
+    try:
+        opts, paths = getopt.getopt(sys.argv[1:], 'hx:d:u:', ['help', 'speed=', 'dev=', 'uid='])
+    except getopt.GetoptError as err:
+        usage(err)
+
+    for option, arg in opts:
+        if option in ('-h', '--help'):
+            usage()
+        elif option in ('-x', '--speed'):
+            try:
+                speed = float(arg)
+            except ValueError:
+                usage('Specify the speed as a number.')
+        elif option in ('-d', '--dev'):
+            if not CamTopic.validate_device_id(arg):
+                usage('The device id is not acceptable.')
+            device_id = arg
+        elif option in ('-u', '--uid'):
+            uid = arg
+        else:
+            usage('Unhandled option.')
+
+    if not paths:
+        usage('Specify the logs to replay.')
+
+    try:
+        replay_logs(paths, speed, device_id, uid)
+    except socket.error as err:
+        LOG.warning('could not connect to the broker: %s', err)
+        sys.exit(-1)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except (IOError, ValueError) as err:
+        LOG.warning(err)
+        sys.exit(-1)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""Exposure bracketing and burst sequences on RICOH THETA"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, StreamHandler
+import time
+from ricohapi.cameractl.clock import monotonic
+from exposure import DEFAULT_TABLE, exposure_options
+from transfer import BatchDownloader
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+
+
+class SequenceResult(namedtuple('SequenceResult', ['file_uris', 'shot_times', 'transfer'])):
+    """Result of a shooting sequence.
+
+    file_uris: list of the file uris taken.
+    shot_times: list of the monotonic clock times when each shot is requested.
+    transfer: :class:`transfer.TransferResult` or ``None`` if files are not downloaded.
+    """
+    __slots__ = ()
+
+    @property
+    def intervals(self):
+        """Shot-to-shot intervals in seconds."""
+        return [later - earlier for earlier, later in zip(self.shot_times, self.shot_times[1:])]
+
+
+def bracket(iso, s_speed, steps=(-3, 0, 3), table=DEFAULT_TABLE):
+    """Get exposure settings bracketing the shutter speed.
+
+    :param int iso: the ISO value to be set.
+    :param int or float or str s_speed: the shutter speed in the middle.
+    :param steps: (optional) offsets in the shutter speed table.
+                  3 steps make 1 EV with the THETA tables.
+    :param exposure.ExposureTable table: (optional) values supported by the camera model.
+    :rtype: list of dict
+    """
+    iso, s_speed = table.validate(iso, s_speed)
+    center = table.speeds.index(s_speed)
+    settings = []
+    for step in steps:
+        pos = min(max(center + step, 0), len(table.speeds) - 1)
+        settings.append({'iso': iso, 's_speed': table.speeds[pos]})
+    return settings
+
+
+def option_deltas(settings, table=DEFAULT_TABLE):
+    """Get the options to change before each shot.
+
+    :param settings: exposure settings of each shot.
+                     dict with optional keys ``iso`` and ``s_speed``.
+    :param exposure.ExposureTable table: (optional) values supported by the camera model.
+    :rtype: list of dict
+    :raises: ValueError if a setting is not supported.
+    """
+    current = {}
+    deltas = []
+    for setting in settings:
+        iso, s_speed = table.validate(setting.get('iso'), setting.get('s_speed'))
+        options = exposure_options(iso, s_speed)
+        delta = dict((key, value) for key, value in options.items() if current.get(key) != value)
+        current.update(delta)
+        deltas.append(delta)
+    return deltas
+
+
+def run_sequence(theta, settings, interval=None, #pylint: disable=too-many-arguments,too-many-locals
+                 dest_dir=None, max_in_flight=2, table=DEFAULT_TABLE, index=None, device_id=None):
+    """Take pictures with the exposure settings in one camera session.
+
+    Only the options which differ from the previous shot are set,
+    and taken files are downloaded while the next ones are taken.
+
+    :param theta: a :class:`thetav2.ThetaV2` instance
+    :param settings: exposure settings of each shot.
+                     dict with optional keys ``iso`` and ``s_speed``.
+    :param float interval: (optional) seconds between shots. if ``None``, as fast as possible.
+    :param str dest_dir: (optional) directory to download files in. if ``None``, not downloaded.
+    :param int max_in_flight: (optional) maximum number of concurrent downloads
+    :param exposure.ExposureTable table: (optional) values supported by the camera model.
+    :param index: (optional) :class:`capture_index.CaptureIndex` to record the pictures in
+    :param str device_id: (optional) device id to record the pictures with
+    :rtype: SequenceResult
+    """
+    deltas = option_deltas(settings, table)
+    exposures = [table.validate(setting.get('iso'), setting.get('s_speed'))
+                 for setting in settings]
+    downloader = None
+    if dest_dir is not None:
+        downloader = BatchDownloader(theta, dest_dir, max_in_flight, index=index,
+                                     device_id=device_id)
+
+    file_uris = []
+    shot_times = []
+    try:
+        with theta.session():
+            theta.set_options(captureMode='image')
+            start = monotonic()
+            for count, delta in enumerate(deltas):
+                if interval is not None:
+                    time.sleep(max(start + count * interval - monotonic(), 0))
+                if delta:
+                    theta.set_options(**delta)
+
+                shot_times.append(monotonic())
+                taken_at = time.time()
+                command_id = theta.take_picture()['id']
+                file_uri = theta.wait_for_picture(command_id)
+                file_uris.append(file_uri)
+                if index is not None:
+                    iso, s_speed = exposures[count]
+                    index.record(file_uri, device_id, taken_at, iso, s_speed)
+                if downloader is not None:
+                    downloader.submit(file_uri)
+    finally:
+        transfer = downloader.join() if downloader is not None else None
+
+    result = SequenceResult(file_uris, shot_times, transfer)
+    if result.intervals:
+        LOG.info('%d shots, shot-to-shot interval avg %.3f sec, max %.3f sec',
+                 len(file_uris), sum(result.intervals) / len(result.intervals),
+                 max(result.intervals))
+    return result
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+# pylint: disable=too-few-public-methods
+"""
+Smoke test for a sample program.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import threading
+import time
+from nose.tools import (assert_raises, eq_)
+from ricohapi.cameractl.trace import activate, current_trace_id
+from admission import CameraExecutor, theta_busy
+from remocon import parse_policy
+
+
+class FakeTheta(object):
+    def __init__(self, states):
+        self.states = list(states)
+
+    def get_state(self):
+        state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        return {'state': {'_captureStatus': state}}
+
+
+class TestCameraExecutor(object):
+    @staticmethod
+    def blocked_executor(policy, **kwargs):
+        """Executor whose first command runs until released."""
+        executor = CameraExecutor(policy, **kwargs)
+        started, release = threading.Event(), threading.Event()
+        def first():
+            started.set()
+            release.wait(5.0)
+        eq_(True, executor.submit(first).accepted)
+        assert started.wait(5.0)
+        return executor, release
+
+    def test_queue(self):
+        done = []
+        executor, release = self.blocked_executor('queue', max_queue=2)
+        eq_((True, None, 1), executor.submit(done.append, 1))
+        eq_((True, None, 2), executor.submit(done.append, 2))
+        eq_((False, 'queue is full', 2), executor.submit(done.append, 3))
+        eq_(True, executor.busy)
+        release.set()
+        assert executor.join(5.0)
+        eq_([1, 2], done)
+        eq_((3, 1, 0, 0, 3, 0), executor.stats)
+        eq_(False, executor.busy)
+        executor.stop()
+        eq_('executor is stopped', executor.submit(done.append, 4).reason)
+
+    def test_latest(self):
+        done = []
+        executor, release = self.blocked_executor('latest')
+        for i in range(5):
+            eq_(True, executor.submit(done.append, i).accepted)
+        eq_(1, len(executor))
+        release.set()
+        assert executor.join(5.0)
+        eq_([4], done)
+        eq_(4, executor.stats.collapsed)
+        executor.stop()
+
+    def test_reject(self):
+        done = []
+        executor, release = self.blocked_executor('reject')
+        eq_((False, 'camera is busy', 0), executor.submit(done.append, 1))
+        release.set()
+        assert executor.join(5.0)
+        eq_(True, executor.submit(done.append, 2).accepted)
+        assert executor.join(5.0)
+        eq_([2], done)
+        executor.stop()
+
+    def test_busy_camera(self):
+        done = []
+        theta = FakeTheta(['shooting', 'shooting', 'idle'])
+        executor = CameraExecutor(is_busy=lambda: theta_busy(theta), poll_interval=0.01)
+        executor.submit(done.append, 1)
+        assert executor.join(5.0)
+        eq_([1], done)
+        eq_(['idle'], theta.states)
+
+        theta.states = ['shooting']
+        executor.busy_timeout = 0.05
+        executor.submit(done.append, 2)
+        assert executor.join(5.0)
+        eq_([1], done)
+        eq_(1, executor.stats.expired)
+        executor.stop()
+
+    def test_max_age(self):
+        done = []
+        executor, release = self.blocked_executor('queue', max_age=0.05)
+        executor.submit(done.append, 1)
+        time.sleep(0.1)
+        release.set()
+        assert executor.join(5.0)
+        eq_([], done)
+        eq_(1, executor.stats.expired)
+        executor.stop()
+
+    @staticmethod
+    def test_failure_and_trace():
+        traces = []
+        def fail():
+            traces.append(current_trace_id())
+            raise IOError('camera is not found.')
+
+        executor = CameraExecutor()
+        with activate('abc'):
+            executor.submit(fail)
+        executor.submit(fail)
+        assert executor.join(5.0)
+        eq_(['abc', None], traces)
+        eq_(2, executor.stats.failed)
+        executor.stop()
+
+    @staticmethod
+    def test_assert():
+        assert_raises(ValueError, CameraExecutor, 'drop')
+        assert_raises(ValueError, CameraExecutor, max_queue=0)
+        eq_(('queue', 4), parse_policy('queue'))
+        eq_(('queue', 8), parse_policy('queue:8'))
+        eq_(('latest', 4), parse_policy('latest'))
+        assert_raises(ValueError, parse_policy, 'drop')
+        assert_raises(ValueError, parse_policy, 'queue:many')
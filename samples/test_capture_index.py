@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+"""
+Smoke test for the capture index.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import shutil
+import tempfile
+from nose.tools import eq_
+from capture_index import CaptureIndex, CaptureRecord
+from sequence import bracket, run_sequence
+from test_sequence import FakeTheta as FakeSequenceTheta
+from test_transfer import FakeTheta as FakeTransferTheta
+from transfer import batch_download
+
+class TestCaptureIndex(object):
+
+    @staticmethod
+    def test_query():
+        with CaptureIndex(':memory:') as index:
+            index.record('R001.JPG', 'DEV01', 100.0, 100, 0.01)
+            index.record('R002.JPG', 'DEV01', 200.0, 200, 0.0166666)
+            index.record('R003.JPG', 'DEV02', 150.0)
+            index.record('R003.JPG', 'DEV02', 300.0)
+            eq_(3, len(index))
+
+            eq_(['R001.JPG', 'R002.JPG'], [rec.file_uri for rec in index.query('DEV01')])
+            eq_(['R003.JPG'], [rec.file_uri for rec in index.query(since=200.5)])
+            eq_(['R001.JPG'], [rec.file_uri for rec in index.query(until=150.0)])
+            eq_(['R002.JPG'], [rec.file_uri for rec in index.query(s_speed=1.0 / 60)])
+            eq_(['R001.JPG'], [rec.file_uri for rec in index.query(iso=100, limit=1)])
+            eq_([], index.query('DEV03'))
+
+            eq_(CaptureRecord('DEV02', 'R003.JPG', 300.0, None, None, None, None),
+                index.latest())
+            eq_('R002.JPG', index.latest('DEV01').file_uri)
+            eq_(None, index.latest('DEV03'))
+
+    @staticmethod
+    def test_record_file():
+        with CaptureIndex(':memory:') as index:
+            index.record('R001.JPG', 'DEV01', 100.0)
+            index.record_file('R001.JPG', '/tmp/R001.JPG', 10, 'DEV01')
+            index.record_file('R002.JPG', '/tmp/R002.JPG', 20)
+            eq_(('/tmp/R001.JPG', 10), index.latest('DEV01')[5:])
+            record = index.query(limit=2)[-1]
+            eq_((None, 'R002.JPG', '/tmp/R002.JPG', 20),
+                (record.device_id, record.file_uri, record.path, record.size))
+
+    @staticmethod
+    def test_record_file_of_device():
+        with CaptureIndex(':memory:') as index:
+            index.record('100RICOH/R0010001.JPG', 'DEV01', 100.0)
+            index.record('100RICOH/R0010001.JPG', 'DEV02', 101.0)
+            index.record_file('100RICOH/R0010001.JPG', '/tmp/DEV02/R0010001.JPG', 20, 'DEV02')
+            eq_((None, None), index.latest('DEV01')[5:])
+            eq_(('/tmp/DEV02/R0010001.JPG', 20), index.latest('DEV02')[5:])
+            index.record_file('100RICOH/R0010001.JPG', '/tmp/DEV03/R0010001.JPG', 30, 'DEV03')
+            eq_(('/tmp/DEV03/R0010001.JPG', 30), index.latest('DEV03')[5:])
+            eq_(3, len(index))
+
+    @staticmethod
+    def test_persistent():
+        dest_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dest_dir, 'captures.db')
+            with CaptureIndex(path) as index:
+                index.record('R001.JPG', 'DEV01', 100.0)
+            with CaptureIndex(path) as index:
+                eq_('R001.JPG', index.latest('DEV01').file_uri)
+        finally:
+            shutil.rmtree(dest_dir)
+
+    @staticmethod
+    def test_capture_paths():
+        dest_dir = tempfile.mkdtemp()
+        try:
+            with CaptureIndex(':memory:') as index:
+                run_sequence(FakeSequenceTheta(), bracket(100, '1/100', steps=(0, 3)),
+                             index=index, device_id='DEV01')
+                records = index.query('DEV01')
+                eq_([(100, 0.01), (100, 0.02)], [(rec.iso, rec.s_speed) for rec in records])
+
+                theta = FakeTransferTheta({records[-1].file_uri: b'\xff\xd8abc\xff\xd9'})
+                batch_download(theta, dest_dir=dest_dir, index=index, device_id='DEV01')
+                record = index.latest('DEV01')
+                eq_(os.path.join(dest_dir, records[-1].file_uri), record.path)
+                eq_(7, record.size)
+        finally:
+            shutil.rmtree(dest_dir)
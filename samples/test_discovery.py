@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+"""
+Smoke test for camera discovery.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from nose.tools import (assert_raises, eq_)
+import discovery
+from discovery import CameraStatus, Discovery, expand_hosts
+
+class TestDiscovery(object):
+
+    @staticmethod
+    def test_expand_hosts():
+        eq_(['http://192.168.1.1', 'http://192.168.1.2'], expand_hosts(['192.168.1.0/30']))
+        eq_(['http://10.0.0.4', 'http://10.0.0.5'], expand_hosts(['10.0.0.5/31']))
+        eq_(['http://192.168.1.1'], expand_hosts(['192.168.1.1/32']))
+        eq_(254, len(expand_hosts(['192.168.1.0/24'])))
+        eq_(['http://theta.local', 'http://192.168.1.1:8080'],
+            expand_hosts(['theta.local', 'http://192.168.1.1:8080/']))
+        eq_(['http://192.168.1.2', 'http://192.168.1.1'],
+            expand_hosts(['192.168.1.2', '192.168.1.0/30', 'http://192.168.1.1/']))
+        for host in ['192.168.1.0/33', '192.168.1/x', '300.1.1.1/24']:
+            assert_raises(ValueError, expand_hosts, [host])
+
+    @staticmethod
+    def test_scan():
+        probed = []
+        def fake_probe(base_url, timeout, storage): #pylint: disable=unused-argument
+            probed.append(base_url)
+            if not base_url.endswith('.2'):
+                raise IOError('timed out')
+            return CameraStatus(base_url, 'RICOH THETA S', '01.82', '00001234', 0.8,
+                                1024, 10, 0.0)
+
+        original = discovery.probe
+        discovery.probe = fake_probe
+        try:
+            finder = Discovery(ttl=60.0, max_workers=2)
+            found = finder.scan(['192.168.1.0/29'])
+            eq_(['http://192.168.1.2'], [status.base_url for status in found])
+            eq_(6, len(probed))
+
+            eq_('RICOH THETA S', finder.status('http://192.168.1.2').model)
+            eq_(None, finder.status('http://192.168.1.3'))
+            eq_(6, len(probed))
+
+            finder.invalidate('http://192.168.1.2')
+            finder.scan(['192.168.1.0/29'])
+            eq_(7, len(probed))
+
+            finder = Discovery(ttl=0.0)
+            finder.scan(['192.168.1.2'])
+            finder.scan(['192.168.1.2', '192.168.1.2/32'])
+            eq_(9, len(probed))
+
+            # invalidated while another host is probed.
+            finder = Discovery(ttl=60.0, max_workers=1)
+            def invalidating_probe(base_url, timeout, storage):
+                if base_url.endswith('.3'):
+                    finder.invalidate()
+                return fake_probe(base_url, timeout, storage)
+            discovery.probe = invalidating_probe
+            eq_([], finder.scan(['192.168.1.2', '192.168.1.3']))
+        finally:
+            discovery.probe = original
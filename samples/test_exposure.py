@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+# pylint: disable=too-few-public-methods
+"""
+Smoke test for exposure tables.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from nose.tools import (assert_raises, eq_)
+from exposure import DEFAULT_TABLE, ExposureTable, camera_table, to_fraction
+
+class FakeTheta(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_options(self, *option_names): #pylint: disable=unused-argument
+        self.calls += 1
+        return {'results': {'options': {'isoSupport': [100, 200, 400],
+                                        'shutterSpeedSupport': [0.01, 0.0166666, 1, 0.3]}}}
+
+
+class TestExposure(object):
+
+    @staticmethod
+    def test_shutter_speed():
+        eq_(0.01, DEFAULT_TABLE.shutter_speed('1/100'))
+        eq_(0.01666666, DEFAULT_TABLE.shutter_speed(1 / 60))
+        eq_(60, DEFAULT_TABLE.shutter_speed(60.0))
+        eq_(0.00015625, DEFAULT_TABLE.nearest_speed(0.00001))
+        eq_(60, DEFAULT_TABLE.nearest_speed(100))
+        eq_(0.0125, DEFAULT_TABLE.nearest_speed(0.013))
+
+        for s_speed in [0.015, 0, -1, 100, '1/99', None, [0.01]]:
+            assert_raises(ValueError, DEFAULT_TABLE.shutter_speed, s_speed)
+
+    @staticmethod
+    def test_validate():
+        eq_((100, 0.5), DEFAULT_TABLE.validate(100, '1/2'))
+        eq_((None, 0.125), DEFAULT_TABLE.validate(None, '1/8'))
+        assert_raises(ValueError, DEFAULT_TABLE.validate, None, '1/6')
+        assert_raises(ValueError, DEFAULT_TABLE.validate, [100], None)
+
+    @staticmethod
+    def test_fraction():
+        eq_('1/60', to_fraction(0.0166666))
+        eq_('2.5/1', to_fraction(2.5))
+        eq_('1/3.33333', to_fraction(0.3))
+        eq_('7/1', to_fraction(7))
+
+    @staticmethod
+    def test_camera_table():
+        theta = FakeTheta()
+        table = camera_table(theta, model='TEST MODEL')
+        eq_(table, camera_table(theta, model='TEST MODEL'))
+        eq_(1, theta.calls)
+
+        eq_((200, 0.0166666), table.validate(200, '1/60'))
+        eq_(0.3, table.shutter_speed('1/3.33333'))
+        assert_raises(ValueError, table.validate, 800, None)
+        assert_raises(ValueError, table.shutter_speed, '1/1000')
+        eq_((0.01, 0.0166666, 0.3, 1), ExposureTable.from_camera(theta).speeds)
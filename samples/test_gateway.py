@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+"""
+Smoke test for the receiver gateway.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from nose.tools import (assert_raises, eq_)
+from gateway import Gateway, HashRing, session_id_of, shard_devices
+
+class TestGateway(object):
+
+    @staticmethod
+    def test_shard():
+        device_ids = ['DEV%04d' % i for i in range(1000)]
+        shards = shard_devices(device_ids, 4)
+        eq_(sorted(device_ids), sorted(sum(shards, [])))
+        for shard in shards:
+            assert 150 < len(shard) < 350
+
+        eq_(shards, shard_devices(device_ids, 4))
+
+    @staticmethod
+    def test_consistent():
+        device_ids = ['DEV%04d' % i for i in range(1000)]
+        ring4, ring5 = HashRing(range(4)), HashRing(range(5))
+        moved = [dev for dev in device_ids if ring4.node(dev) != ring5.node(dev)]
+        for dev in moved:
+            eq_(4, ring5.node(dev))
+        assert len(moved) < 350
+
+        assert_raises(ValueError, HashRing([]).node, 'DEV0001')
+
+    @staticmethod
+    def test_gateway():
+        gateway = Gateway({}, ['DEV01', 'DEV02'], workers=8)
+        eq_(['DEV01', 'DEV02'], sorted(sum(gateway.shards, [])))
+        assert len(gateway.shards) <= 2
+        assert_raises(ValueError, Gateway, {}, ['DEV01', 'DEV+'], workers=2)
+        assert_raises(ValueError, Gateway, {}, ['DEV01'], heartbeat=30.0)
+
+    @staticmethod
+    def test_session_id():
+        eq_(session_id_of('rcv', ['DEV01', 'DEV02']), session_id_of('rcv', ['DEV02', 'DEV01']))
+        assert session_id_of('rcv', ['DEV01']) != session_id_of('rcv', ['DEV01', 'DEV02'])
+        assert session_id_of('rcv', ['DEV01']).startswith('rcv-')
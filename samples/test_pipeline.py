@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+# pylint: disable=too-few-public-methods
+"""
+Smoke test for the post-capture processing pipeline.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import hashlib
+import os
+import shutil
+import tempfile
+from nose.tools import (assert_raises, eq_)
+from pipeline import (HashProcessor, Pipeline, TeeProcessor, save_stage)
+
+class FakeTheta(object):
+
+    def __init__(self, images):
+        self.images = images
+        self.opened = []
+
+    def iter_image(self, file_uri, chunk_size):
+        self.opened.append(file_uri)
+        image = self.images[file_uri]
+        for pos in range(0, len(image), chunk_size):
+            if image[pos:pos + chunk_size] == b'!':
+                raise IOError('connection lost')
+            yield image[pos:pos + chunk_size]
+
+
+class FakeUploader(object):
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+    def close(self):
+        return len(self.chunks)
+
+
+class TestPipeline(object):
+
+    @staticmethod
+    def test_process():
+        images = {'R001.JPG': b'0123456789', 'R002.JPG': b'abc'}
+        theta = FakeTheta(images)
+        uploaders = {}
+        def upload_stage(file_uri):
+            uploaders[file_uri] = FakeUploader()
+            return TeeProcessor(uploaders[file_uri])
+
+        dest_dir = tempfile.mkdtemp()
+        try:
+            def md5_stage(_file_uri):
+                return HashProcessor('md5')
+            with Pipeline(theta, [HashProcessor, save_stage(dest_dir), upload_stage, md5_stage],
+                          max_workers=2, chunk_size=4) as pipeline:
+                for file_uri in sorted(images):
+                    pipeline.submit(file_uri)
+            results = sorted(pipeline.join())
+
+            eq_(['R001.JPG', 'R002.JPG'], sorted(theta.opened))
+            eq_(['R001.JPG', 'R002.JPG'], [result.file_uri for result in results])
+            for result in results:
+                image = images[result.file_uri]
+                eq_(None, result.error)
+                eq_(len(image), result.size)
+                eq_(hashlib.sha256(image).hexdigest(), result.results['hash'])
+                eq_(hashlib.md5(image).hexdigest(), result.results['hash:3'])
+                with open(result.results['path'], 'rb') as fptr:
+                    eq_(image, fptr.read())
+                eq_(image, b''.join(uploaders[result.file_uri].chunks))
+            eq_(3, results[0].results['tee'])
+            assert_raises(ValueError, pipeline.submit, 'R003.JPG')
+        finally:
+            shutil.rmtree(dest_dir)
+
+    @staticmethod
+    def test_abort():
+        theta = FakeTheta({'R001.JPG': b'0123!'})
+        dest_dir = tempfile.mkdtemp()
+        try:
+            pipeline = Pipeline(theta, [save_stage(dest_dir)], chunk_size=4)
+            result = pipeline.process('R001.JPG')
+            assert isinstance(result.error, IOError)
+            eq_(4, result.size)
+            eq_({}, result.results)
+            eq_([], os.listdir(dest_dir))
+
+            theta.images['R001.JPG'] = b'0123'
+            eq_(None, pipeline.process('R001.JPG').error)
+            assert isinstance(pipeline.process('R001.JPG').error, OSError)
+            eq_(['R001.JPG'], os.listdir(dest_dir))
+            pipeline.join()
+        finally:
+            shutil.rmtree(dest_dir)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+# pylint: disable=too-few-public-methods
+"""
+Smoke test for the live preview.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from contextlib import contextmanager
+from nose.tools import (assert_raises, eq_)
+from preview import FrameParser, LivePreview
+
+def make_frame(index, size=100):
+    body = ('%05d' % index).encode('ascii') * (size // 5)
+    return b'\xff\xd8' + body + b'\xff\xd9'
+
+def make_stream(frames):
+    parts = []
+    for frame in frames:
+        parts.append(b'--boundary\r\nContent-Type: image/jpeg\r\n')
+        parts.append(('Content-Length: %d\r\n\r\n' % len(frame)).encode('ascii'))
+        parts.append(frame + b'\r\n')
+    return b''.join(parts)
+
+
+class FakeRaw(object):
+
+    def __init__(self, data, sizes):
+        self.data = data
+        self.sizes = sizes
+        self.pos = 0
+
+    def read1(self, amt):
+        size = min(self.sizes[0], amt)
+        self.sizes = self.sizes[1:] or self.sizes
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+class FakeBufferedRaw(FakeRaw):
+    """Stream with ``readinto1``, like :class:`io.BufferedReader`."""
+
+    def __init__(self, data, sizes):
+        super(FakeBufferedRaw, self).__init__(data, sizes)
+        self.views = []
+
+    def readinto1(self, view):
+        self.views.append(view)
+        chunk = self.read1(len(view))
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class FakeResponse(object):
+
+    def __init__(self, raw):
+        self.raw = raw
+
+
+def open_stream(data, sizes):
+    @contextmanager
+    def opener():
+        yield FakeResponse(FakeRaw(data, sizes))
+    return opener
+
+
+class TestPreview(object):
+
+    @staticmethod
+    def test_parser():
+        frames = [make_frame(i) for i in range(20)]
+        data = make_stream(frames)
+        for size in [1, 7, 64, 256]:
+            parser = FrameParser(capacity=512)
+            found = []
+            for pos in range(0, len(data), size):
+                parser.feed(data[pos:pos + size])
+                found.extend(bytes(frame) for frame in parser.frames())
+            eq_(frames, found)
+
+    @staticmethod
+    def test_parser_overflow():
+        parser = FrameParser(capacity=64)
+        data = make_stream([make_frame(0, size=100)])
+        for pos in range(0, len(data), 32):
+            parser.feed(data[pos:pos + 32])
+            eq_([], parser.frames())
+        data = make_stream([make_frame(1, size=20)])
+        found = []
+        for pos in range(0, len(data), 32):
+            parser.feed(data[pos:pos + 32])
+            found.extend(bytes(frame) for frame in parser.frames())
+        eq_([make_frame(1, size=20)], found)
+        assert_raises(ValueError, parser.writable, 65)
+
+    @staticmethod
+    def test_live_preview():
+        frames = [make_frame(i) for i in range(10)]
+        data = make_stream(frames)
+
+        preview = LivePreview(open_stream(data, [50]), skip_frames=True)
+        eq_(frames, [bytes(frame) for frame in preview])
+        eq_((10, 10, 0), (preview.received, preview.frames, preview.dropped))
+        assert preview.fps > 0
+
+        preview = LivePreview(open_stream(data, [len(data) // 2 + 1]), skip_frames=True)
+        eq_([frames[4], frames[9]], [bytes(frame) for frame in preview])
+        eq_((10, 2, 8), (preview.received, preview.frames, preview.dropped))
+
+        preview = LivePreview(open_stream(data, [len(data)]), skip_frames=False)
+        eq_(frames, [bytes(frame) for frame in preview])
+
+        preview = LivePreview(open_stream(data, [50]), max_fps=0.001)
+        eq_([frames[0]], [bytes(frame) for frame in preview])
+        eq_(9, preview.dropped)
+
+    @staticmethod
+    def test_readinto():
+        frames = [make_frame(i) for i in range(10)]
+        data = make_stream(frames)
+        raw = FakeBufferedRaw(data, [50])
+
+        @contextmanager
+        def opener():
+            yield FakeResponse(raw)
+        preview = LivePreview(opener, skip_frames=False, buffer_size=512, read_size=64)
+        eq_(frames, [bytes(frame) for frame in preview])
+        # the data is read into the buffer of the parser, not copied from a chunk.
+        eq_(set([64]), set(len(view) for view in raw.views))
+        assert all(isinstance(view, memoryview) for view in raw.views)
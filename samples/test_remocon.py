@@ -2,14 +2,20 @@
 # Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
 # pylint: disable=C0302
 # pylint: disable=missing-docstring
+# pylint: disable=too-few-public-methods
 """
 Smoke test for a sample program.
 """
 
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
-from nose.tools import (assert_raises, eq_)
-from remocon import validate_iso_and_shutter, validate_usr_param
+import os
+import shutil
+import tempfile
+from nose.tools import (assert_raises, eq_, ok_)
+import thetav2
+from remocon import (camera_lock, close_tracers, open_tracer, theta_status,
+                     validate_iso_and_shutter, validate_usr_param)
 
 class TestIsoShutter(object):
 
@@ -82,3 +88,63 @@ class TestUsrParam(object):
     def test_param_assert():
         assert_raises(ValueError, validate_usr_param, {"_iso": 100})
         assert_raises(ValueError, validate_usr_param, '{"_shutter"}')
+
+
+class FakeTheta(object):
+    """Stand-in of ThetaV2 which records the commands to each camera."""
+    calls = []
+
+    def __init__(self, base_url, timeout=None):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def get_state(self):
+        FakeTheta.calls.append((self.base_url, 'state'))
+        return {'state': {'batteryLevel': 0.8, '_captureStatus': 'idle'}}
+
+    def get_options(self, *_):
+        FakeTheta.calls.append((self.base_url, 'options'))
+        return {'results': {'options': {'remainingSpace': 1024}}}
+
+
+class TestStatus(object):
+
+    @staticmethod
+    def test_theta_status():
+        original, thetav2.ThetaV2 = thetav2.ThetaV2, FakeTheta
+        cameras = {'DEV02': 'http://192.168.1.2'}
+        try:
+            eq_({'battery': 0.8, 'free_storage': 1024, 'busy': False},
+                theta_status('DEV02', cameras))
+            # a shot holds the camera, whose session is not disturbed.
+            with camera_lock('DEV02'):
+                eq_(None, theta_status('DEV02', cameras)['free_storage'])
+            eq_(1024, theta_status('DEV01', cameras)['free_storage'])
+        finally:
+            thetav2.ThetaV2 = original
+        eq_([('http://192.168.1.2', 'state'), ('http://192.168.1.2', 'options'),
+             ('http://192.168.1.2', 'state'),
+             ('http://192.168.1.1', 'state'), ('http://192.168.1.1', 'options')], FakeTheta.calls)
+
+
+class TestTracers(object):
+
+    @staticmethod
+    def test_close_tracers():
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'trace.jsonl')
+        try:
+            tracer = open_tracer(path)
+            ok_(tracer is open_tracer(path))
+            close_tracers()
+            ok_(tracer.sink.closed)
+            # a span recorded after the shutdown is dropped, and the file is opened again.
+            tracer.record('publish', 0.0, 1.0, trace_id='0123')
+            reopened = open_tracer(path)
+            ok_(reopened is not tracer)
+            reopened.record('publish', 0.0, 1.0, trace_id='0123')
+            close_tracers()
+            with open(path) as fptr:
+                eq_(1, len(fptr.readlines()))
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+# pylint: disable=too-few-public-methods
+"""
+Smoke test for the local shoot daemon.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from nose.tools import (assert_raises, eq_)
+from remocond import DaemonError, ShootServer, is_running, send_shoot
+
+class FakeCamera(object):
+
+    def __init__(self):
+        self.shots = []
+
+    def shoot(self, device_id, param=None):
+        if device_id == 'DEV%':
+            raise ValueError('The device id is not acceptable.')
+        self.shots.append((device_id, param))
+
+
+class TestDaemon(object):
+
+    def __init__(self):
+        self.tmp_dir = None
+        self.socket_path = None
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp_dir, 'remocon.sock')
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_shoot(self):
+        camera = FakeCamera()
+        server = ShootServer(camera, self.socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            eq_(0, stat.S_IMODE(os.stat(self.socket_path).st_mode) & 0o077)
+            assert is_running(self.socket_path)
+            assert_raises(DaemonError, ShootServer, camera, self.socket_path)
+
+            send_shoot('DEV01', socket_path=self.socket_path)
+            send_shoot('DEV02', '{"_iso": 100}', socket_path=self.socket_path)
+            assert_raises(DaemonError, send_shoot, 'DEV%', socket_path=self.socket_path)
+            assert_raises(DaemonError, send_shoot, 'DEV03', '{"_iso"}',
+                          socket_path=self.socket_path)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        eq_([('DEV01', None), ('DEV02', {'_iso': 100})], camera.shots)
+        assert not os.path.exists(self.socket_path)
+        assert not is_running(self.socket_path)
+        assert_raises(DaemonError, send_shoot, 'DEV01', socket_path=self.socket_path)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+"""
+Smoke test for shooting sequences.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from contextlib import contextmanager
+from nose.tools import (assert_raises, eq_)
+from sequence import SequenceResult, bracket, option_deltas, run_sequence
+
+class FakeTheta(object):
+
+    def __init__(self):
+        self.commands = []
+
+    @contextmanager
+    def session(self):
+        self.commands.append('startSession')
+        yield 'SID_0001'
+        self.commands.append('closeSession')
+
+    def set_options(self, **options):
+        self.commands.append(options)
+
+    def take_picture(self):
+        self.commands.append('takePicture')
+        return {'id': str(len(self.commands))}
+
+    @staticmethod
+    def wait_for_picture(command_id):
+        return 'R%s.JPG' % command_id
+
+
+class TestSequence(object):
+
+    @staticmethod
+    def test_bracket():
+        eq_([{'iso': 100, 's_speed': 0.005}, {'iso': 100, 's_speed': 0.01},
+             {'iso': 100, 's_speed': 0.02}], bracket(100, '1/100'))
+        eq_([{'iso': 100, 's_speed': 0.00015625}, {'iso': 100, 's_speed': 0.0002}],
+            bracket(100, '1/5000', steps=(-3, 0)))
+        assert_raises(ValueError, bracket, 101, '1/100')
+
+    @staticmethod
+    def test_option_deltas():
+        deltas = option_deltas([{'iso': 100, 's_speed': 0.01}, {'iso': 100, 's_speed': 0.02},
+                                {'iso': 100, 's_speed': 0.02}, {}])
+        eq_([{'exposureProgram': 1, 'iso': 100, 'shutterSpeed': 0.01},
+             {'shutterSpeed': 0.02}, {}, {'exposureProgram': 2}], deltas)
+        assert_raises(ValueError, option_deltas, [{'s_speed': 60}])
+
+    @staticmethod
+    def test_run_sequence():
+        theta = FakeTheta()
+        result = run_sequence(theta, bracket(100, '1/100', steps=(0, 3)))
+        eq_(['startSession', {'captureMode': 'image'},
+             {'exposureProgram': 1, 'iso': 100, 'shutterSpeed': 0.01}, 'takePicture',
+             {'shutterSpeed': 0.02}, 'takePicture', 'closeSession'], theta.commands)
+        eq_(['R4.JPG', 'R6.JPG'], result.file_uris)
+        eq_(1, len(result.intervals))
+        eq_(None, result.transfer)
+
+    @staticmethod
+    def test_intervals():
+        eq_([1.0, 2.0], SequenceResult([], [1.0, 2.0, 4.0], None).intervals)
+        eq_([], SequenceResult([], [1.0], None).intervals)
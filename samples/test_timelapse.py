@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+"""
+Smoke test for time-lapses.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from nose.tools import (assert_raises, eq_)
+import timelapse
+from timelapse import TimelapseResult, run_timelapse
+
+
+class FakeTheta(object):
+
+    def __init__(self, capture_times=()):
+        self.commands = []
+        self.capture_times = list(capture_times)
+
+    @contextmanager
+    def session(self):
+        self.commands.append('startSession')
+        yield 'SID_0001'
+        self.commands.append('closeSession')
+
+    def set_options(self, **options):
+        self.commands.append(options)
+
+    def get_options(self, *option_names):
+        self.commands.append('getOptions')
+        return dict((name, None) for name in option_names)
+
+    def take_picture(self):
+        self.commands.append('takePicture')
+        if self.capture_times:
+            time.sleep(self.capture_times.pop(0))
+        return {'id': str(len(self.commands))}
+
+    @staticmethod
+    def wait_for_picture(command_id):
+        return 'R%s.JPG' % command_id
+
+    @staticmethod
+    def save_image(file_uri, save_path, override_file=False): #pylint: disable=unused-argument
+        with open(save_path, 'wb') as fptr:
+            fptr.write(file_uri.encode('utf-8'))
+        return len(file_uri)
+
+
+class TestTimelapse(object):
+
+    @staticmethod
+    def test_deadlines():
+        theta = FakeTheta([0.03] * 4)
+        result = run_timelapse(theta, 0.05, frames=4, iso=100, s_speed='1/100')
+        eq_(['startSession', {'captureMode': 'image'},
+             {'exposureProgram': 1, 'iso': 100, 'shutterSpeed': 0.01}] + ['takePicture'] * 4 +
+            ['closeSession'], theta.commands)
+        eq_(4, len(result.file_uris))
+        for count, deadline in enumerate(result.deadlines):
+            assert abs(deadline - result.deadlines[0] - count * 0.05) < 1e-9
+        assert all(0 <= late < 0.03 for late in result.lateness)
+        eq_((4, 0), result.jitter[:2])
+
+    @staticmethod
+    def test_overrun():
+        dest_dir = tempfile.mkdtemp()
+        try:
+            theta = FakeTheta([0.25, 0.0, 0.0])
+            result = run_timelapse(theta, 0.1, frames=5, dest_dir=dest_dir)
+            eq_(1, result.skipped)
+            eq_(4, len(result.file_uris))
+            eq_([0, 2, 3, 4], [int(round((deadline - result.deadlines[0]) / 0.1))
+                               for deadline in result.deadlines])
+            eq_(sorted(result.file_uris), sorted(result.transfer.files))
+            eq_(sorted(result.file_uris), sorted(os.listdir(dest_dir)))
+
+            theta = FakeTheta([0.35])
+            eq_(2, run_timelapse(theta, 0.1, frames=3).skipped)
+        finally:
+            shutil.rmtree(dest_dir)
+
+    @staticmethod
+    def test_stop_and_keepalive():
+        margin = timelapse.KEEPALIVE_MARGIN
+        timelapse.KEEPALIVE_MARGIN = 0.01
+        try:
+            theta = FakeTheta()
+            stop_event = threading.Event()
+            threading.Timer(0.5, stop_event.set).start()
+            result = run_timelapse(theta, 0.3, stop_event=stop_event, keepalive=0.05)
+            eq_(2, len(result.file_uris))
+            assert theta.commands.count('getOptions') >= 2
+            eq_('closeSession', theta.commands[-1])
+        finally:
+            timelapse.KEEPALIVE_MARGIN = margin
+
+    @staticmethod
+    def test_jitter():
+        result = TimelapseResult([], [0.0, 1.0, 2.0, 3.0], [0.01, 1.0, 2.03, 3.02], 2, None)
+        jitter = result.jitter
+        eq_((4, 2), jitter[:2])
+        assert abs(jitter.mean - 0.015) < 1e-9
+        assert abs(jitter.max - 0.03) < 1e-9
+        assert abs(jitter.p99 - 0.03) < 1e-9
+        eq_((0, 0, 0.0, 0.0, 0.0, 0.0), TimelapseResult([], [], [], 0, None).jitter)
+
+    @staticmethod
+    def test_assert():
+        assert_raises(ValueError, run_timelapse, FakeTheta(), 0, frames=1)
+        assert_raises(ValueError, run_timelapse, FakeTheta(), 1.0)
+        assert_raises(ValueError, run_timelapse, FakeTheta(), 1.0, frames=1, iso=101)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+# pylint: disable=too-few-public-methods
+"""
+Smoke test for batch transfer.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import shutil
+import tempfile
+from nose.tools import (assert_raises, eq_)
+from thetav2 import ThetaError
+from transfer import (BatchDownloader, TransferResult, batch_download, discover_files,
+                      resumable_download)
+
+class FakeTheta(object):
+
+    def __init__(self, images):
+        self.images = images
+        self.deleted = []
+
+    def save_image(self, file_uri, save_path, override_file=False): #pylint: disable=unused-argument
+        image = self.images[file_uri]
+        if image is None:
+            raise IOError('connection lost')
+        dir_path = os.path.dirname(save_path)
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        with open(save_path, 'wb') as fptr:
+            fptr.write(image)
+        return len(image)
+
+    def list_images(self, entry_count, continuation_token=None):
+        uris = sorted(self.images)
+        start = int(continuation_token) if continuation_token else 0
+        entries = [{'fileUri': uri} for uri in uris[start:start + entry_count]]
+        results = {'entries': entries}
+        if start + entry_count < len(uris):
+            results['continuationToken'] = str(start + entry_count)
+        return {'results': results}
+
+    def delete_files(self, file_uris):
+        self.deleted.append(list(file_uris))
+
+
+class FakeResponse(object):
+
+    def __init__(self, data, offset, drop_at=None, content_range=True):
+        self.data = data[offset:]
+        self.drop_at = drop_at
+        if offset:
+            self.status_code = 206
+            self.headers = {'Content-Length': str(len(self.data))}
+            if content_range:
+                self.headers['Content-Range'] = 'bytes %d-%d/%d' % (offset, len(data) - 1,
+                                                                    len(data))
+        else:
+            self.status_code = 200
+            self.headers = {'Content-Length': str(len(self.data))}
+
+    def iter_content(self, chunk_size):
+        for pos in range(0, len(self.data), chunk_size):
+            chunk = self.data[pos:pos + chunk_size]
+            if self.drop_at is not None and pos + len(chunk) > self.drop_at:
+                yield chunk[:self.drop_at - pos]
+                raise IOError('connection lost')
+            yield chunk
+
+    def close(self):
+        pass
+
+
+class FlakyTheta(object):
+
+    def __init__(self, data, drops, content_range=True):
+        self.data = data
+        self.drops = list(drops)
+        self.content_range = content_range
+        self.offsets = []
+
+    def open_image(self, file_uri, offset=0): #pylint: disable=unused-argument
+        self.offsets.append(offset)
+        drop_at = self.drops.pop(0) if self.drops else None
+        return FakeResponse(self.data, offset, drop_at, self.content_range)
+
+
+class TestBatchTransfer(object):
+
+    def __init__(self):
+        self.dest_dir = None
+
+    def setup(self):
+        self.dest_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.dest_dir)
+
+    def test_download_and_delete(self):
+        theta = FakeTheta({'100RICOH/R001.JPG': b'a' * 10,
+                           '100RICOH/R002.JPG': b'b' * 20,
+                           '100RICOH/R003.JPG': None})
+        result = batch_download(theta, dest_dir=self.dest_dir, max_in_flight=2, delete_file=True)
+
+        eq_(['100RICOH/R001.JPG', '100RICOH/R002.JPG'], sorted(result.files))
+        eq_(['100RICOH/R003.JPG'], list(result.failed))
+        eq_(30, result.size)
+        eq_(1, len(theta.deleted))
+        eq_(sorted(result.files), sorted(theta.deleted[0]))
+        with open(os.path.join(self.dest_dir, '100RICOH/R002.JPG'), 'rb') as fptr:
+            eq_(b'b' * 20, fptr.read())
+
+    def test_discover(self):
+        theta = FakeTheta(dict(('R%03d.JPG' % i, b'x') for i in range(5)))
+        eq_(['R000.JPG', 'R002.JPG', 'R003.JPG', 'R004.JPG'],
+            discover_files(theta, known=['R001.JPG'], entry_count=2))
+
+    def test_join(self):
+        downloader = BatchDownloader(FakeTheta({}), dest_dir=self.dest_dir)
+        eq_([], downloader.join().files)
+        assert_raises(ValueError, downloader.submit, 'R001.JPG')
+        assert_raises(ValueError, BatchDownloader, FakeTheta({}), max_in_flight=0)
+
+    def test_resume(self):
+        data = b'\xff\xd8' + os.urandom(200000) + b'\xff\xd9'
+        theta = FlakyTheta(data, [70000, 70000])
+        save_path = os.path.join(self.dest_dir, 'R001.JPG')
+        eq_(len(data), resumable_download(theta, 'R001.JPG', save_path, backoff=0))
+        eq_(0, theta.offsets[0])
+        assert 0 < theta.offsets[1] < theta.offsets[2] < len(data)
+        with open(save_path, 'rb') as fptr:
+            eq_(data, fptr.read())
+        assert not os.path.exists(save_path + '.part')
+        assert_raises(OSError, resumable_download, theta, 'R001.JPG', save_path)
+
+        # a part without Content-Range is not appended. the transfer starts over.
+        theta = FlakyTheta(data, [70000], content_range=False)
+        save_path = os.path.join(self.dest_dir, 'R002.JPG')
+        eq_(len(data), resumable_download(theta, 'R002.JPG', save_path, backoff=0))
+        eq_([0, 70000, 0], theta.offsets)
+        with open(save_path, 'rb') as fptr:
+            eq_(data, fptr.read())
+
+    def test_resume_assert(self):
+        save_path = os.path.join(self.dest_dir, 'R002.JPG')
+        theta = FlakyTheta(b'\xff\xd8abc', [1, 1, 1])
+        assert_raises(IOError, resumable_download, theta, 'R002.JPG', save_path,
+                      retries=2, backoff=0)
+        eq_(3, len(theta.offsets))
+        assert_raises(ThetaError, resumable_download, FlakyTheta(b'\xff\xd8abc', []),
+                      'R002.JPG', save_path, backoff=0)
+        assert_raises(ThetaError, resumable_download, FlakyTheta(b'\xff\xd8\xff\xd9', []),
+                      'R002.JPG', save_path, expected_size=10, backoff=0)
+        assert not os.path.exists(save_path)
+
+    @staticmethod
+    def test_mbps():
+        eq_(2.0, TransferResult([], {}, 4 * 1000 * 1000, 2.0).mbps)
+        eq_(0.0, TransferResult([], {}, 10, 0).mbps)
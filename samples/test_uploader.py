@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
+"""
+Smoke test for the streaming upload with a local stand-in of media storage.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import json
+import threading
+from nose.tools import (assert_raises, eq_)
+from pipeline import HashProcessor, Pipeline
+from uploader import (MediaStorageUploader, MediaUploader, UploadError, UploadProcessor,
+                      stream_stage, upload_stage)
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer #python2
+    from SocketServer import ThreadingMixIn #python2
+
+
+class StandInStorage(ThreadingMixIn, HTTPServer):
+    """Media storage which keeps the uploads in memory."""
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.uploads = {}
+        self.media = {}
+        self.failures = {}
+        self.started = 0
+        self.connections = 0
+        self.puts = 0
+        self.max_part = 0
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args): #pylint: disable=arguments-differ
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def reply(self, status, obj=None):
+        body = json.dumps(obj or {}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def body(self):
+        if self.headers.get('Transfer-Encoding') != 'chunked':
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        data = b''
+        while True:
+            line = self.rfile.readline()
+            if not line.endswith(b'\r\n'):
+                return None
+            size = int(line.split(b';')[0], 16)
+            data += self.rfile.read(size)
+            if self.rfile.readline() != b'\r\n':
+                return None
+            if not size:
+                return data
+
+    def store_media(self):
+        storage = self.server
+        data = self.body()
+        if data is None:
+            self.close_connection = True
+            return None
+        if self.headers.get('Authorization') != 'Bearer TOKEN':
+            return self.reply(401)
+        with storage.lock:
+            media_id = 'M{0}'.format(len(storage.media) + 1)
+            storage.media[media_id] = data
+        return self.reply(200, {'id': media_id, 'bytes': len(data),
+                                'content_type': self.headers.get('Content-Type')})
+
+    def do_POST(self): #pylint: disable=invalid-name
+        if self.path == '/media':
+            return self.store_media()
+        storage = self.server
+        request = json.loads(self.body().decode('utf-8'))
+        levels = self.path.strip('/').split('/')
+        with storage.lock:
+            if levels == ['uploads']:
+                storage.started += 1
+                upload_id = 'U{0}'.format(storage.started)
+                storage.uploads[upload_id] = {'name': request['name'], 'parts': {}}
+                return self.reply(200, {'id': upload_id})
+            upload = storage.uploads.pop(levels[1])
+            data = b''.join(upload['parts'][i] for i in range(request['parts']))
+            if len(data) != request['size']:
+                return self.reply(400)
+            storage.media[upload['name']] = data
+            return self.reply(200, {'name': upload['name'], 'size': len(data)})
+
+    def do_PUT(self): #pylint: disable=invalid-name
+        storage = self.server
+        data = self.body()
+        _, upload_id, index = self.path.strip('/').split('/')
+        with storage.lock:
+            storage.puts += 1
+            storage.max_part = max(storage.max_part, len(data))
+            failures = storage.failures.get(int(index), 0)
+            if failures:
+                storage.failures[int(index)] = failures - 1
+                return self.reply(503)
+            storage.uploads[upload_id]['parts'][int(index)] = data
+        return self.reply(200)
+
+    def do_DELETE(self): #pylint: disable=invalid-name
+        with self.server.lock:
+            self.server.uploads.pop(self.path.strip('/').split('/')[1], None)
+        self.reply(200)
+
+
+class FakeTheta(object):
+
+    def __init__(self, images):
+        self.images = images
+
+    def iter_image(self, file_uri, chunk_size):
+        image = self.images[file_uri]
+        for pos in range(0, len(image), chunk_size):
+            if image[pos:pos + chunk_size].startswith(b'!'):
+                raise IOError('connection lost')
+            yield image[pos:pos + chunk_size]
+
+
+class TestUploader(object):
+
+    def __init__(self):
+        self.storage = None
+
+    def setup(self):
+        self.storage = StandInStorage()
+
+    def teardown(self):
+        self.storage.stop()
+
+    def test_pipeline(self):
+        images = dict(('R{0:03d}.JPG'.format(i), bytes(bytearray(range(i, 256))) * 40)
+                      for i in range(6))
+        self.storage.failures = {1: 2}
+        with MediaUploader(self.storage.url, token='TOKEN', backoff=0.01,
+                           max_senders=2) as uploader:
+            with Pipeline(FakeTheta(images), [HashProcessor, upload_stage(uploader, 1000, 2)],
+                          max_workers=3, chunk_size=300) as pipeline:
+                for file_uri in sorted(images):
+                    pipeline.submit(file_uri)
+            results = pipeline.join()
+        assert_raises(UploadError, UploadProcessor, uploader, 'R006.JPG')
+
+        eq_([None] * 6, [result.error for result in results])
+        eq_(images, self.storage.media)
+        for result in results:
+            eq_({'name': result.file_uri, 'size': len(images[result.file_uri])},
+                result.results['upload'])
+        eq_(1000, self.storage.max_part)
+        parts = sum((len(image) + 999) // 1000 for image in images.values())
+        eq_(parts + 2, self.storage.puts)
+        eq_({}, self.storage.uploads)
+        # a session per sender and per worker, each keeping its connection
+        assert self.storage.connections <= 2 + 3
+
+    def test_empty_file(self):
+        with MediaUploader(self.storage.url) as uploader:
+            processor = UploadProcessor(uploader, 'EMPTY.JPG')
+            eq_(0, processor.finish()['size'])
+        eq_(b'', self.storage.media['EMPTY.JPG'])
+        eq_(0, self.storage.puts)
+
+    def test_failure(self):
+        uploader = MediaUploader(self.storage.url, retries=1, backoff=0.01, max_senders=1)
+        self.storage.failures = {0: 5}
+        processor = UploadProcessor(uploader, 'R001.JPG', part_size=10, max_parts=1)
+        processor.update(b'0123456789')
+        assert_raises(UploadError, processor.finish)
+        processor.abort()
+        eq_({}, self.storage.uploads)
+
+        images = {'R002.JPG': b'0123456789!'}
+        result = Pipeline(FakeTheta(images), [upload_stage(uploader, 4)],
+                          max_workers=1, chunk_size=10).process('R002.JPG')
+        eq_(IOError, type(result.error))
+        eq_({}, self.storage.uploads)
+        assert_raises(ValueError, UploadProcessor, uploader, 'R003.JPG', max_parts=0)
+        assert_raises(ValueError, MediaUploader, self.storage.url, max_senders=0)
+        uploader.close()
+
+    def test_media_storage(self):
+        images = dict(('R{0:03d}.JPG'.format(i), bytes(bytearray(range(i, 256))) * 40)
+                      for i in range(6))
+        images['R006.JPG'] = b'0' * 300 + b'!'
+        with MediaStorageUploader(lambda: 'TOKEN', self.storage.url,
+                                  max_senders=2) as uploader:
+            with Pipeline(FakeTheta(images), [HashProcessor, stream_stage(uploader, 2)],
+                          max_workers=3, chunk_size=300) as pipeline:
+                for file_uri in sorted(images):
+                    pipeline.submit(file_uri)
+            results = dict((result.file_uri, result) for result in pipeline.join())
+
+        eq_(IOError, type(results.pop('R006.JPG').error))
+        eq_(6, len(self.storage.media))
+        for file_uri, result in results.items():
+            eq_(None, result.error)
+            media = result.results['upload']
+            eq_(len(images[file_uri]), media['bytes'])
+            eq_('image/jpeg', media['content_type'])
+            eq_(images[file_uri], self.storage.media[media['id']])
+        # a connection per sender, and one more after the aborted upload
+        assert self.storage.connections <= 2 + 1
+
+        with MediaStorageUploader('EXPIRED', self.storage.url) as uploader:
+            result = Pipeline(FakeTheta(images), [stream_stage(uploader)],
+                              max_workers=1, chunk_size=300).process('R001.JPG')
+        eq_(401, result.error.response.status_code)
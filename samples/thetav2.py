@@ -3,21 +3,60 @@
 
 """RICOH THETA API v2 simple wrapper module"""
 from __future__ import print_function
+from contextlib import contextmanager
 from logging import getLogger, StreamHandler
 import os
 import json
+import time
 import requests
 LOG = getLogger(__name__)
 LOG.addHandler(StreamHandler())
 
+CHUNK_SIZE = 64 * 1024
+
+def prepare_save_path(save_path, override_file=False):
+    """Makes the directory of the file to be saved.
+
+    :param str save_path: save file path.
+    :param bool override_file: (optional) if ``True``, the same name file will be overridden
+    :raises: OSError if the file exists and is not overridden.
+    """
+    if not override_file and os.path.exists(save_path):
+        raise OSError('File exists: ' + save_path)
+
+    dir_path = os.path.abspath(os.path.dirname(save_path))
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+
+class _NoSpan(object):
+    """Context manager which records nothing, used without a tracer."""
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
 class ThetaV2(object):
     """RICOH THETA API v2 simple wrapper class"""
-    def __init__(self, base_url='http://192.168.1.1'):
+    def __init__(self, base_url='http://192.168.1.1', timeout=None, tracer=None):
         """Init instance.
 
         :param str base_url: (optional) base url of theta
+        :param float timeout: (optional) seconds to wait for the camera to connect and respond.
+                              if ``None``, waits forever.
+        :param tracer: (optional) :class:`ricohapi.cameractl.trace.Tracer` to record
+                       each request as a span of the trace current in the thread.
         """
         self.base_url = base_url
+        self.timeout = timeout
+        self.tracer = tracer
+        self.__session_id = None
+
+    def __span(self, name, **attrs):
+        """Context manager which records a span if traced."""
+        if self.tracer is None:
+            return _NoSpan()
+        return self.tracer.span(name, **attrs)
 
     def get_info(self):
         """Acquires basic information about the camera and supported function.
@@ -27,7 +66,8 @@ class ThetaV2(object):
 
         url = self.base_url + '/osc/info'
         LOG.debug(url)
-        req = requests.get(url)
+        with self.__span('info'):
+            req = requests.get(url, timeout=self.timeout)
         req.raise_for_status()
         return req.json()
 
@@ -39,7 +79,8 @@ class ThetaV2(object):
 
         url = self.base_url + '/osc/state'
         LOG.debug(url)
-        req = requests.post(url)
+        with self.__span('state'):
+            req = requests.post(url, timeout=self.timeout)
         req.raise_for_status()
         return req.json()
 
@@ -53,7 +94,8 @@ class ThetaV2(object):
         url = self.base_url + '/osc/checkForUpdates'
         payload = json.dumps({'stateFingerprint': state_fingerprint})
         LOG.debug(url + ', ' + payload)
-        req = requests.post(url, data=payload)
+        with self.__span('checkForUpdates'):
+            req = requests.post(url, data=payload, timeout=self.timeout)
         req.raise_for_status()
         return req.json()
 
@@ -64,6 +106,10 @@ class ThetaV2(object):
         :param dict params: Input parameters required to execute each command
         :rtype: :class:`requests.Response`
         """
+        if self.__session_id is not None:
+            params['sessionId'] = self.__session_id
+            return self.__execute(command, **params)
+
         params['sessionId'] = self.__start_session()
         try:
             req = self.__execute(command, **params)
@@ -78,6 +124,16 @@ class ThetaV2(object):
         :param dict params: Input parameters required to execute each command
         :rtype: :class:`requests.Response`
         """
+        return self.__post_command(command, params)
+
+    def __post_command(self, command, params, headers=None):
+        """Posts the command with additional HTTP headers.
+
+        :param str command: Command to execute
+        :param dict params: Input parameters required to execute each command
+        :param dict headers: (optional) HTTP headers to send
+        :rtype: :class:`requests.Response`
+        """
 
         url = self.base_url + '/osc/commands/execute'
         payload = json.dumps({
@@ -85,7 +141,9 @@ class ThetaV2(object):
             'parameters': params
         })
         LOG.debug(url + ', ' + payload)
-        req = requests.post(url, stream=True, data=payload)
+        with self.__span(command):
+            req = requests.post(url, stream=True, data=payload, headers=headers,
+                                timeout=self.timeout)
         req.raise_for_status()
         return req
 
@@ -99,10 +157,30 @@ class ThetaV2(object):
         url = self.base_url + '/osc/commands/status'
         payload = json.dumps({'id': command_id})
         LOG.debug(url + ', ' + payload)
-        req = requests.post(url, data=payload)
+        with self.__span('status'):
+            req = requests.post(url, data=payload, timeout=self.timeout)
         req.raise_for_status()
         return req.json()
 
+    @contextmanager
+    def session(self):
+        """Keeps one session open while the ``with`` block is executed,
+            instead of starting and closing a session for every command.
+
+        :return: Session ID
+        :rtype: str
+        """
+        if self.__session_id is not None:
+            yield self.__session_id
+            return
+
+        self.__session_id = self.__start_session()
+        try:
+            yield self.__session_id
+        finally:
+            session_id, self.__session_id = self.__session_id, None
+            self.__close_session(session_id)
+
     def __start_session(self):
         """Starts the session. Issues the session ID.
 
@@ -158,6 +236,8 @@ class ThetaV2(object):
         :param bool delete_file: (optional) if ``True``, image in theta will be deleted
                             after transfered. default to ``False``.
         :param bool override_file: (optional) if ``True``, the same name file will be overridden
+        :return: ID of the file taken
+        :rtype: str
         """
         finger = self.get_state()['fingerprint']
 
@@ -165,46 +245,157 @@ class ThetaV2(object):
         command_id = self.take_picture()['id']
 
         # wait
-        while self.check_for_updates(finger)['stateFingerprint'] == finger:
-            pass
+        file_uri = self.wait_for_picture(command_id, finger)
+
+        # save
+        if save_path is None:
+            save_path = file_uri
+
+        self.save_image(file_uri, save_path, override_file=override_file)
+
+        # delete
+        if delete_file:
+            self.delete(file_uri)
+        return file_uri
+
+    def wait_for_picture(self, command_id, state_fingerprint=None, interval=0):
+        """Waits until still image shooting is completed.
+
+        :param str command_id: Command ID of ``camera.takePicture``
+        :param str state_fingerprint: (optional) Status ID before shooting.
+                                      if specified, waits for the status to change first.
+        :param float interval: (optional) seconds to sleep between polls
+        :return: ID of the file taken
+        :rtype: str
+        """
+        if state_fingerprint is not None:
+            while self.check_for_updates(state_fingerprint)['stateFingerprint'] \
+                    == state_fingerprint:
+                time.sleep(interval)
 
         progress = 'inProgress'
         while progress == 'inProgress':
             command_status = self.get_command_status(command_id)
             progress = command_status['state']
+            if progress == 'inProgress':
+                time.sleep(interval)
 
         if progress != 'done':
             raise ThetaError('Failed to take picture')
 
-        # download
-        file_uri = command_status['results']['fileUri']
-        image = self.get_image(file_uri)
+        return command_status['results']['fileUri']
 
-        # save
-        if save_path is None:
-            save_path = file_uri
+    def get_image(self, file_uri):
+        """Acquires images.
 
-        if not override_file and os.path.exists(save_path):
-            raise OSError('File exists: ' + save_path)
+        :param str file_uri: ID of the file to be acquired
+        :rtype: bytes
+        """
+        return self.__execute('camera.getImage', fileUri=file_uri).content
 
-        dir_path = os.path.abspath(os.path.dirname(save_path))
-        if not os.path.exists(dir_path):
-            os.makedirs(dir_path)
+    def open_image(self, file_uri, offset=0):
+        """Starts acquiring images from the given byte offset.
+            The response status is 206 if the camera honored the offset.
 
-        with open(save_path, 'wb') as fptr:
-            fptr.write(image)
+        :param str file_uri: ID of the file to be acquired, or its URL
+                             which is fetched directly with HTTP GET.
+        :param int offset: (optional) byte offset to start from
+        :rtype: :class:`requests.Response`
+        """
+        headers = {'Range': 'bytes={0}-'.format(offset)} if offset else None
 
-        # delete
-        if delete_file:
-            self.delete(file_uri)
+        if file_uri.startswith(('http://', 'https://')):
+            LOG.debug(file_uri)
+            req = requests.get(file_uri, stream=True, headers=headers, timeout=self.timeout)
+            req.raise_for_status()
+            return req
 
-    def get_image(self, file_uri):
-        """Acquires images.
+        return self.__post_command('camera.getImage', {'fileUri': file_uri}, headers=headers)
+
+    def iter_image(self, file_uri, chunk_size=CHUNK_SIZE):
+        """Acquires images as a stream of chunks.
 
         :param str file_uri: ID of the file to be acquired
-        :rtype: bytes
+        :param int chunk_size: (optional) size of each chunk in bytes
+        :rtype: generator of bytes
         """
-        return self.__execute('camera.getImage', fileUri=file_uri).content
+        req = self.open_image(file_uri)
+        try:
+            for chunk in req.iter_content(chunk_size):
+                if chunk:
+                    yield chunk
+        finally:
+            req.close()
+
+    def save_image(self, file_uri, save_path, override_file=False, chunk_size=CHUNK_SIZE):
+        """Acquires images and writes them to a file chunk by chunk.
+
+        :param str file_uri: ID of the file to be acquired
+        :param str save_path: save file path.
+        :param bool override_file: (optional) if ``True``, the same name file will be overridden
+        :param int chunk_size: (optional) size of each chunk in bytes
+        :return: Number of bytes written
+        :rtype: int
+        """
+        prepare_save_path(save_path, override_file)
+
+        with self.__span('save', file=file_uri) as attrs:
+            req = self.open_image(file_uri)
+            size = 0
+            try:
+                with open(save_path, 'wb') as fptr:
+                    for chunk in req.iter_content(chunk_size):
+                        if chunk:
+                            fptr.write(chunk)
+                            size += len(chunk)
+            finally:
+                req.close()
+            attrs['bytes'] = size
+
+        length = req.headers.get('Content-Length')
+        if length is not None and int(length) != size:
+            raise ThetaError('Incomplete transfer: ' + file_uri)
+        return size
+
+    @contextmanager
+    def open_live_preview(self):
+        """Starts the live preview stream of multipart MJPEG on a session.
+            The session is kept open while the ``with`` block is executed.
+
+        :return: streaming response
+        :rtype: :class:`requests.Response`
+        """
+        with self.session() as session_id:
+            req = self.__post_command('camera._getLivePreview', {'sessionId': session_id})
+            try:
+                yield req
+            finally:
+                req.close()
+
+    def live_preview(self, max_fps=None, skip_frames=True):
+        """Acquires live preview frames.
+
+        :param float max_fps: (optional) maximum frames per second. if ``None``, all frames.
+        :param bool skip_frames: (optional) if ``True``, older frames are skipped
+                                 when the frames are not consumed fast enough.
+        :return: iterable of JPEG frames as :class:`memoryview`, which also reports the fps.
+        :rtype: :class:`preview.LivePreview`
+        """
+        from preview import LivePreview
+        return LivePreview(self.open_live_preview, max_fps=max_fps, skip_frames=skip_frames)
+
+    def list_images(self, entry_count=100, continuation_token=None):
+        """Acquires a list of still image files.
+
+        :param int entry_count: (optional) number of entries to acquire
+        :param str continuation_token: (optional) token to acquire the next entries
+        :rtype: dict
+        """
+        params = {'entryCount': entry_count, 'includeThumb': False}
+        if continuation_token is not None:
+            params['continuationToken'] = continuation_token
+        req = self.__execute('camera.listImages', **params)
+        return req.json()
 
     def delete(self, file_uri):
         """Deletes still image or video files.
@@ -215,6 +406,23 @@ class ThetaV2(object):
         req = self.__execute('camera.delete', fileUri=file_uri)
         return req.json()
 
+    def delete_files(self, file_uris):
+        """Deletes still image or video files with one command.
+            Deletes them one by one if the camera does not accept a file list.
+
+        :param file_uris: IDs of the files to delete
+        :type file_uris: list of str
+        """
+        file_uris = list(file_uris)
+        if not file_uris:
+            return
+
+        try:
+            self.__execute('camera.delete', fileUrls=file_uris)
+        except requests.exceptions.HTTPError as err:
+            LOG.debug(err)
+            for file_uri in file_uris:
+                self.delete(file_uri)
 
 class ThetaError(Exception):
     """Theta Error"""
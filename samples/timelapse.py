@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""Drift-free interval time-lapse on RICOH THETA"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, StreamHandler
+import math
+import time
+from ricohapi.cameractl.clock import monotonic
+from exposure import DEFAULT_TABLE, exposure_options
+from transfer import BatchDownloader
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+
+KEEPALIVE = 120.0
+KEEPALIVE_MARGIN = 5.0
+
+
+class JitterStats(namedtuple('JitterStats', ['frames', 'skipped', 'mean', 'stdev', 'p99',
+                                             'max'])):
+    """Lateness of the shots behind their deadlines, in seconds.
+
+    frames: number of the frames taken.
+    skipped: number of the deadlines missed because a shot overran the interval.
+    mean, stdev, p99, max: statistics of the lateness of the frames taken.
+    """
+    __slots__ = ()
+
+
+class TimelapseResult(namedtuple('TimelapseResult', ['file_uris', 'deadlines', 'shot_times',
+                                                     'skipped', 'transfer'])):
+    """Result of a time-lapse.
+
+    file_uris: list of the file uris taken.
+    deadlines: list of the monotonic clock times when each shot is due.
+    shot_times: list of the monotonic clock times when each shot is requested.
+    skipped: number of the deadlines missed.
+    transfer: :class:`transfer.TransferResult` or ``None`` if files are not downloaded.
+    """
+    __slots__ = ()
+
+    @property
+    def lateness(self):
+        """Seconds each shot is requested after its deadline."""
+        return [shot - deadline for deadline, shot in zip(self.deadlines, self.shot_times)]
+
+    @property
+    def jitter(self):
+        """Get the statistics of the lateness.
+
+        :rtype: JitterStats
+        """
+        lateness = sorted(self.lateness)
+        if not lateness:
+            return JitterStats(0, self.skipped, 0.0, 0.0, 0.0, 0.0)
+        mean = sum(lateness) / len(lateness)
+        stdev = math.sqrt(sum((late - mean) ** 2 for late in lateness) / len(lateness))
+        p99 = lateness[min(int(math.ceil(len(lateness) * 0.99)) - 1, len(lateness) - 1)]
+        return JitterStats(len(lateness), self.skipped, mean, stdev, p99, lateness[-1])
+
+
+def run_timelapse(theta, interval, #pylint: disable=too-many-arguments,too-many-locals
+                  frames=None, iso=None, s_speed=None, dest_dir=None, max_in_flight=1,
+                  table=DEFAULT_TABLE, index=None, device_id=None, stop_event=None,
+                  keepalive=KEEPALIVE):
+    """Take a picture every interval in one camera session.
+
+    Frame ``n`` is due at ``start + n * interval`` on the monotonic clock,
+    so that the time spent on each shot does not push the later ones back.
+    A shot which overruns one or more deadlines skips them, instead of taking a burst to catch up.
+    The options are set once, and each frame is downloaded while waiting for the next.
+    While waiting longer than ``keepalive``, the session is kept alive with ``getOptions``,
+    since the camera closes a session after some minutes without a command.
+
+    :param theta: a :class:`thetav2.ThetaV2` instance
+    :param float interval: seconds between the frames
+    :param int frames: (optional) number of the deadlines. if ``None``, until stop_event is set.
+    :param int iso: (optional) the ISO value to be set.
+    :param int or float or str s_speed: (optional) the shutter speed to be set.
+    :param str dest_dir: (optional) directory to download files in. if ``None``, not downloaded.
+    :param int max_in_flight: (optional) maximum number of concurrent downloads
+    :param exposure.ExposureTable table: (optional) values supported by the camera model.
+    :param index: (optional) :class:`capture_index.CaptureIndex` to record the pictures in
+    :param str device_id: (optional) device id to record the pictures with
+    :param stop_event: (optional) :class:`threading.Event` to stop the time-lapse early
+    :param float keepalive: (optional) seconds without a command before keeping the session alive.
+                            if ``None``, not kept alive.
+    :rtype: TimelapseResult
+    """
+    if interval <= 0:
+        raise ValueError('interval must be more than 0.')
+    if frames is None and stop_event is None:
+        raise ValueError('Specify frames or stop_event.')
+    iso, s_speed = table.validate(iso, s_speed)
+
+    downloader = None
+    if dest_dir is not None:
+        downloader = BatchDownloader(theta, dest_dir, max_in_flight, index=index,
+                                     device_id=device_id)
+
+    file_uris = []
+    deadlines = []
+    shot_times = []
+    skipped = 0
+    try:
+        with theta.session():
+            theta.set_options(captureMode='image')
+            theta.set_options(**exposure_options(iso, s_speed))
+            waiter = _Waiter(theta, stop_event, keepalive)
+            start = monotonic()
+            count = 0
+            while frames is None or count < frames:
+                deadline = start + count * interval
+                if not waiter.wait_until(deadline):
+                    break
+                missed = int((monotonic() - deadline) // interval)
+                if missed > 0:
+                    missed = missed if frames is None else min(missed, frames - count)
+                    LOG.warning('skipped %d frames from frame %d, since the last shot overran.',
+                                missed, count)
+                    skipped += missed
+                    count += missed
+                    continue
+
+                deadlines.append(deadline)
+                shot_times.append(monotonic())
+                taken_at = time.time()
+                file_uri = theta.wait_for_picture(theta.take_picture()['id'])
+                waiter.touch()
+                file_uris.append(file_uri)
+                if index is not None:
+                    index.record(file_uri, device_id, taken_at, iso, s_speed)
+                if downloader is not None:
+                    downloader.submit(file_uri)
+                count += 1
+    finally:
+        transfer = downloader.join() if downloader is not None else None
+
+    result = TimelapseResult(file_uris, deadlines, shot_times, skipped, transfer)
+    jitter = result.jitter
+    LOG.info('%d frames, %d skipped, lateness avg %.1f ms, p99 %.1f ms, max %.1f ms',
+             jitter.frames, jitter.skipped, jitter.mean * 1e3, jitter.p99 * 1e3, jitter.max * 1e3)
+    return result
+
+
+class _Waiter(object):
+    """Waits for the deadlines, keeping the session alive."""
+    def __init__(self, theta, stop_event, keepalive):
+        self.theta = theta
+        self.stop_event = stop_event
+        self.keepalive = keepalive
+        self.last_command = monotonic()
+
+    def touch(self):
+        """Note that a command is sent to the camera."""
+        self.last_command = monotonic()
+
+    def wait_until(self, deadline):
+        """Wait until the deadline.
+
+        :rtype: bool
+        :returns: ``False`` if stopped.
+        """
+        while True:
+            now = monotonic()
+            if self.stop_event is not None and self.stop_event.is_set():
+                return False
+            if now >= deadline:
+                return True
+            wake = deadline
+            if self.keepalive is not None:
+                due = self.last_command + self.keepalive
+                if now >= due and deadline - now > KEEPALIVE_MARGIN:
+                    self.theta.get_options('captureMode')
+                    self.touch()
+                    continue
+                if due < deadline - KEEPALIVE_MARGIN:
+                    wake = due
+            if self.stop_event is not None:
+                self.stop_event.wait(wake - now)
+            else:
+                time.sleep(wake - now)
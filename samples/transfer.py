@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""Batch transfer of captured files from RICOH THETA"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from logging import getLogger, StreamHandler
+import os
+import re
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue #python2
+from thetav2 import CHUNK_SIZE, ThetaError, prepare_save_path
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+
+MEGABYTE = 1000 * 1000
+PART_SUFFIX = '.part'
+JPEG_SOI = b'\xff\xd8'
+JPEG_EOI = b'\xff\xd9'
+
+
+class TransferResult(namedtuple('TransferResult', ['files', 'failed', 'size', 'elapsed'])):
+    """Result of a batch transfer.
+
+    files: list of the file uris transferred and verified.
+    failed: dict of the file uris which could not be transferred and their errors.
+    size: total number of bytes written.
+    elapsed: wall clock seconds spent on the transfer.
+    """
+    __slots__ = ()
+
+    @property
+    def mbps(self):
+        """Aggregate throughput in MB/s."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.size / MEGABYTE / self.elapsed
+
+
+class BatchDownloader(object): #pylint: disable=too-many-instance-attributes
+    """Downloads files with a bounded number of in-flight requests.
+
+    Files can be submitted while earlier ones are still downloading.
+
+    :param theta: a :class:`thetav2.ThetaV2` instance
+    :param str dest_dir: (optional) directory to save files in
+    :param int max_in_flight: (optional) maximum number of concurrent downloads
+    :param bool override_file: (optional) if ``True``, the same name file will be overridden
+    :param int retries: (optional) if more than 0, interrupted downloads are resumed
+                        up to this number of times. See :func:`resumable_download`.
+    :param index: (optional) :class:`capture_index.CaptureIndex` to record downloaded files in
+    :param str device_id: (optional) device id to record downloaded files with
+    """
+    def __init__(self, theta, dest_dir='.', max_in_flight=4, #pylint: disable=too-many-arguments
+                 override_file=False, retries=0, index=None, device_id=None):
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be 1 or more.')
+
+        self.theta = theta
+        self.dest_dir = dest_dir
+        self.override_file = override_file
+        self.retries = retries
+        self.index = index
+        self.device_id = device_id
+        self.__queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__files = []
+        self.__failed = {}
+        self.__size = 0
+        self.__start = time.time()
+        self.__workers = [threading.Thread(target=self.__work) for _ in range(max_in_flight)]
+        for worker in self.__workers:
+            worker.daemon = True
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.join()
+
+    def save_path(self, file_uri):
+        """Get the local path to which the file is saved.
+
+        :param str file_uri: ID of the file
+        :rtype: str
+        """
+        return os.path.join(self.dest_dir, file_uri)
+
+    def submit(self, file_uri):
+        """Queue a file to download.
+
+        :param str file_uri: ID of the file to be acquired
+        """
+        if not self.__workers:
+            raise ValueError('downloader is already joined.')
+        self.__queue.put(file_uri)
+
+    def join(self):
+        """Wait for all queued downloads and stop the workers.
+
+        :rtype: TransferResult
+        """
+        for _ in self.__workers:
+            self.__queue.put(None)
+        for worker in self.__workers:
+            worker.join()
+        self.__workers = []
+
+        result = TransferResult(list(self.__files), dict(self.__failed),
+                                self.__size, time.time() - self.__start)
+        LOG.info('transferred %d files, %.2f MB in %.2f sec (%.2f MB/s)',
+                 len(result.files), result.size / MEGABYTE, result.elapsed, result.mbps)
+        return result
+
+    def __work(self):
+        """Download queued files until a stop marker is received."""
+        while True:
+            file_uri = self.__queue.get()
+            if file_uri is None:
+                return
+            try:
+                if self.retries > 0:
+                    size = resumable_download(self.theta, file_uri, self.save_path(file_uri),
+                                              retries=self.retries,
+                                              override_file=self.override_file)
+                else:
+                    size = self.theta.save_image(file_uri, self.save_path(file_uri),
+                                                 override_file=self.override_file)
+            except Exception as err: #pylint: disable=broad-except
+                LOG.warning('failed to transfer %s: %s', file_uri, err)
+                with self.__lock:
+                    self.__failed[file_uri] = err
+            else:
+                with self.__lock:
+                    self.__files.append(file_uri)
+                    self.__size += size
+                if self.index is not None:
+                    self.index.record_file(file_uri, self.save_path(file_uri), size,
+                                           self.device_id)
+
+
+def resumable_download(theta, file_uri, save_path, retries=5, #pylint: disable=too-many-arguments
+                       override_file=False, expected_size=None, backoff=1.0):
+    """Download a file, resuming it after the connection drops.
+
+    Received bytes are kept in ``save_path + '.part'``, so that a retry, or a later call
+    after the process is restarted, requests only the rest of the file with a HTTP range
+    request. If the camera ignores the range, the file is transferred again from the start.
+    The part file is renamed to ``save_path`` once its size is verified.
+
+    :param theta: a :class:`thetav2.ThetaV2` instance
+    :param str file_uri: ID of the file to be acquired, or its URL
+    :param str save_path: save file path.
+    :param int retries: (optional) number of retries after the transfer is interrupted
+    :param bool override_file: (optional) if ``True``, the same name file will be overridden
+    :param int expected_size: (optional) file size listed by the camera
+    :param float backoff: (optional) seconds to wait before the first retry, doubled every retry
+    :return: Number of bytes of the file
+    :rtype: int
+    :raises: ThetaError if the transferred file is broken.
+    """
+    prepare_save_path(save_path, override_file)
+
+    part_path = save_path + PART_SUFFIX
+    attempt = 0
+    while True:
+        try:
+            size = _fetch_part(theta, file_uri, part_path)
+            break
+        except (IOError, ThetaError) as err:
+            response = getattr(err, 'response', None)
+            if response is not None and response.status_code == 416:
+                os.remove(part_path)
+            if attempt >= retries:
+                raise
+            LOG.warning('transfer of %s is interrupted, retrying. %s', file_uri, err)
+            time.sleep(backoff * (2 ** attempt))
+            attempt += 1
+
+    try:
+        _verify_file(part_path, size, expected_size)
+    except ThetaError:
+        os.remove(part_path)
+        raise
+
+    if os.path.exists(save_path):
+        os.remove(save_path)
+    os.rename(part_path, save_path)
+    return size
+
+
+def _fetch_part(theta, file_uri, part_path):
+    """Transfer the rest of the file to the part file.
+
+    :rtype: int
+    :returns: size of the part file
+    :raises: ThetaError if the file is not transferred to the end.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    req = theta.open_image(file_uri, offset)
+    try:
+        content_range = req.headers.get('Content-Range')
+        if req.status_code == 206 and not content_range:
+            # the body is a part at an unknown offset. start over from the first byte.
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise ThetaError('Partial content without Content-Range: ' + file_uri)
+        if req.status_code == 206:
+            start, total = _parse_content_range(content_range)
+            if start != offset:
+                raise ThetaError('Unexpected range: ' + content_range)
+            mode = 'ab'
+        else:
+            length = req.headers.get('Content-Length')
+            total = int(length) if length is not None else None
+            mode = 'wb'
+
+        with open(part_path, mode) as fptr:
+            for chunk in req.iter_content(CHUNK_SIZE):
+                if chunk:
+                    fptr.write(chunk)
+    finally:
+        req.close()
+
+    size = os.path.getsize(part_path)
+    if total is not None and size != total:
+        raise ThetaError('Incomplete transfer: ' + file_uri)
+    return size
+
+
+def _parse_content_range(content_range):
+    """Parse Content-Range header like ``bytes 100-199/200``.
+
+    :rtype: tuple, (int, int or None)
+    :returns: first byte position and complete length
+    """
+    match = re.match(r'\s*bytes\s+(\d+)-\d+/(\d+|\*)', content_range)
+    if match is None:
+        raise ThetaError('Invalid Content-Range: ' + content_range)
+    total = match.group(2)
+    return int(match.group(1)), (None if total == '*' else int(total))
+
+
+def _verify_file(path, size, expected_size=None):
+    """Verify the transferred file.
+
+    :raises: ThetaError if the size differs from the expected one,
+             or JPEG markers are missing.
+    """
+    if expected_size is not None and size != expected_size:
+        raise ThetaError('File size mismatch: {0} != {1}'.format(size, expected_size))
+
+    if not path[:-len(PART_SUFFIX)].lower().endswith(('.jpg', '.jpeg')):
+        return
+
+    with open(path, 'rb') as fptr:
+        head = fptr.read(len(JPEG_SOI))
+        fptr.seek(max(size - len(JPEG_EOI), 0))
+        tail = fptr.read(len(JPEG_EOI))
+    if head != JPEG_SOI or tail != JPEG_EOI:
+        raise ThetaError('Broken JPEG file: ' + path)
+
+
+def discover_files(theta, known=None, entry_count=100):
+    """Find files in the camera which are not transferred yet.
+
+    :param theta: a :class:`thetav2.ThetaV2` instance
+    :param known: (optional) file uris already transferred
+    :param int entry_count: (optional) number of entries acquired at once
+    :rtype: list of str
+    """
+    known = set(known) if known else set()
+    found = []
+    token = None
+    while True:
+        results = theta.list_images(entry_count, continuation_token=token)['results']
+        for entry in results.get('entries', []):
+            if entry['fileUri'] not in known:
+                found.append(entry['fileUri'])
+        token = results.get('continuationToken')
+        if not token:
+            return found
+
+
+def batch_download(theta, file_uris=None, dest_dir='.', #pylint: disable=too-many-arguments
+                   max_in_flight=4, delete_file=False, override_file=False, retries=0,
+                   index=None, device_id=None):
+    """Download files from the camera and delete them afterwards if needed.
+
+    :param theta: a :class:`thetav2.ThetaV2` instance
+    :param file_uris: (optional) IDs of the files to be acquired.
+                      if ``None``, all files in the camera are acquired.
+    :param str dest_dir: (optional) directory to save files in
+    :param int max_in_flight: (optional) maximum number of concurrent downloads
+    :param bool delete_file: (optional) if ``True``, files in theta will be deleted
+                        with one command after all of them are transferred.
+    :param bool override_file: (optional) if ``True``, the same name file will be overridden
+    :param int retries: (optional) number of retries to resume interrupted downloads
+    :param index: (optional) :class:`capture_index.CaptureIndex` to record downloaded files in
+    :param str device_id: (optional) device id to record downloaded files with
+    :rtype: TransferResult
+    """
+    if file_uris is None:
+        file_uris = discover_files(theta)
+
+    downloader = BatchDownloader(theta, dest_dir, max_in_flight, override_file, retries, index,
+                                 device_id)
+    for file_uri in file_uris:
+        downloader.submit(file_uri)
+    result = downloader.join()
+
+    if delete_file and result.files:
+        theta.delete_files(result.files)
+    return result
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+
+"""Streaming upload of captured files to media storage"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from contextlib import contextmanager
+from logging import getLogger, StreamHandler
+import json
+import threading
+import time
+import requests
+from pipeline import Processor
+try:
+    import queue
+except ImportError:
+    import Queue as queue #python2
+try:
+    from ricohapi.auth.client import AuthClient #pylint: disable=import-error,no-name-in-module
+except ImportError:
+    AuthClient = None
+LOG = getLogger(__name__)
+LOG.addHandler(StreamHandler())
+
+PART_SIZE = 4 * 1024 * 1024
+RETRY_STATUS = (429, 500, 502, 503, 504)
+MSS_URL = 'https://mss.ricohapi.com/v1'
+END = object()
+ABORT = object()
+
+
+class UploadError(Exception):
+    """Upload Error"""
+    pass
+
+
+class SenderPool(object): #pylint: disable=too-many-instance-attributes
+    """Long-lived threads and HTTP sessions shared by all the uploads of an uploader.
+
+    Close it, or use it in a ``with`` statement, to stop the threads and close the sessions.
+
+    :param dict headers: headers of every request
+    :param int max_senders: number of the threads
+    """
+    def __init__(self, headers, max_senders):
+        if max_senders < 1:
+            raise ValueError('max_senders must be 1 or more.')
+        self.max_senders = max_senders
+        self.__headers = headers
+        self.__lock = threading.Lock()
+        self.__jobs = queue.Queue()
+        self.__threads = []
+        self.__sessions = []
+        self.__idle = queue.LifoQueue()
+        self.__closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @contextmanager
+    def session(self):
+        """Borrow an idle HTTP session, to reuse its connections.
+
+        A session is used by one thread at a time.
+        """
+        with self.__lock:
+            if self.__closed:
+                raise UploadError('uploader is closed.')
+        try:
+            session = self.__idle.get_nowait()
+        except queue.Empty:
+            session = requests.Session()
+            session.headers.update(self.__headers)
+            with self.__lock:
+                self.__sessions.append(session)
+        try:
+            yield session
+        finally:
+            self.__idle.put(session)
+
+    def submit(self, func, *args):
+        """Run ``func(*args)`` on a sender thread. The threads are started on the first call.
+
+        :param func: function to run, which handles its errors
+        """
+        with self.__lock:
+            if self.__closed:
+                raise UploadError('uploader is closed.')
+            if not self.__threads:
+                self.__threads = [threading.Thread(target=self.__send)
+                                  for _ in range(self.max_senders)]
+                for thread in self.__threads:
+                    thread.daemon = True
+                    thread.start()
+            self.__jobs.put((func, args))
+
+    def close(self):
+        """Stop the threads after the queued jobs, and close the sessions."""
+        with self.__lock:
+            self.__closed = True
+            threads, self.__threads = self.__threads, []
+        for _ in threads:
+            self.__jobs.put(None)
+        for thread in threads:
+            thread.join()
+        with self.__lock:
+            sessions, self.__sessions = self.__sessions, []
+        for session in sessions:
+            session.close()
+
+    def __send(self):
+        """Run queued jobs until a stop marker."""
+        while True:
+            job = self.__jobs.get()
+            if job is None:
+                return
+            func, args = job
+            try:
+                func(*args)
+            except Exception: #pylint: disable=broad-except
+                LOG.exception('upload job failed')
+
+
+class MediaStorageUploader(SenderPool):
+    """Client of RICOH Media Storage, which streams each file in one chunked request.
+
+    It sends the request of ``MediaStorage.upload()`` of media-storage-py,
+    ``POST {base_url}/media``, with the body read from the chunks instead of a file on disk.
+    The storage takes a file in one request, so an upload which fails is not retried.
+
+    :param token: access token, or a function which returns the current access token
+    :param str base_url: (optional) base url of the API
+    :param float timeout: (optional) seconds to wait for the connection and the response
+    :param int max_senders: (optional) number of the files uploaded at a time
+    """
+    def __init__(self, token, base_url=MSS_URL, timeout=30.0, max_senders=4):
+        SenderPool.__init__(self, {}, max_senders)
+        self.token = token if callable(token) else lambda: token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    @classmethod
+    def connect(cls, client_id, client_secret, user_id, user_pass, **kwargs):
+        """Authorize with the credentials of RICOH API, like ``MediaStorage.connect()``.
+
+        :param str client_id: client ID
+        :param str client_secret: client secret
+        :param str user_id: user ID
+        :param str user_pass: user password
+        :rtype: MediaStorageUploader
+        """
+        if AuthClient is None:
+            raise UploadError('auth-py is not installed.')
+        auth_client = AuthClient(client_id, client_secret)
+        auth_client.set_resource_owner_creds(user_id, user_pass)
+        auth_client.session(AuthClient.SCOPES['MStorage'])
+        return cls(auth_client.get_access_token, **kwargs)
+
+    def upload(self, chunks, content_type='image/jpeg'):
+        """Upload a file.
+
+        :param chunks: iterable of the chunks of the file
+        :param str content_type: (optional) content type of the file
+        :return: media information returned by the storage
+        :rtype: dict
+        """
+        with self.session() as session:
+            req = session.post(self.base_url + '/media', data=chunks, timeout=self.timeout,
+                               headers={'Authorization': 'Bearer ' + self.token(),
+                                        'Content-Type': content_type})
+        req.raise_for_status()
+        return req.json()
+
+
+class StreamProcessor(Processor):
+    """Streams the file into RICOH Media Storage while it is downloaded.
+
+    A thread of the uploader sends the request, reading the chunks from a queue of ``max_chunks``.
+    The download waits while the upload falls behind.
+    An aborted upload breaks off the request, so the storage does not keep a partial file.
+
+    :param MediaStorageUploader uploader: client of the storage
+    :param int max_chunks: (optional) maximum number of chunks held in memory
+    """
+    name = 'upload'
+
+    def __init__(self, uploader, max_chunks=16):
+        self.__chunks = queue.Queue(max_chunks)
+        self.__ended = False
+        self.__done = threading.Event()
+        self.__result = None
+        self.__error = None
+        uploader.submit(self.__send, uploader)
+
+    def update(self, chunk):
+        if self.__error:
+            raise self.__error
+        self.__chunks.put(chunk)
+
+    def finish(self):
+        self.__chunks.put(END)
+        self.__done.wait()
+        if self.__error:
+            raise self.__error
+        return self.__result
+
+    def abort(self):
+        self.__chunks.put(ABORT)
+        self.__done.wait()
+
+    def __iter_chunks(self):
+        """Chunks of the file until the end marker."""
+        while True:
+            chunk = self.__chunks.get()
+            if chunk is END or chunk is ABORT:
+                self.__ended = True
+                if chunk is ABORT:
+                    raise UploadError('aborted')
+                return
+            yield chunk
+
+    def __send(self, uploader):
+        """Upload the file on a sender thread, then skip the chunks left after an error."""
+        try:
+            self.__result = uploader.upload(self.__iter_chunks())
+        except Exception as err: #pylint: disable=broad-except
+            self.__error = err
+        while not self.__ended:
+            self.__ended = self.__chunks.get() in (END, ABORT)
+        self.__done.set()
+
+
+class MediaUploader(SenderPool):
+    """Client of a multipart upload API of media storage, like the multipart upload of S3.
+
+    This is not the API of RICOH Media Storage, which takes a file in one request;
+    use :class:`MediaStorageUploader` for it.
+    A multipart API lets a failed part be retried without sending the whole file again.
+
+    - ``POST {base_url}/uploads`` with ``{"name": name}`` starts an upload
+      and returns ``{"id": upload_id}``.
+    - ``PUT {base_url}/uploads/{upload_id}/{index}`` stores a part. storing it again replaces it.
+    - ``POST {base_url}/uploads/{upload_id}/complete`` with ``{"parts": count, "size": size}``
+      joins the parts and returns the media information.
+    - ``DELETE {base_url}/uploads/{upload_id}`` discards the parts.
+
+    Adapt the methods to the API of your storage.
+    A part which fails with a connection error or a 5xx status is retried.
+    The parts of all the files are uploaded by ``max_senders`` threads.
+
+    :param str base_url: base url of the API
+    :param str token: (optional) bearer token to authorize the requests with
+    :param float timeout: (optional) seconds to wait for each request
+    :param int retries: (optional) number of retries of a part
+    :param float backoff: (optional) seconds to wait before the first retry, doubled every retry
+    :param int max_senders: (optional) number of the threads which upload the parts
+    """
+    def __init__(self, base_url, token=None, timeout=30.0, #pylint: disable=too-many-arguments
+                 retries=3, backoff=0.5, max_senders=4):
+        SenderPool.__init__(self, {'Authorization': 'Bearer ' + token} if token else {},
+                            max_senders)
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def start(self, name):
+        """Start an upload.
+
+        :param str name: name of the file
+        :return: upload ID
+        :rtype: str
+        """
+        with self.session() as session:
+            req = session.post(self.base_url + '/uploads', data=json.dumps({'name': name}),
+                               timeout=self.timeout)
+        req.raise_for_status()
+        return req.json()['id']
+
+    def put_part(self, upload_id, index, data):
+        """Store a part, retrying it after a transient error.
+
+        :param str upload_id: upload ID
+        :param int index: index of the part from 0
+        :param bytes data: content of the part
+        """
+        url = '{0}/uploads/{1}/{2}'.format(self.base_url, upload_id, index)
+        attempt = 0
+        while True:
+            try:
+                with self.session() as session:
+                    req = session.put(url, data=data, timeout=self.timeout,
+                                      headers={'Content-Type': 'application/octet-stream'})
+                if req.status_code not in RETRY_STATUS:
+                    req.raise_for_status()
+                    return
+                error = UploadError('{0} {1}'.format(req.status_code, url))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                error = err
+            if attempt >= self.retries:
+                raise error
+            LOG.warning('upload of part %d is interrupted, retrying. %s', index, error)
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    def complete(self, upload_id, parts, size):
+        """Join the parts.
+
+        :param str upload_id: upload ID
+        :param int parts: number of the parts
+        :param int size: total number of bytes
+        :return: media information returned by the storage
+        :rtype: dict
+        """
+        with self.session() as session:
+            req = session.post('{0}/uploads/{1}/complete'.format(self.base_url, upload_id),
+                               data=json.dumps({'parts': parts, 'size': size}),
+                               timeout=self.timeout)
+        req.raise_for_status()
+        return req.json()
+
+    def abort(self, upload_id):
+        """Discard the parts.
+
+        :param str upload_id: upload ID
+        """
+        with self.session() as session:
+            req = session.delete('{0}/uploads/{1}'.format(self.base_url, upload_id),
+                                 timeout=self.timeout)
+        req.raise_for_status()
+
+
+class UploadProcessor(Processor): #pylint: disable=too-many-instance-attributes
+    """Uploads the file in parts while it is downloaded.
+
+    Chunks are gathered into parts, which are uploaded by the threads of the uploader.
+    Once ``max_parts`` parts of the file wait or are being uploaded,
+    the download waits for the upload, so that at most ``max_parts + 1`` parts are held in memory.
+    An empty file is completed without parts.
+
+    :param MediaUploader uploader: client of the storage
+    :param str name: name of the file
+    :param int part_size: (optional) size of each part in bytes
+    :param int max_parts: (optional) maximum number of parts of the file pending at a time
+    """
+    name = 'upload'
+
+    def __init__(self, uploader, name, part_size=PART_SIZE, max_parts=2):
+        if max_parts < 1:
+            raise ValueError('max_parts must be 1 or more.')
+        self.uploader = uploader
+        self.part_size = part_size
+        self.max_parts = max_parts
+        self.upload_id = uploader.start(name)
+        self.size = 0
+        self.__buffer = bytearray()
+        self.__parts = 0
+        self.__pending = threading.Semaphore(max_parts)
+        self.__errors = []
+
+    def update(self, chunk):
+        if self.__errors:
+            raise self.__errors[0]
+        self.__buffer += chunk
+        self.size += len(chunk)
+        while len(self.__buffer) >= self.part_size:
+            self.__put(bytes(self.__buffer[:self.part_size]))
+            del self.__buffer[:self.part_size]
+
+    def finish(self):
+        if self.__buffer:
+            self.__put(bytes(self.__buffer))
+            del self.__buffer[:]
+        self.__wait()
+        if self.__errors:
+            raise self.__errors[0]
+        return self.uploader.complete(self.upload_id, self.__parts, self.size)
+
+    def abort(self):
+        self.__errors.append(UploadError('aborted'))
+        self.__wait()
+        self.uploader.abort(self.upload_id)
+
+    def __put(self, data):
+        """Queue a part, waiting while ``max_parts`` parts are pending."""
+        self.__pending.acquire()
+        try:
+            self.uploader.submit(self.__send, self.__parts, data)
+        except Exception:
+            self.__pending.release()
+            raise
+        self.__parts += 1
+
+    def __wait(self):
+        """Wait for the pending parts."""
+        for _ in range(self.max_parts):
+            self.__pending.acquire()
+        for _ in range(self.max_parts):
+            self.__pending.release()
+
+    def __send(self, index, data):
+        """Upload a part on a sender thread. Parts after an error are skipped."""
+        try:
+            if not self.__errors:
+                self.uploader.put_part(self.upload_id, index, data)
+        except Exception as err: #pylint: disable=broad-except
+            self.__errors.append(err)
+        finally:
+            self.__pending.release()
+
+
+def upload_stage(uploader, part_size=PART_SIZE, max_parts=2):
+    """Stage which uploads the files, named by their file uri.
+
+    ex.) ``Pipeline(theta, [upload_stage(MediaUploader(url, token))], max_workers=4)``
+
+    :param MediaUploader uploader: client of the storage
+    :param int part_size: (optional) size of each part in bytes
+    :param int max_parts: (optional) maximum number of parts of a file pending at a time
+    """
+    return lambda file_uri: UploadProcessor(uploader, file_uri, part_size, max_parts)
+
+
+def stream_stage(uploader, max_chunks=16):
+    """Stage which streams the files into RICOH Media Storage.
+
+    ex.) ``Pipeline(theta, [stream_stage(MediaStorageUploader.connect(*creds))], max_workers=4)``
+
+    :param MediaStorageUploader uploader: client of the storage
+    :param int max_chunks: (optional) maximum number of chunks of a file held in memory
+    """
+    return lambda file_uri: StreamProcessor(uploader, max_chunks)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+#pylint: disable=protected-access
+"""
+Stand-ins shared by the tests, to run clients without a server.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import time
+from collections import namedtuple
+from ricohapi.cameractl.client import Client
+
+Published = namedtuple('Published', ['topic', 'payload', 'qos', 'retain', 'time'])
+
+
+class FakeMQTT(object):
+    """Stand-in for the Paho client, which records the messages published
+       and the topics subscribed to.
+       Set ``result_code`` to make Paho refuse the messages published.
+    """
+    def __init__(self):
+        self.published = []
+        self.subscribed = []
+        self.result_code = 0
+
+    def publish(self, topic, msg, qos, retain):
+        """Record the message with the time it is published.
+
+        :rtype: tuple of (rc, mid), like Paho
+        """
+        if self.result_code == 0:
+            self.published.append(Published(topic, bytes(msg), qos, retain, time.time()))
+        return self.result_code, len(self.published)
+
+    def subscribe(self, topic):
+        """Record the topic and its QoS.
+
+        :rtype: tuple of (rc, mid), like Paho
+        """
+        self.subscribed.append(topic)
+        return 0, len(self.subscribed)
+
+    def unsubscribe(self, topic):
+        """Forget the topic."""
+        self.subscribed = [sub for sub in self.subscribed if sub[0] != topic]
+
+
+def fake_client(uid='user01', codec=None, tracer=None):
+    """Get a client connected to a :class:`FakeMQTT`.
+
+    :param str uid: (optional) user id of the connection
+    :param codec: (optional) codec of the client
+    :param tracer: (optional) tracer of the client
+    :rtype: :class:`ricohapi.cameractl.client.Client`
+    """
+    client = Client(None, None, codec=codec, tracer=tracer)
+    client._MQTTClient__mqtt = FakeMQTT()
+    client._MQTTClient__connected = True
+    client._MQTTClient__uid = uid
+    return client
@@ -10,11 +10,15 @@ Smoke test for client API.
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import sys
+import threading
+import time
 from collections import namedtuple
 from nose.tools import (assert_raises, eq_)
 from nose.tools import assert_not_equal as neq_
 from ricohapi.cameractl.client import CamTopic, Client, ClientError
 from ricohapi.cameractl.mqtt_client import MQTTClient, MQTTClientError
+from helpers import FakeMQTT
 
 
 
@@ -60,7 +64,6 @@ class TestTopic(object):
 
     @staticmethod
     def test_timestamp():
-        import time
         import datetime
         now = datetime.datetime.now()
         time1 = int(time.mktime(now.timetuple()))
@@ -99,10 +102,10 @@ class TestRemoteControl(object):
         camera._Client__connected = True
         assert_raises(ClientError, camera.listen, 'DEVID_%_NG', func=None, fargs=None)
 
-        camera._Client__sub_dev_id = 'ALREADY_LISTENED'
+        camera._Client__sub_dev_ids = ('ALREADY_LISTENED',)
         assert_raises(ClientError, camera.listen, 'DEVTEST', func=None, fargs=None)
 
-        camera._Client__sub_dev_id = 'INVLID_DEVID_+'
+        camera._Client__sub_dev_ids = ('INVLID_DEVID_+',)
         assert_raises(ClientError, camera.listen, 'DEVTEST', func=None, fargs=None)
 
         camera._Client__listening = True
@@ -154,7 +157,7 @@ class TestRemoteControl(object):
         camera = Client(client_id, client_secret)
         eq_(None, camera.sub_cam_topic)
 
-        camera._Client__sub_dev_id = 'TESTDEVID'
+        camera._Client__sub_dev_ids = ('TESTDEVID',)
         camera._Client__uid = 'user01'
         eq_('camera/TESTDEVID', camera.sub_cam_topic)
 
@@ -196,3 +199,304 @@ class TestRemoteControl(object):
             client._Client__func = None
             client._Client__args = ()
             eq_(None, client._Client__on_message(msg))
+
+class TestTopicTrie(object):
+    @staticmethod
+    def test_match():
+        from ricohapi.cameractl.mqtt_client import TopicTrie
+        trie = TopicTrie()
+        filters = ['user01/camera/DEV01', 'user01/camera/+', 'user01/#', '+/camera/DEV02',
+                   '#', 'user01/camera/DEV01/#', '$SYS/#']
+        for topic_filter in filters:
+            trie.insert(topic_filter, topic_filter)
+        eq_(len(filters), len(trie))
+
+        eq_(sorted(['user01/camera/DEV01', 'user01/camera/+', 'user01/#', '#',
+                    'user01/camera/DEV01/#']), sorted(trie.match('user01/camera/DEV01')))
+        eq_(sorted(['user01/camera/+', 'user01/#', '+/camera/DEV02', '#']),
+            sorted(trie.match('user01/camera/DEV02')))
+        eq_(sorted(['user01/#', '#']), sorted(trie.match('user01')))
+        eq_(['#'], trie.match('user02/camera/DEV01'))
+        eq_(['$SYS/#'], trie.match('$SYS/broker/load'))
+
+        trie.remove('#')
+        trie.remove('user01/camera/DEV01/#')
+        eq_(len(filters) - 2, len(trie))
+        eq_([], trie.match('user02/camera/DEV01'))
+        eq_(sorted(['user01/camera/DEV01', 'user01/camera/+', 'user01/#']),
+            sorted(trie.match('user01/camera/DEV01')))
+        assert_raises(KeyError, trie.remove, 'user01/camera')
+        assert_raises(KeyError, trie.remove, 'user03')
+
+    @staticmethod
+    def test_filter_assert():
+        from ricohapi.cameractl.mqtt_client import TopicTrie
+        trie = TopicTrie()
+        for topic_filter in ['user01/#/DEV01', 'user01/camera#', 'user01/+DEV']:
+            assert_raises(ValueError, trie.insert, topic_filter, None)
+
+    @staticmethod
+    def test_subscriptions():
+        from ricohapi.cameractl.mqtt_client import TopicTrie
+        received = []
+        def on_receive(msg, name):
+            received.append((msg.topic, name))
+
+        with MQTTClient(None, None) as client:
+            client._MQTTClient__mqtt = FakeMQTT()
+            client._MQTTClient__connected = True
+            client._MQTTClient__uid = 'user01'
+            client.subscribe('camera/DEV01', func=on_receive, fargs=('dev01',))
+            client.subscribe('camera/+', func=on_receive, fargs=('all',))
+            client.subscribe('camera/+', func=on_receive, fargs=('twice',))
+
+            message = namedtuple('message', ['topic', 'payload'])
+            client._MQTTClient__on_message(None, None, message('user01/camera/DEV01', b''))
+            client._MQTTClient__on_message(None, None, message('user01/camera/DEV02', b''))
+            eq_(sorted([('user01/camera/DEV01', 'dev01'), ('user01/camera/DEV01', 'all'),
+                        ('user01/camera/DEV02', 'all')]), sorted(received))
+
+            client.unsubscribe('camera/DEV01')
+            eq_(True, client._MQTTClient__listening)
+            client.unsubscribe()
+            eq_(False, client._MQTTClient__listening)
+            eq_(0, len(client._MQTTClient__subscriptions))
+            assert isinstance(client._MQTTClient__subscriptions, TopicTrie)
+
+    @staticmethod
+    def test_listen_devices():
+        received = []
+        with Client(None, None) as camera:
+            camera._MQTTClient__mqtt = FakeMQTT()
+            camera._MQTTClient__connected = True
+            camera._MQTTClient__uid = 'user01'
+            assert_raises(ValueError, camera.listen, ['DEV01', 'DEV%'])
+            assert_raises(ValueError, camera.listen, [])
+            camera.listen(['DEV01', 'DEV02'], func=lambda *args: received.append(args))
+            eq_([('user01/camera/DEV01', 1), ('user01/camera/DEV02', 1)],
+                camera._MQTTClient__mqtt.subscribed)
+            eq_(['camera/DEV01', 'camera/DEV02'], camera.sub_cam_topics)
+            eq_('camera/DEV01', camera.sub_cam_topic)
+
+            message = namedtuple('message', ['topic', 'payload'])
+            on_message = camera._MQTTClient__on_message #pylint: disable=no-member
+            for topic in ['user01/camera/DEV02', 'user01/camera/DEV01']:
+                on_message(None, None, message(topic, b'\x81\xa1c\xa5shoot'))
+            eq_([('DEV02', 'shoot', None), ('DEV01', 'shoot', None)], received)
+
+
+class TestConnectionProfile(object):
+    @staticmethod
+    def test_defaults():
+        from ricohapi.cameractl.mqtt_client import ConnectionProfile
+        profile = ConnectionProfile()
+        eq_(60, profile.keepalive)
+        eq_(1, profile.publish_qos)
+        eq_(True, profile.clean_session)
+        eq_(True, profile.tls)
+        eq_(0, ConnectionProfile(publish_qos=0).publish_qos)
+
+    @staticmethod
+    def test_qos_assert():
+        from ricohapi.cameractl.mqtt_client import ConnectionProfile
+        assert_raises(ValueError, ConnectionProfile, publish_qos=2)
+        assert_raises(ValueError, ConnectionProfile, subscribe_qos=2)
+
+    @staticmethod
+    def test_publish_qos():
+        from ricohapi.cameractl.mqtt_client import ConnectionProfile
+        fake = FakeMQTT()
+        with MQTTClient(None, None) as client:
+            client._MQTTClient__mqtt = fake
+            client._MQTTClient__connected = True
+            client._MQTTClient__uid = 'user01'
+            client._MQTTClient__profile = ConnectionProfile(publish_qos=0)
+            client.publish('camera/DEV01', b'')
+            eq_([('user01/camera/DEV01', 0)], [(item.topic, item.qos) for item in fake.published])
+            client._MQTTClient__mqtt = None
+
+    @staticmethod
+    def test_publish_refused():
+        import paho.mqtt.client as mqtt
+        from ricohapi.cameractl.mqtt_client import ConnectionProfile
+        fake = FakeMQTT()
+        with MQTTClient(None, None) as client:
+            client._MQTTClient__mqtt = fake
+            client._MQTTClient__connected = True
+            client._MQTTClient__uid = 'user01'
+            client._MQTTClient__profile = ConnectionProfile(max_queued=1)
+            client.publish('camera/DEV01', b'')
+            fake.result_code = mqtt.MQTT_ERR_QUEUE_SIZE
+            assert_raises(MQTTClientError, client.publish, 'camera/DEV01', b'')
+
+            fake.result_code = mqtt.MQTT_ERR_NO_CONN
+            client.publish('camera/DEV01', b'')
+            client._MQTTClient__profile = ConnectionProfile(publish_qos=0)
+            assert_raises(MQTTClientError, client.publish, 'camera/DEV01', b'')
+            eq_(2, client.stats.published)
+            client._MQTTClient__mqtt = None
+
+    @staticmethod
+    def test_session_id_assert():
+        from ricohapi.cameractl.mqtt_client import ConnectionProfile
+        with MQTTClient(None, None) as client:
+            assert_raises(ValueError, client.connect, 'user01', None, None,
+                          profile=ConnectionProfile(clean_session=False))
+
+    @staticmethod
+    def test_resumed_session():
+        from ricohapi.cameractl.mqtt_client import ConnectionProfile
+        received = []
+        def on_receive(msg):
+            received.append(msg.payload)
+
+        with MQTTClient(None, None) as client:
+            fake = FakeMQTT()
+            client._MQTTClient__mqtt = fake
+            client._MQTTClient__connected = True
+            client._MQTTClient__uid = 'user01'
+            client._MQTTClient__profile = ConnectionProfile(clean_session=False)
+            client._MQTTClient__on_connect(None, None, {'session present': 1}, 0)
+            eq_(True, client.session_present)
+
+            message = namedtuple('message', ['topic', 'payload'])
+            client._MQTTClient__on_message(None, None, message('user01/camera/DEV01', b'1'))
+            client._MQTTClient__on_message(None, None, message('user01/camera/DEV02', b'2'))
+            eq_([], received)
+
+            client.subscribe('camera/DEV01', func=on_receive)
+            client.subscribe('pong/DEV01', func=on_receive)
+            eq_(['user01/camera/DEV01', 'user01/pong/DEV01'],
+                [topic for topic, _ in fake.subscribed])
+            eq_([b'1'], received)
+            eq_(1, len(client._MQTTClient__pending))
+            client._MQTTClient__mqtt = None
+
+
+class ThreadedMQTT(FakeMQTT):
+    def __init__(self):
+        super(ThreadedMQTT, self).__init__()
+        self.inside = 0
+        self.overlapped = 0
+
+    def publish(self, topic, msg, qos, retain):
+        self.inside += 1
+        if self.inside > 1:
+            self.overlapped += 1
+        time.sleep(0)
+        result = super(ThreadedMQTT, self).publish(topic, msg, qos, retain)
+        self.inside -= 1
+        return result
+
+
+class TestConcurrency(object):
+    def __init__(self):
+        self.interval = None
+
+    def setup(self):
+        # switch threads often to expose races.
+        if hasattr(sys, 'setswitchinterval'):
+            self.interval = sys.getswitchinterval()
+            sys.setswitchinterval(1e-6)
+
+    def teardown(self):
+        if self.interval is not None:
+            sys.setswitchinterval(self.interval)
+
+    @staticmethod
+    def run_threads(targets):
+        errors = []
+        def run(target):
+            try:
+                target()
+            except Exception as err: #pylint: disable=broad-except
+                errors.append(err)
+        threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        eq_([], errors)
+
+    def test_shoot_and_listen(self):
+        client = Client(None, None)
+        fake = ThreadedMQTT()
+        client._MQTTClient__mqtt = fake
+        client._MQTTClient__connected = True
+        client._MQTTClient__uid = 'user01'
+        received = []
+        listened = []
+        message = namedtuple('message', ['topic', 'payload'])
+        payload = client.codec.encode({'c': 'shoot', 't': 0})
+
+        def shoot(index):
+            return lambda: [client.shoot('DEV{0:02d}'.format((index + i) % 4))
+                            for i in range(200)]
+
+        def listen():
+            for _ in range(50):
+                try:
+                    client.listen('DEV00', func=lambda *args: received.append(args))
+                except ClientError:
+                    continue
+                listened.append(1)
+                client.unlisten()
+
+        on_message = client._MQTTClient__on_message #pylint: disable=no-member
+
+        def churn(index):
+            def run():
+                for i in range(100):
+                    topic = 'status/DEV{0:02d}{1:03d}'.format(index, i)
+                    client.subscribe(topic)
+                    on_message(None, None, message('user01/camera/DEV00', payload))
+                    client.unsubscribe(topic)
+            return run
+
+        self.run_threads([shoot(i) for i in range(16)] + [listen] * 4 +
+                         [churn(i) for i in range(4)])
+
+        eq_(16 * 200, len(fake.published))
+        eq_(16 * 200, client.stats.published)
+        eq_(0, fake.overlapped)
+        eq_(4 * 200, [item.topic for item in fake.published].count('user01/camera/DEV00'))
+        assert listened
+        eq_(set(), client._MQTTClient__sub_topics) #pylint: disable=no-member
+        eq_(0, len(client._MQTTClient__subscriptions)) #pylint: disable=no-member
+        eq_(None, client.sub_cam_topic)
+        client.listen('DEV01')
+        eq_('camera/DEV01', client.sub_cam_topic)
+        client._MQTTClient__mqtt = None
+
+    def test_publish_errors(self):
+        client = MQTTClient(None, None)
+        fake = ThreadedMQTT()
+        publish = fake.publish
+        def failing_publish(topic, msg, qos, retain):
+            if topic.endswith('NG'):
+                raise ValueError(topic)
+            return publish(topic, msg, qos, retain)
+        fake.publish = failing_publish
+        client._MQTTClient__mqtt = fake
+        client._MQTTClient__connected = True
+        client._MQTTClient__uid = 'user01'
+
+        failed = []
+        def send(index):
+            def run():
+                for i in range(100):
+                    topic = 'camera/DEV{0:02d}{1}'.format(index, 'NG' if i % 10 == 0 else '')
+                    try:
+                        client.publish(topic, b'')
+                    except ValueError as err:
+                        failed.append((index, str(err)))
+            return run
+
+        self.run_threads([send(i) for i in range(8)])
+
+        eq_(8 * 90, len(fake.published))
+        eq_(8 * 90, client.stats.published)
+        eq_(sorted([(i, 'user01/camera/DEV{0:02d}NG'.format(i)) for i in range(8)] * 10),
+            sorted(failed))
+        eq_(0, len(client._MQTTClient__outbox))
+        client._MQTTClient__mqtt = None
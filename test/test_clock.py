@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+#pylint: disable=protected-access
+"""
+Smoke test for clock synchronization and scheduled firing.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+import time
+from collections import namedtuple
+from nose.tools import (assert_raises, eq_)
+from ricohapi.cameractl.client import ClientError
+from ricohapi.cameractl.clock import ClockEstimate, Scheduler, estimate_clock
+from ricohapi.cameractl.codec import decode_payload
+from helpers import FakeMQTT, fake_client
+
+
+class PingMQTT(FakeMQTT):
+    """Acknowledges the subscriptions after ``delay`` seconds,
+       and answers the pings sent after that from a device 5 sec ahead.
+    """
+    def __init__(self, camera, delay):
+        super(PingMQTT, self).__init__()
+        self.camera = camera
+        self.delay = delay
+        self.acknowledged = False
+
+    def subscribe(self, topic):
+        result = super(PingMQTT, self).subscribe(topic)
+        if self.delay is not None:
+            threading.Timer(self.delay, self.acknowledge, (result[1],)).start()
+        return result
+
+    def acknowledge(self, mid):
+        self.acknowledged = True
+        self.camera._MQTTClient__on_subscribe(None, None, mid, (1,))
+
+    def publish(self, topic, msg, qos, retain):
+        result = super(PingMQTT, self).publish(topic, msg, qos, retain)
+        ping = decode_payload(msg)
+        if ping['c'] == 'ping' and self.acknowledged:
+            message = namedtuple('message', ['topic', 'payload'])
+            pong = {'c': 'pong', 't': 0, 'i': ping['i'], 'r': ping['s'] + 5.0, 'x': ping['s'] + 5.0}
+            self.camera._MQTTClient__on_message(
+                None, None, message('user01/pong/DEV01', self.camera.codec.encode(pong)))
+        return result
+
+
+class TestClock(object):
+    @staticmethod
+    def test_estimate_clock():
+        # the device is 5 sec ahead, 10 ms each way, except a sample queued for 100 ms.
+        samples = [(100.0, 105.110, 105.111, 100.121),
+                   (101.0, 106.010, 106.011, 101.021)]
+        estimate = estimate_clock(samples)
+        eq_(2, estimate.samples)
+        assert abs(estimate.offset - 5.0) < 1e-6
+        assert abs(estimate.latency - 0.010) < 1e-6
+        assert abs(estimate.to_remote(200.0) - 205.0) < 1e-6
+        assert_raises(ValueError, estimate_clock, [])
+
+    @staticmethod
+    def test_scheduler():
+        fired = []
+        done = threading.Event()
+        def fire(name):
+            fired.append((name, time.time()))
+            if len(fired) == 3:
+                done.set()
+
+        scheduler = Scheduler()
+        now = time.time()
+        scheduler.schedule(now + 0.10, fire, ('second',))
+        scheduler.schedule(now + 0.05, fire, ('first',))
+        scheduler.schedule(now - 1.00, fire, ('late',))
+        scheduler.schedule(now + 60.0, fire, ('never',))
+        assert done.wait(5.0)
+        eq_(['late', 'first', 'second'], [name for name, _ in fired])
+        assert abs(fired[1][1] - (now + 0.05)) < 0.02
+        assert abs(fired[2][1] - (now + 0.10)) < 0.02
+
+        eq_(1, len(scheduler))
+        scheduler.stop()
+        eq_(0, len(scheduler))
+        assert_raises(ValueError, scheduler.schedule, now, fire)
+
+    @staticmethod
+    def test_sync_clock():
+        camera = fake_client()
+        fake = camera._MQTTClient__mqtt = PingMQTT(camera, 0.05)
+        sub_topics = camera._MQTTClient__sub_topics #pylint: disable=no-member
+        # the first ping waits for the subscription, and is answered.
+        estimate = camera.sync_clock('DEV01', count=3, timeout=1.0)
+        eq_(3, estimate.samples)
+        assert abs(estimate.offset - 5.0) < 0.01
+        eq_(set(), sub_topics)
+
+        fake.acknowledged = False
+        fake.delay = None
+        assert_raises(ClientError, camera.sync_clock, 'DEV01', timeout=0.05)
+        eq_(set(), sub_topics)
+        eq_(3, len(fake.published))
+        camera._MQTTClient__mqtt = None
+
+
+class TestScheduledShoot(object):
+    @staticmethod
+    def test_fire_at():
+        camera = fake_client()
+        camera.shoot('DEV01', fire_at=100.0)
+        camera.clock_estimates['DEV01'] = ClockEstimate(-2.5, 0.01, 5)
+        camera.shoot('DEV01', fire_at=100.0)
+        camera.shoot('DEV01')
+        payloads = [decode_payload(item.payload) for item in camera._MQTTClient__mqtt.published]
+        eq_([100.0, 97.5, None], [payload.get('f') for payload in payloads])
+
+    @staticmethod
+    def test_receive():
+        received = []
+        done = threading.Event()
+        def on_receive(devid, cmd, rcv_param, name):
+            received.append((devid, cmd, rcv_param, name, time.time()))
+            done.set()
+
+        camera = fake_client()
+        fake = camera._MQTTClient__mqtt
+        camera._Client__sub_dev_ids = ('DEV01',)
+        camera._Client__func = on_receive
+        camera._Client__args = ('arg',)
+        message = namedtuple('message', ['topic', 'payload'])
+        topic = 'user01/camera/DEV01'
+
+        camera._Client__on_message(message(topic, camera.codec.encode(
+            {'c': 'ping', 't': 0, 'i': 3, 's': 10.0})))
+        eq_([], received)
+        eq_('user01/pong/DEV01', fake.published[0].topic)
+        pong = decode_payload(fake.published[0].payload)
+        eq_(('pong', 3), (pong['c'], pong['i']))
+        assert pong['r'] <= pong['x']
+
+        fire_at = time.time() + 0.05
+        camera._Client__on_message(message(topic, camera.codec.encode(
+            {'c': 'shoot', 't': 0, 'p': {'_iso': 100}, 'f': fire_at})))
+        eq_([], received)
+        assert done.wait(5.0)
+        eq_(('DEV01', 'shoot', {'_iso': 100}, 'arg'), received[0][:4])
+        assert abs(received[0][4] - fire_at) < 0.02
+        camera._MQTTClient__mqtt = None
+        camera.disconnect()
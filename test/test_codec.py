@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+"""
+Smoke test for payload codecs.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from nose.tools import (assert_raises, eq_)
+from ricohapi.cameractl.codec import (CompactCodec, MsgpackCodec, decode_payload)
+
+
+class TestCodec(object):
+    @staticmethod
+    def test_msgpack():
+        import msgpack   #pylint: disable=import-error
+        payload = {'c': 'shoot', 't': 1478000000, 'p': {'_iso': 100, '_name': 'DEV01'}}
+        eq_(payload, decode_payload(MsgpackCodec().encode(payload)))
+        legacy = msgpack.packb(payload, use_bin_type=True)
+        eq_(payload, decode_payload(bytearray(legacy)))
+
+    @staticmethod
+    def test_compact():
+        payload = {'c': 'shoot', 't': 1478000000, 'p': {'_iso': 100, '_shutterSpeed': 0.01}}
+        encoded = CompactCodec().encode(payload)
+        eq_(CompactCodec.version, bytearray(encoded)[0])
+        eq_(1, bytearray(encoded)[1])
+        assert len(encoded) < len(MsgpackCodec().encode(payload))
+        eq_(payload, decode_payload(bytearray(encoded)))
+
+        eq_({'c': 'shoot', 't': 0}, decode_payload(CompactCodec().encode({'c': 'shoot'})))
+
+        payload = {'c': 'focus', 't': 1.5, 'x': [1, 2]}
+        eq_(payload, decode_payload(CompactCodec().encode(payload)))
+
+    @staticmethod
+    def test_compression():
+        payload = {'c': 'shoot', 't': 1478000000, 'p': {'_note': 'abc' * 1000}}
+        encoded = CompactCodec(compression='zlib').encode(payload)
+        assert len(encoded) < 200
+        eq_(payload, decode_payload(encoded))
+
+        small = {'c': 'shoot', 't': 1478000000}
+        eq_(CompactCodec().encode(small), CompactCodec(compression='zlib').encode(small))
+
+        assert_raises(ValueError, CompactCodec, compression='lzma')
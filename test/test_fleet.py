@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+#pylint: disable=protected-access
+"""
+Smoke test for the fleet status reported by heartbeats.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+from collections import namedtuple
+from nose.tools import eq_
+from ricohapi.cameractl.client import CamTopic
+from ricohapi.cameractl.codec import CompactCodec
+from ricohapi.cameractl.fleet import DeviceStatus, FleetState, Heartbeat
+from helpers import fake_client
+
+
+class TestFleetState(object):
+    @staticmethod
+    def test_report():
+        sender = fake_client(codec=CompactCodec())
+        sender.report_status('DEV01', battery=0.8, free_storage=1000, busy=False)
+        sender.report_status('DEV02', battery=0.3, busy=True)
+        sender.clear_status('DEV02')
+        published = sender._MQTTClient__mqtt.published
+        eq_(['user01/status/DEV01', 'user01/status/DEV02', 'user01/status/DEV02'],
+            [item.topic for item in published])
+        eq_([True, True, True], [item.retain for item in published])
+        eq_(b'', published[2].payload)
+        eq_('DEV01', CamTopic.search_dev_id('user01/status/DEV01', 'status'))
+
+        camera = fake_client()
+        fleet = FleetState(camera)
+        fleet.start()
+        eq_([('user01/status/+', 1)], camera._MQTTClient__mqtt.subscribed)
+        message = namedtuple('message', ['topic', 'payload'])
+        on_message = camera._MQTTClient__on_message #pylint: disable=no-member
+        for item in published[:2]:
+            on_message(None, None, message(item.topic, item.payload))
+
+        eq_(2, len(fleet))
+        status = fleet.get('DEV01')
+        eq_(('DEV01', 0.8, 1000, False), status[:4])
+        assert status.reported_at <= status.received_at
+        eq_(['DEV01'], [status.device_id for status in fleet.idle()])
+
+        on_message(None, None, message(*published[2][:2]))
+        assert 'DEV02' not in fleet
+        assert fleet.wait(1, timeout=0.01)
+        assert not fleet.wait(2, timeout=0.01)
+        fleet.stop()
+        eq_(set(), camera._MQTTClient__sub_topics) #pylint: disable=no-member
+
+    @staticmethod
+    def test_table():
+        fleet = FleetState(None, stale_after=60.0)
+        fleet.update(DeviceStatus('DEV01', 0.5, None, False, 1000.0, 1000.0))
+        fleet.update(DeviceStatus('DEV02', 0.9, None, False, 1000.0, 1000.0))
+        fleet.update(DeviceStatus('DEV03', 1.0, None, True, 1000.0, 1000.0))
+        fleet.update(DeviceStatus('DEV04', None, None, False, 900.0, 1000.0))
+        fleet.update(DeviceStatus('DEV01', 0.1, None, True, 990.0, 1001.0))
+
+        eq_(0.5, fleet.get('DEV01').battery)
+        eq_(['DEV02', 'DEV01'], [status.device_id for status in fleet.idle(now=1010.0)])
+        eq_(['DEV02'], [status.device_id for status in fleet.idle(0.8, now=1010.0)])
+        eq_(['DEV04'], [status.device_id for status in fleet.stale(now=1010.0)])
+        eq_(4, len(fleet.stale(now=1100.0)))
+        fleet.remove('DEV04')
+        eq_(3, len(fleet))
+
+    @staticmethod
+    def test_heartbeat():
+        camera = fake_client()
+        reported = threading.Event()
+        def probe():
+            if len(camera._MQTTClient__mqtt.published) >= 2:
+                reported.set()
+                raise IOError('camera is not found.')
+            return {'battery': 0.7, 'busy': False}
+
+        beat = Heartbeat(camera, 'DEV01', probe, interval=0.01)
+        assert reported.wait(5.0)
+        beat.stop(clear=True)
+        published = camera._MQTTClient__mqtt.published
+        eq_(3, len(published))
+        eq_(b'', published[-1].payload)
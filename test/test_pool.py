@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+#pylint: disable=protected-access
+"""
+Smoke test for the connection pool.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from nose.tools import (assert_raises, eq_)
+from ricohapi.cameractl.client import ClientError
+from ricohapi.cameractl.codec import decode_payload
+from ricohapi.cameractl.pool import ClientPool
+from ricohapi.cameractl.trace import Tracer
+from helpers import FakeMQTT
+
+
+class TestClientPool(object):
+    @staticmethod
+    def test_route():
+        pool = ClientPool(None, None, size=4)
+        eq_(4, len(pool.clients))
+        for i in range(100):
+            device_id = 'DEV%03d' % i
+            eq_(pool.client(device_id), pool.client(device_id))
+        eq_(4, len(set(pool.client('DEV%03d' % i) for i in range(100))))
+        assert_raises(ValueError, pool.client, None)
+        assert_raises(ValueError, ClientPool, None, None, size=0)
+
+    @staticmethod
+    def test_shoot():
+        pool = ClientPool(None, None, size=2)
+        assert_raises(ClientError, pool.shoot, 'DEV01')
+
+        for client in pool.clients:
+            client._MQTTClient__mqtt = FakeMQTT()
+            client._MQTTClient__connected = True
+            client._MQTTClient__uid = 'user01'
+        pool._ClientPool__connected_at = 1.0
+
+        for i in range(10):
+            pool.shoot('DEV%02d' % i, param={'_iso': 100})
+        pool.clients[0]._MQTTClient__on_publish(None, None, 1)
+
+        stats = pool.stats
+        eq_(10, stats.published)
+        eq_(1, stats.acknowledged)
+        eq_(9, stats.in_flight)
+        assert stats.publish_rate > 0
+        for client in pool.clients:
+            for item in client._MQTTClient__mqtt.published:
+                eq_(client, pool.client(item.topic.rsplit('/', 1)[1]))
+
+    @staticmethod
+    def test_stats_refused():
+        import paho.mqtt.client as mqtt
+        pool = ClientPool(None, None, size=2)
+        for client in pool.clients:
+            client._MQTTClient__mqtt = FakeMQTT()
+            client._MQTTClient__connected = True
+            client._MQTTClient__uid = 'user01'
+        pool._ClientPool__connected_at = 1.0
+
+        for i in range(10):
+            pool.shoot('DEV%02d' % i)
+        for client in pool.clients:
+            client._MQTTClient__mqtt.result_code = mqtt.MQTT_ERR_QUEUE_SIZE
+        for i in range(10):
+            assert_raises(ClientError, pool.shoot, 'DEV%02d' % i)
+        for client in pool.clients:
+            for _ in client._MQTTClient__mqtt.published:
+                client._MQTTClient__on_publish(None, None, 1)
+        eq_((10, 10, 0), pool.stats[:3])
+
+    @staticmethod
+    def test_shoot_options():
+        tracer = Tracer()
+        pool = ClientPool(None, None, size=2, tracer=tracer)
+        for client in pool.clients:
+            client._MQTTClient__mqtt = FakeMQTT()
+            client._MQTTClient__connected = True
+            client._MQTTClient__uid = 'user01'
+        pool._ClientPool__connected_at = 1.0
+
+        pool.shoot('DEV01', fire_at=100.0, trace_id='abc')
+        payload = decode_payload(pool.client('DEV01')._MQTTClient__mqtt.published[0].payload)
+        eq_((100.0, 'abc'), (payload['f'], payload['tr']))
+        eq_([('abc', 'publish')], [(span.trace_id, span.name) for span in tracer.spans()])
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+#pylint: disable=protected-access
+"""
+Smoke test for the profiling of a listener.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os
+import pstats
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from nose.tools import assert_raises, eq_
+from ricohapi.cameractl.client import Client
+from ricohapi.cameractl.codec import CompactCodec
+from ricohapi.cameractl.profiling import Profiler, Sampler
+from helpers import fake_client
+
+
+def busy_loop(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def wait_for(path, timeout=5.0):
+    end = time.time() + timeout
+    while not os.path.exists(path) and time.time() < end:
+        time.sleep(0.01)
+    return os.path.exists(path)
+
+
+class TestProfiler(object):
+
+    def __init__(self):
+        self.directory = None
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def test_timing():
+        profiler = Profiler()
+        eq_(3, profiler.call('add', lambda a, b: a + b, (1, 2)))
+        assert_raises(TypeError, profiler.call, 'fail', busy_loop, (None,))
+        profiler.call('add', busy_loop, (0.02,))
+
+        stats = dict((stats.name, stats) for stats in profiler.stats())
+        eq_(2, stats['add'].calls)
+        assert stats['add'].max_wall >= 0.02
+        assert stats['add'].cpu > 0.0
+        eq_(stats['add'].wall / 2, stats['add'].mean_wall)
+        eq_(1, stats['fail'].calls)
+        eq_('add', profiler.stats()[0].name)
+        profiler.reset()
+        eq_([], profiler.stats())
+
+    @staticmethod
+    def test_sampler():
+        sampler = Sampler(0.001)
+        worker = threading.Thread(target=busy_loop, args=(0.2,), name='busy-worker')
+        sampler.start()
+        worker.start()
+        worker.join()
+        sampler.stop()
+        assert sampler.samples > 0
+        assert any(line.startswith('busy-worker;') and 'busy_loop' in line
+                   for line in sampler.collapsed())
+
+    def test_capture(self):
+        profiler = Profiler(self.directory, interval=0.001)
+        path = profiler.capture(0.1, 'sample')
+        eq_(None, profiler.capture(0.1))
+        profiler.call('busy', busy_loop, (0.05,))
+        assert wait_for(path)
+        assert wait_for(os.path.splitext(path)[0] + '.callbacks.json')
+        assert not profiler.capturing
+        with open(os.path.splitext(path)[0] + '.callbacks.json') as fptr:
+            eq_(['busy'], [stats['name'] for stats in json.load(fptr)['callbacks']])
+
+        path = profiler.capture(60.0, 'cprofile')
+        assert path.endswith('.prof')
+        profiler.call('busy', busy_loop, (0.01,))
+        eq_(path, profiler.stop())
+        functions = [function for _, _, function in pstats.Stats(path).stats]
+        assert 'busy_loop' in functions
+        eq_(None, profiler.stop())
+        assert_raises(ValueError, profiler.capture, 1.0, 'perf')
+
+    def test_signal(self):
+        if not hasattr(signal, 'SIGUSR1'):
+            return
+        profiler = Profiler(self.directory)
+        previous = signal.getsignal(signal.SIGUSR1)
+        try:
+            profiler.install_signal(seconds=0.05)
+            os.kill(os.getpid(), signal.SIGUSR1)
+            end = time.time() + 5.0
+            while not any(name.endswith('.txt') for name in os.listdir(self.directory)):
+                assert time.time() < end
+                time.sleep(0.01)
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+
+    def test_client(self):
+        sender = fake_client(codec=CompactCodec())
+        sender.shoot('DEV01')
+        sender.request_profile('DEV01', seconds=60.0, mode='cprofile')
+        assert_raises(ValueError, sender.request_profile, 'DEV01', mode='perf')
+
+        def on_receive(devid, cmd, rcv_param, received):
+            received.append((devid, cmd, rcv_param))
+        received = []
+        profiler = Profiler(self.directory)
+        camera = Client(None, None, profiler=profiler)
+        camera._Client__func = on_receive
+        camera._Client__args = (received,)
+        message = namedtuple('message', ['topic', 'payload'])
+        published = sender._MQTTClient__mqtt.published
+        for item in published[::-1]:
+            camera._Client__on_message(message(item.topic, item.payload))
+
+        eq_([('DEV01', 'shoot', None)], received)
+        assert profiler.capturing
+        path = profiler.stop()
+        assert path.endswith('.prof')
+        assert 'on_receive' in [function for _, _, function in pstats.Stats(path).stats]
+        eq_(['on_receive:shoot'], [stats.name for stats in profiler.stats()])
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+#pylint: disable=protected-access
+"""
+Smoke test for the recording and replay of received messages.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from nose.tools import assert_raises, eq_
+from ricohapi.cameractl.client import Client
+from ricohapi.cameractl.codec import CompactCodec
+from ricohapi.cameractl.recording import (MAGIC, Record, Recorder, merge_records,
+                                          read_records, record_path, replay)
+from helpers import fake_client
+
+
+class TestRecording(object):
+
+    def __init__(self):
+        self.directory = None
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_log(self):
+        path = os.path.join(self.directory, 'traffic.log')
+        with Recorder(path) as recorder:
+            recorder.record('user01/camera/DEV01', b'\x01\x01\x00', 1000.0)
+            recorder.record('user01/camera/DEV02', bytearray(b'\x81\xa1c'), 1000.5)
+        with Recorder(path, max_bytes=os.path.getsize(path) + 40) as recorder:
+            recorder.record('user01/camera/DEV01', b'', 1001.0)
+            recorder.record('user01/camera/DEV01', b'', 1002.0)
+            eq_((1, 1), (recorder.records, recorder.dropped))
+        eq_(len(MAGIC) + 3 * 14 + 3 * 19 + 3 + 3, os.path.getsize(path))
+
+        records = list(read_records(path))
+        eq_([Record(1000.0, 'user01/camera/DEV01', b'\x01\x01\x00'),
+             Record(1000.5, 'user01/camera/DEV02', b'\x81\xa1c'),
+             Record(1001.0, 'user01/camera/DEV01', b'')], records)
+
+        with open(path, 'ab') as fptr:
+            fptr.write(b'\x00' * 10)
+        eq_(3, len(list(read_records(path))))
+
+        with Recorder(path) as recorder:
+            recorder.record('user01/camera/DEV01', b'A', 1001.5)
+        eq_(4, len(list(read_records(path))))
+        with open(path, 'r+b') as fptr:
+            fptr.truncate(os.path.getsize(path) - 5)
+        with Recorder(path) as recorder:
+            recorder.record('user01/camera/DEV01', b'B', 1001.6)
+            recorder.record('user01/camera/DEV01', b'C', 1001.7)
+        eq_([b'\x01\x01\x00', b'\x81\xa1c', b'', b'B', b'C'],
+            [record.payload for record in read_records(path)])
+
+        other = record_path(path, 123)
+        eq_(path + '.123', other)
+        with Recorder(other) as recorder:
+            recorder.record('user01/camera/DEV03', b'', 1000.2)
+        eq_([1000.0, 1000.2, 1000.5, 1001.0, 1001.6, 1001.7],
+            [record.received for record in merge_records([path, other])])
+
+        with open(other, 'wb') as fptr:
+            fptr.write(b'PK\x03\x04')
+        assert_raises(ValueError, Recorder, other)
+        assert_raises(ValueError, list, read_records(other))
+
+    def test_client(self):
+        path = os.path.join(self.directory, 'traffic.log')
+        sender = fake_client(codec=CompactCodec())
+        sender.shoot('DEV01', param={'_iso': 100})
+
+        received = []
+        camera = Client(None, None, recorder=Recorder(path))
+        camera._Client__func = lambda devid, cmd, par: received.append((devid, cmd, par))
+        message = namedtuple('message', ['topic', 'payload'])
+        topic, payload = sender._MQTTClient__mqtt.published[0][:2]
+        camera._Client__on_message(message(topic, bytearray(payload)))
+        camera.recorder.close()
+
+        eq_([('DEV01', 'shoot', {'_iso': 100})], received)
+        record, = read_records(path)
+        eq_(('user01/camera/DEV01', payload), record[1:])
+        assert abs(record.received - time.time()) < 5.0
+
+    @staticmethod
+    def test_replay():
+        records = [Record(1000.0, 'user01/camera/DEV01', b'A'),
+                   Record(1000.2, 'user01/camera/DEV02', b'B'),
+                   Record(1000.5, 'user01/status/DEV01', b'C')]
+        client = fake_client('local')
+        stats = replay(client, records, speed=5.0)
+        published = client._MQTTClient__mqtt.published
+        eq_([('local/camera/DEV01', b'A'), ('local/camera/DEV02', b'B'),
+             ('local/status/DEV01', b'C')], [item[:2] for item in published])
+        eq_(3, stats.messages)
+        assert 0.09 <= published[-1].time - published[0].time < 0.5
+        assert stats.max_lag < 0.1
+
+        client = fake_client('local')
+        stats = replay(client, records, speed=0, device_id='DEVX')
+        eq_(['local/camera/DEVX', 'local/camera/DEVX', 'local/status/DEVX'],
+            [item[0] for item in client._MQTTClient__mqtt.published])
+        assert stats.elapsed < 0.1
+        eq_(0.0, stats.max_lag)
+        assert_raises(ValueError, replay, client, records, speed=-1)
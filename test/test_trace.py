@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016 Ricoh Co., Ltd. All Rights Reserved.
+# pylint: disable=C0302
+# pylint: disable=missing-docstring
+#pylint: disable=protected-access
+"""
+Smoke test for tracing a shot from the sender to the callback.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from nose.tools import (assert_raises, eq_)
+from ricohapi.cameractl.codec import CompactCodec, decode_payload
+from ricohapi.cameractl.trace import (Span, Tracer, activate, current_trace_id,
+                                      load_spans, new_trace_id, timeline)
+from helpers import fake_client
+
+
+class TestTracer(object):
+    def __init__(self):
+        self.tmp_dir = None
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def test_activate():
+        eq_(None, current_trace_id())
+        with activate('abc'):
+            eq_('abc', current_trace_id())
+            with activate('def'):
+                eq_('def', current_trace_id())
+            eq_('abc', current_trace_id())
+            seen = []
+            thread = threading.Thread(target=lambda: seen.append(current_trace_id()))
+            thread.start()
+            thread.join()
+            eq_([None], seen)
+        eq_(None, current_trace_id())
+        eq_(16, len(new_trace_id()))
+        assert new_trace_id() != new_trace_id()
+
+    @staticmethod
+    def test_span():
+        tracer = Tracer()
+        with tracer.span('untraced'):
+            pass
+        eq_([], tracer.spans())
+
+        with activate('abc'):
+            with tracer.span('outer', device='DEV01') as attrs:
+                attrs['bytes'] = 10
+                with assert_raises(ValueError):
+                    with tracer.span('inner'):
+                        raise ValueError('failed')
+        tracer.record('other', 1.0, 2.0, 'def')
+
+        spans = tracer.spans('abc')
+        eq_(['inner', 'outer'], [span.name for span in spans])
+        eq_({'error': 'failed'}, spans[0].attrs)
+        eq_({'device': 'DEV01', 'bytes': 10}, spans[1].attrs)
+        assert spans[1].start <= spans[0].start <= spans[0].end <= spans[1].end
+        eq_(3, len(tracer.spans()))
+
+    def test_json_lines(self):
+        path = os.path.join(self.tmp_dir, 'trace.jsonl')
+        with io.open(path, 'a') as sink:
+            tracer = Tracer(sink)
+            tracer.record('publish', 10.0, 10.002, 'abc', device='DEV01')
+            tracer.record('callback', 10.010, 10.5, 'abc')
+            tracer.record('publish', 11.0, 11.001, 'def')
+        eq_([], tracer.spans())
+
+        spans = load_spans(path, 'abc')
+        eq_(Span('abc', 'publish', 10.0, 10.002, {'device': 'DEV01'}), spans[0])
+        eq_(['publish', 'callback'], [span.name for span in spans])
+        eq_(3, len(load_spans(path)))
+
+        lines = timeline(reversed(spans))
+        eq_(2, len(lines))
+        eq_(['0.0', '2.0', 'ms', 'publish'], lines[0].split())
+        eq_(['10.0', '490.0', 'ms', 'callback'], lines[1].split())
+        eq_([], timeline([]))
+
+
+class TestTracedShoot(object):
+    @staticmethod
+    def test_send():
+        tracer = Tracer()
+        camera = fake_client(codec=CompactCodec(), tracer=tracer)
+        camera.shoot('DEV01', param={'_iso': 100}, trace_id='abc')
+        camera.shoot('DEV01')
+
+        traced, untraced = [decode_payload(item.payload) for item in
+                            camera._MQTTClient__mqtt.published]
+        eq_('abc', traced['tr'])
+        eq_({'_iso': 100}, traced['p'])
+        assert 'tr' not in untraced and 's' not in untraced
+        spans = tracer.spans()
+        eq_([('abc', 'publish')], [(span.trace_id, span.name) for span in spans])
+        eq_(traced['s'], spans[0].start)
+
+    @staticmethod
+    def test_receive():
+        received = []
+        done = threading.Event()
+        def on_receive(devid, cmd, rcv_param, name):
+            received.append((devid, cmd, rcv_param, name, current_trace_id()))
+            if len(received) == 3:
+                done.set()
+
+        sender = fake_client(tracer=Tracer())
+        tracer = Tracer()
+        camera = fake_client(tracer=tracer)
+        camera._Client__sub_dev_ids = ('DEV01',)
+        camera._Client__func = on_receive
+        camera._Client__args = ('arg',)
+
+        sender.shoot('DEV01', trace_id='abc')
+        sender.shoot('DEV01')
+        sender.shoot('DEV01', trace_id='def', fire_at=0.0)
+        message = namedtuple('message', ['topic', 'payload'])
+        for item in sender._MQTTClient__mqtt.published:
+            camera._Client__on_message(message(item.topic, item.payload))
+
+        assert done.wait(5.0)
+        eq_([('DEV01', 'shoot', None, 'arg', 'abc'), ('DEV01', 'shoot', None, 'arg', None),
+             ('DEV01', 'shoot', None, 'arg', 'def')], received)
+        for trace_id in ('abc', 'def'):
+            eq_(['deliver', 'queue', 'callback'],
+                [span.name for span in tracer.spans(trace_id)])
+        camera._MQTTClient__mqtt = None
+        camera.disconnect()